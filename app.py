@@ -1,10 +1,29 @@
-import json
+import functools
+import hashlib
+import mimetypes
 import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
 from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_from_directory
+from urllib.parse import quote
+import click
+from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file
 from dotenv import load_dotenv
+from werkzeug.http import is_resource_modified
+from werkzeug.wsgi import wrap_file
+from markupsafe import Markup
 import logging
-from werkzeug.security import generate_password_hash, check_password_hash
+from journal_store import PartitionedJournalStore, SQLiteJournalStore, atomic_write, file_lock
+from journal_search import JournalSearchIndex, JournalTagIndex
+from journal_stats import PERIODS, JournalRollups
+from journal_transfer import export_journal, import_journal
+from journal_fragments import FragmentCache
+from journal_versions import JournalVersions
+from user_store import SQLiteUserStore
+from password_hashing import HashingBusy, PasswordHasher
 
 # Load environment variables
 load_dotenv()
@@ -15,7 +34,8 @@ logger = logging.getLogger(__name__)
 
 # Import AWS integration (optional)
 try:
-    from aws_integration import AWSJournalBackup, DynamoDBJournalStore, check_aws_credentials
+    from aws_integration import (AWSJournalBackup, BackupWorker, CachedJournalStore, DynamoDBJournalStore,
+                                 ReadinessProbe, RestoreProgress, check_aws_credentials)
     aws_available = True
 except ImportError:
     logger.warning("AWS integration not available. Running without cloud backup.")
@@ -24,22 +44,63 @@ except ImportError:
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', os.urandom(24))
 PASSWORD = os.environ.get('PASSWORD', 'GVISIT')
-JOURNAL_FILE = "journal_entries.json"
+JOURNAL_FILE = os.environ.get('JOURNAL_FILE', 'journal_entries.json')
 PPTX_FOLDER = 'secure_powerpoints'
 PPTX_FILES = {'ppt1': 'presentation1.pptx', 'ppt2': 'presentation2.pptx'}
+# How downloads are sent: native, x-accel (nginx X-Accel-Redirect) or x-sendfile (Apache/lighttpd X-Sendfile)
+PPTX_SERVE_MODE = os.environ.get('PPTX_SERVE_MODE', 'native').lower()
+# Internal nginx location that maps onto PPTX_FOLDER in x-accel mode
+PPTX_ACCEL_PREFIX = os.environ.get('PPTX_ACCEL_PREFIX', '/protected-pptx/')
 USERS_FILE = "users.json"
+# Fold the append log back into the journal snapshot once it grows past this size
+JOURNAL_COMPACT_BYTES = int(os.environ.get('JOURNAL_COMPACT_BYTES', 1024 * 1024))
+# Entries rendered with /journal; older ones are fetched from /journal/entries on scroll
+JOURNAL_PAGE_SIZE = int(os.environ.get('JOURNAL_PAGE_SIZE', 20))
+SEARCH_INDEX_PATH = os.environ.get('SEARCH_INDEX_PATH', 'search_index.db')
+# How long a new entry waits for a starting restore to reserve the backup's entry IDs
+RESTORE_WRITE_WAIT = float(os.environ.get('RESTORE_WRITE_WAIT', 10))
+# Entries older than this many days move to memory-mapped archive segments on compaction (0 disables)
+JOURNAL_ARCHIVE_DAYS = int(os.environ.get('JOURNAL_ARCHIVE_DAYS', 0))
+# Users' journals each worker keeps parsed in memory, least recently used dropped first
+JOURNAL_CACHED_PARTITIONS = int(os.environ.get('JOURNAL_CACHED_PARTITIONS', 256))
+# Memory for rendered entry cards (0 disables), optionally also kept alongside the search index
+FRAGMENT_CACHE_BYTES = int(os.environ.get('FRAGMENT_CACHE_BYTES', 8 * 1024 * 1024))
+FRAGMENT_CACHE_PERSIST = os.environ.get('FRAGMENT_CACHE_PERSIST', 'false').lower() == 'true'
 
-# Initialize AWS services if available
+# Password hashing runs on a small process pool; logins beyond the queue depth get a fast 503
+password_hasher = PasswordHasher(
+    method=os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000'),
+    salt_length=int(os.environ.get('PASSWORD_SALT_LENGTH', 16)),
+    workers=int(os.environ.get('HASH_POOL_WORKERS', 2)),
+    max_pending=int(os.environ.get('HASH_QUEUE_DEPTH', 16)),
+    timeout=float(os.environ.get('HASH_TIMEOUT', 10))
+)
+
+# AWS services are configured here but connect lazily; nothing below touches the network
 aws_backup = None
+backup_worker = None
+restore_progress = None
+readiness = None
 dynamodb_store = None
+sqlite_store = None
 
-if aws_available and check_aws_credentials():
+if aws_available:
     # Initialize S3 backup if configured
     if os.environ.get('S3_BACKUP_BUCKET'):
         aws_backup = AWSJournalBackup(
             bucket_name=os.environ.get('S3_BACKUP_BUCKET'),
-            region=os.environ.get('AWS_REGION', 'us-east-1')
+            region=os.environ.get('AWS_REGION', 'us-east-1'),
+            # Every gunicorn worker runs its own backup worker; one at a time updates the manifest
+            lock_path=JOURNAL_FILE + '.backup.lock'
         )
+        # Uploads happen off the request path, one per burst of writes
+        backup_worker = BackupWorker(
+            aws_backup,
+            load_entries=lambda: get_journal_entries(),
+            debounce=float(os.environ.get('BACKUP_DEBOUNCE_SECONDS', 2)),
+            max_retries=int(os.environ.get('BACKUP_MAX_RETRIES', 5))
+        )
+        restore_progress = RestoreProgress()
         logger.info("AWS S3 backup initialized")
     
     # Initialize DynamoDB if configured
@@ -48,7 +109,29 @@ if aws_available and check_aws_credentials():
             table_name=os.environ.get('DYNAMODB_TABLE_NAME'),
             region=os.environ.get('AWS_REGION', 'us-east-1')
         )
+        # Repeat page views are served from memory; other workers' writes bump the shared
+        # journal version and show up at once, other nodes' within the TTL
+        cache_ttl = float(os.environ.get('DYNAMODB_CACHE_TTL', 30))
+        if cache_ttl > 0:
+            dynamodb_store = CachedJournalStore(dynamodb_store, ttl=cache_ttl,
+                                                max_users=int(os.environ.get('DYNAMODB_CACHE_USERS', 1000)),
+                                                generation=lambda username: get_journal_versions().get(username)[0])
         logger.info("DynamoDB storage initialized")
+    
+    # Credentials and resources are checked off the boot path, reported by /ready
+    checks = {}
+    if aws_backup or dynamodb_store:
+        checks['credentials'] = check_aws_credentials
+    if aws_backup:
+        checks['s3'] = aws_backup.probe
+    if dynamodb_store:
+        checks['dynamodb'] = dynamodb_store.probe
+    readiness = ReadinessProbe(checks)
+
+# Use SQLite instead of the JSON journal files if configured
+if os.environ.get('USE_SQLITE', 'false').lower() == 'true':
+    sqlite_store = SQLiteJournalStore(os.environ.get('SQLITE_DB_PATH', 'journal.db'))
+    logger.info("SQLite storage initialized")
 
 # Enhanced journal configuration
 JOURNAL_FOCUSES = [
@@ -92,17 +175,27 @@ TAG_CATEGORIES = {
     "other": {"color": "dark", "keywords": []}
 }
 
+# Every keyword in one pattern, ordered by category priority. The lookahead
+# reports a match at every position, so overlapping keywords are never missed.
+_TAG_KEYWORD_RANKS = {}
+for _rank, _config in enumerate(TAG_CATEGORIES.values()):
+    for _keyword in _config["keywords"]:
+        _TAG_KEYWORD_RANKS.setdefault(_keyword, _rank)
+_TAG_KEYWORD_PATTERN = re.compile(
+    '(?=(' + '|'.join(re.escape(k) for k in sorted(_TAG_KEYWORD_RANKS, key=_TAG_KEYWORD_RANKS.get)) + '))')
+_TAG_CATEGORY_COLORS = [config["color"] for config in TAG_CATEGORIES.values()]
+_FALLBACK_TAG_COLORS = ["primary", "secondary", "success", "danger", "warning", "info", "dark"]
+
+@functools.lru_cache(maxsize=4096)
 def get_tag_color(tag):
     """Determine the color category for a tag based on keywords"""
-    tag_lower = tag.lower()
+    ranks = [_TAG_KEYWORD_RANKS[m.group(1)] for m in _TAG_KEYWORD_PATTERN.finditer(tag.lower())]
+    if ranks:
+        # Earliest category wins, as if checking each category in order
+        return _TAG_CATEGORY_COLORS[min(ranks)]
     
-    for category, config in TAG_CATEGORIES.items():
-        if any(keyword in tag_lower for keyword in config["keywords"]):
-            return config["color"]
-    
-    # Assign color based on hash for consistency if no category matches
-    colors = ["primary", "secondary", "success", "danger", "warning", "info", "dark"]
-    return colors[hash(tag) % len(colors)]
+    # Stable hash so a tag keeps its color across workers and restarts
+    return _FALLBACK_TAG_COLORS[zlib.crc32(tag.encode('utf-8')) % len(_FALLBACK_TAG_COLORS)]
 
 # Prompts for different focuses
 FOCUS_PROMPTS = {
@@ -118,102 +211,363 @@ FOCUS_PROMPTS = {
 if not os.path.exists(PPTX_FOLDER):
     os.makedirs(PPTX_FOLDER)
 
+_local_stores = {}
+
+def get_local_store():
+    """Get the SQLite store if enabled, else the partitioned store for the journal file"""
+    if sqlite_store:
+        return sqlite_store
+    store = _local_stores.get(JOURNAL_FILE)
+    if store is None:
+        store = PartitionedJournalStore(JOURNAL_FILE, compact_threshold=JOURNAL_COMPACT_BYTES,
+                                        archive_after_days=JOURNAL_ARCHIVE_DAYS or None,
+                                        max_partitions=JOURNAL_CACHED_PARTITIONS)
+        _local_stores[JOURNAL_FILE] = store
+    return store
+
+_search_indexes = {}
+
+def get_search_index():
+    """Get the full-text search index for the current index path"""
+    index = _search_indexes.get(SEARCH_INDEX_PATH)
+    if index is None:
+        index = JournalSearchIndex(SEARCH_INDEX_PATH)
+        _search_indexes[SEARCH_INDEX_PATH] = index
+    return index
+
+_tag_indexes = {}
+
+def get_tag_index():
+    """Get the per-user tag index, stored alongside the search index"""
+    index = _tag_indexes.get(SEARCH_INDEX_PATH)
+    if index is None:
+        index = JournalTagIndex(SEARCH_INDEX_PATH)
+        _tag_indexes[SEARCH_INDEX_PATH] = index
+    return index
+
+_rollups = {}
+
+def get_rollups():
+    """Get the per-user mood and energy rollups, stored alongside the search index"""
+    rollups = _rollups.get(SEARCH_INDEX_PATH)
+    if rollups is None:
+        rollups = JournalRollups(SEARCH_INDEX_PATH)
+        _rollups[SEARCH_INDEX_PATH] = rollups
+    return rollups
+
+_versions = {}
+
+def get_journal_versions():
+    """Get the per-user journal versions used as ETags, stored alongside the search index"""
+    versions = _versions.get(SEARCH_INDEX_PATH)
+    if versions is None:
+        versions = JournalVersions(SEARCH_INDEX_PATH)
+        _versions[SEARCH_INDEX_PATH] = versions
+    return versions
+
+def _template_version():
+    """Checksum of the templates, so cached pages are not reused across a deploy that changes them"""
+    folder = os.path.join(app.root_path, app.template_folder)
+    checksum = 0
+    for name in sorted(os.listdir(folder)):
+        with open(os.path.join(folder, name), 'rb') as f:
+            checksum = zlib.crc32(name.encode('utf-8') + f.read(), checksum)
+    return f"{checksum:08x}"
+
+TEMPLATE_VERSION = _template_version()
+
+_fragment_caches = {}
+
+def get_fragment_cache():
+    """Get the rendered entry card cache for the current index path, or None if disabled"""
+    if FRAGMENT_CACHE_BYTES <= 0:
+        return None
+    cache = _fragment_caches.get(SEARCH_INDEX_PATH)
+    if cache is None:
+        cache = FragmentCache(FRAGMENT_CACHE_BYTES, path=SEARCH_INDEX_PATH if FRAGMENT_CACHE_PERSIST else None)
+        _fragment_caches[SEARCH_INDEX_PATH] = cache
+    return cache
+
+def render_entry_cards(entries):
+    """Entry cards as one HTML fragment, rendering only those not cached for this entry version
+
+    A card is reused while the entry's own version, the generation bumped
+    by whole-journal restores and imports, and the templates are unchanged.
+    """
+    template = app.jinja_env.get_template('journal_entry.html')
+    cache = get_fragment_cache()
+    if cache is None:
+        return Markup(''.join(template.render(entry=entry, get_tag_color=get_tag_color) for entry in entries))
+    
+    shared = get_journal_versions().generation()
+    keys = [(int(entry['id']), f"{entry.get('version')}-{shared}-{TEMPLATE_VERSION}") for entry in entries]
+    cached = cache.get_many(keys)
+    cards, rendered = [], []
+    for entry, (entry_id, version) in zip(entries, keys):
+        html = cached.get(entry_id)
+        if html is None:
+            html = template.render(entry=entry, get_tag_color=get_tag_color)
+            rendered.append((entry_id, version, html))
+        cards.append(html)
+    cache.put_many(rendered)
+    return Markup(''.join(cards))
+
+def journal_conditional(view):
+    """Answer a GET with 304 when the user's journal is unchanged, before any entry is read or rendered
+
+    The ETag combines the user, their journal version and the templates.
+    Pages carrying flashed messages are one-offs, so they get no validator.
+    Neither do DynamoDB journals, which other nodes write to without
+    bumping the versions kept here.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        username = session.get('journal_username')
+        if request.method != 'GET' or not username or session.get('_flashes') or dynamodb_store:
+            return view(*args, **kwargs)
+        version, modified = get_journal_versions().get(username)
+        etag = f"{zlib.crc32(username.encode('utf-8')):08x}-{version}-{TEMPLATE_VERSION}"
+        if not is_resource_modified(request.environ, etag=etag, last_modified=modified):
+            response = app.response_class(status=304)
+        else:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or session.get('_flashes'):
+                return response
+        response.set_etag(etag)
+        if modified:
+            response.last_modified = modified
+        # Revalidate every time; the 304 is what makes that cheap
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Cookie')
+        return response
+    return wrapper
+
 def get_journal_entries():
     """Get journal entries from DynamoDB or local file"""
     if dynamodb_store:
         return dynamodb_store.get_all_entries()
     
-    if not os.path.exists(JOURNAL_FILE):
-        # Try to restore from S3 backup if available
-        if aws_backup:
-            entries = aws_backup.restore_from_backup()
-            if entries:
-                logger.info("Restored entries from S3 backup")
-                with open(JOURNAL_FILE, 'w') as f:
-                    json.dump(entries, f, indent=4)
-                return entries
-        return []
+    # An empty journal is restored from S3 in the background, never inside a request
+    return get_local_store().get_all_entries()
+
+class JournalRestoring(Exception):
+    """Raised when a new entry cannot get an ID until a restore has reserved the backup's IDs"""
+
+# Restore states kept in a file next to the journal, so every worker sees them
+RESTORE_RESERVING = 'reserving'
+RESTORE_DOWNLOADING = 'downloading'
+
+def _restore_state():
+    """RESTORE_RESERVING until a pending restore has reserved the backup's IDs, then
+    RESTORE_DOWNLOADING until it finishes, else None"""
+    try:
+        with open(JOURNAL_FILE + '.restoring') as f:
+            return f.read() or RESTORE_RESERVING
+    except FileNotFoundError:
+        return None
+
+def _set_restore_state(state):
+    if state:
+        atomic_write(JOURNAL_FILE + '.restoring', state)
+    else:
+        try:
+            os.remove(JOURNAL_FILE + '.restoring')
+        except FileNotFoundError:
+            pass
+
+def _wait_for_reserved_ids():
+    """Hold a new entry back until a pending restore has reserved the backup's IDs"""
+    deadline = time.monotonic() + RESTORE_WRITE_WAIT
+    while _restore_state() == RESTORE_RESERVING:
+        if time.monotonic() >= deadline:
+            raise JournalRestoring("Journal restore has not reserved the backup's entry IDs yet")
+        time.sleep(0.1)
+
+def restore_journal_from_backup():
+    """Restore the local journal from S3, keeping anything written while it downloaded
+
+    The backup's highest ID is reserved before the download starts, so
+    entries written meanwhile get IDs of their own and the two sets merge
+    without overwriting each other.
+    """
+    if not aws_backup or dynamodb_store:
+        return False
     
+    store = get_local_store()
+    marker = JOURNAL_FILE + '.restored'
     try:
-        with open(JOURNAL_FILE, 'r') as f:
-            entries = json.load(f)
-        return entries
-    except json.JSONDecodeError:
-        return []
+        # One worker restores; the others wait here and then find the marker
+        with file_lock(JOURNAL_FILE + '.restore.lock'):
+            if os.path.exists(marker):
+                restore_progress.finish("skipped")
+                return False
+            max_id = aws_backup.backup_max_id()
+            if max_id is not None:
+                store.reserve_ids(max_id + 1)
+            # Legacy backups have no manifest to reserve IDs from; rather than hold writes for the
+            # whole download, any entry written meanwhile that clashes is moved to a new ID by the merge
+            _set_restore_state(RESTORE_DOWNLOADING)
+            entries = aws_backup.restore_from_backup(restore_progress)
+            if entries is None and restore_progress.status()["state"] == "failed":
+                return False
+            if entries:
+                moved = store.merge_entries(entries)
+                if moved:
+                    logger.warning(f"Moved {moved} entries written before the restore to new IDs")
+                rebuild_search_index()
+                rebuild_rollups()
+            with open(marker, 'w') as f:
+                f.write(datetime.now().isoformat())
+    finally:
+        _set_restore_state(None)
+    restore_progress.finish("done" if entries else "empty")
+    logger.info(f"Restored {len(entries or [])} entries from S3 backup")
+    # Entries written during the download were held back from backups until now
+    schedule_backup()
+    return bool(entries)
+
+def _restore_quietly():
+    try:
+        restore_journal_from_backup()
+    except Exception as e:
+        logger.error(f"Background restore from S3 failed: {e}")
+        restore_progress.fail(e)
+
+def start_background_restore():
+    """Restore an empty journal from S3 on a background thread so no request waits on the download
+
+    Runs before this worker serves anything. New entries wait until the
+    backup's IDs are reserved, and backups wait until the restore is done.
+    A restore interrupted by a crash is picked up again.
+    """
+    if not aws_backup or dynamodb_store:
+        return
+    if _restore_state() is None:
+        if get_local_store().exists():
+            return
+        _set_restore_state(RESTORE_RESERVING)
+    threading.Thread(target=_restore_quietly, daemon=True).start()
+
+_background_pid = None
+_background_lock = threading.Lock()
+
+def start_background_tasks():
+    """Start this process's readiness checks and restore, once per worker
+
+    Threads do not survive a fork, so with gunicorn's preload_app these run
+    in each worker after it forks rather than at import in the master.
+    """
+    global _background_pid
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        _background_pid = os.getpid()
+    if readiness:
+        readiness.start()
+    start_background_restore()
+
+@app.before_request
+def _ensure_background_tasks():
+    if _background_pid != os.getpid():
+        start_background_tasks()
 
 def get_user_journal_entries(username):
     """Get journal entries for a specific user"""
     if not username:
         return []
     
-    all_entries = get_journal_entries()
-    # Filter entries by username
-    user_entries = [entry for entry in all_entries if entry.get('username') == username]
-    return user_entries
+    if dynamodb_store:
+        # Queried from the per-user index, which returns newest first
+        entries, _ = dynamodb_store.get_user_entries(username)
+        return entries[::-1]
+    
+    # Only this user's partition is read
+    return get_local_store().get_user_entries(username)
 
-def save_journal_entries(entries):
-    """Save journal entries to local file and backup to S3"""
-    # Save to local file
-    with open(JOURNAL_FILE, 'w') as f:
-        json.dump(entries, f, indent=4)
+def get_user_journal_page(username, limit=JOURNAL_PAGE_SIZE, before_id=None):
+    """Get up to limit of a user's entries older than before_id, newest first"""
+    if not username:
+        return []
     
-    # Backup to S3 if available
-    if aws_backup:
-        aws_backup.backup_entries(entries)
+    if dynamodb_store:
+        entries, _ = dynamodb_store.get_user_entries(username, limit, cursor=before_id)
+        return entries
+    
+    return get_local_store().get_latest_user_entries(username, limit, before_id)
+
+def _journal_page(username, before_id=None):
+    """Get a page of entries plus the cursor for the next page, if any"""
+    # Ask for one extra entry to learn whether an older page exists
+    entries = get_user_journal_page(username, JOURNAL_PAGE_SIZE + 1, before_id)
+    if len(entries) > JOURNAL_PAGE_SIZE:
+        entries = entries[:JOURNAL_PAGE_SIZE]
+        return entries, int(entries[-1]['id'])
+    return entries, None
 
-def get_users():
-    """Get all registered users"""
-    if not os.path.exists(USERS_FILE):
-        return {}
+def get_user_journal_entries_by_ids(username, entry_ids):
+    """Get a user's entries with the given IDs, in the order given"""
+    if not username or not entry_ids:
+        return []
     
-    try:
-        with open(USERS_FILE, 'r') as f:
-            users = json.load(f)
-        return users
-    except json.JSONDecodeError:
-        return {}
+    if dynamodb_store:
+        return dynamodb_store.get_user_entries_by_ids(username, entry_ids)
+    
+    return get_local_store().get_user_entries_by_ids(username, entry_ids)
+
+_user_stores = {}
 
-def save_users(users):
-    """Save users to file"""
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f, indent=4)
+def get_user_store():
+    """Get the user store next to the users file, migrating users.json into it on first use"""
+    store = _user_stores.get(USERS_FILE)
+    if store is None:
+        store = SQLiteUserStore(os.path.splitext(USERS_FILE)[0] + '.db', legacy_path=USERS_FILE)
+        _user_stores[USERS_FILE] = store
+    return store
 
 def register_user(username, password):
     """Register a new user"""
-    users = get_users()
-    
     # Convert username to lowercase for storage
     username_lower = username.lower()
     
-    if username_lower in users:
-        return False, "Username already exists"
-    
     # Store username in lowercase with display name (capitalize first letter)
-    users[username_lower] = {
-        "password_hash": generate_password_hash(password),
+    user = {
+        "password_hash": password_hasher.hash(password),
         "display_name": username_lower.capitalize(),  # Always capitalize first letter
         "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     }
     
-    save_users(users)
+    # The insert fails if the name is taken, even if another worker just took it
+    if not get_user_store().add(username_lower, user):
+        return False, "Username already exists"
     return True, "User registered successfully"
 
 def verify_user(username, password):
     """Verify user credentials"""
-    users = get_users()
+    user = get_user_store().get(username)
     
-    # Convert username to lowercase for lookup
-    username_lower = username.lower()
+    if user is None:
+        return False
     
-    if username_lower not in users:
+    if not password_hasher.verify(user["password_hash"], password):
         return False
     
-    return check_password_hash(users[username_lower]["password_hash"], password)
+    # Upgrade hashes made with older parameters while we have the plain password
+    try:
+        if password_hasher.needs_rehash(user["password_hash"]):
+            get_user_store().set_password_hash(username, password_hasher.hash(password))
+    except HashingBusy:
+        logger.info(f"Deferred rehashing password for {username.lower()}: hashing pool busy")
+    return True
+
+def schedule_backup():
+    """Queue a coalesced background backup of the journal to S3, if enabled"""
+    # A journal still being restored would replace the backup with a partial copy
+    if backup_worker and _restore_state() is None:
+        backup_worker.request()
 
 def add_journal_entry(entry_data):
-    entries = get_journal_entries()
     entry = {
-        "id": len(entries) + 1,
+        "id": None,  # Assigned by the store
         "username": entry_data.get("username"),  # Add username field
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "date": datetime.now().strftime("%B %d, %Y"),
@@ -229,12 +583,140 @@ def add_journal_entry(entry_data):
     }
     
     if dynamodb_store:
-        # Add to DynamoDB
-        dynamodb_store.add_entry(entry)
+        # Add to DynamoDB; the ID comes from an atomic counter, not a scan
+        entry = dynamodb_store.add_entry(entry)
+    else:
+        _wait_for_reserved_ids()
+        # Append to the local store, which allocates the ID without reading entries
+        entry = get_local_store().add_entry(entry)
+        
+        # Backup to S3 in the background if available
+        schedule_backup()
+    
+    if entry:
+        # Index incrementally; an indexing failure must not lose the entry
+        try:
+            get_search_index().add_entry(entry)
+            get_tag_index().add_entry(entry)
+            get_rollups().add_entry(entry)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to index entry {entry['id']}: {e}")
+        # Only once the entry and its indexes are written, so no page missing it carries the new version
+        try:
+            get_journal_versions().bump(entry['username'])
+        except sqlite3.Error as e:
+            logger.error(f"Failed to bump journal version for entry {entry['id']}: {e}")
+    return entry
+
+def rebuild_search_index():
+    """Rebuild the search and tag indexes from every stored entry"""
+    entries = get_journal_entries()
+    get_tag_index().rebuild(entries)
+    count = get_search_index().rebuild(entries)
+    # Pages rendered from the old indexes must not be served as current
+    get_journal_versions().bump()
+    return count
+
+def rebuild_rollups():
+    """Rebuild the mood, energy and focus rollups from every stored entry"""
+    if dynamodb_store or sqlite_store:
+        entries = get_journal_entries()
+    else:
+        # Archived entries are rolled up from their columns without decoding their text
+        entries = get_local_store().get_entry_summaries()
+    return get_rollups().rebuild(entries)
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Index all existing journal entries for search and tag filters"""
+    count = rebuild_search_index()
+    click.echo(f"Indexed {count} journal entries")
+
+@app.cli.command('backfill-journal-stats')
+def backfill_journal_stats_command():
+    """Build mood, energy and focus rollups for all existing journal entries"""
+    count = rebuild_rollups()
+    click.echo(f"Rolled up {count} journal entries")
+
+@app.cli.command('restore-backup')
+def restore_backup_command():
+    """Restore the S3 backup into the local journal, unless it has been restored before"""
+    if restore_journal_from_backup():
+        click.echo(f"Restored {restore_progress.status()['entries']} entries from S3")
+    else:
+        click.echo("Nothing restored")
+
+@app.cli.command('compact-backups')
+def compact_backups_command():
+    """Fold the S3 backup's deltas into a fresh snapshot"""
+    if not aws_backup:
+        click.echo("S3 backup is not configured")
+        return
+    if aws_backup.compact():
+        click.echo("Compacted S3 backup into a new snapshot")
     else:
-        # Add to local list and save
-        entries.append(entry)
-        save_journal_entries(entries)
+        click.echo("No S3 backup to compact")
+
+@app.cli.command('archive-journal')
+def archive_journal_command():
+    """Compact the local journal now, moving entries past JOURNAL_ARCHIVE_DAYS into archive segments"""
+    if dynamodb_store or sqlite_store:
+        click.echo("Archiving only applies to the local journal files")
+        return
+    get_local_store().compact()
+    click.echo(f"Compacted journal partitions in {get_local_store().partition_dir}")
+
+def _transfer_store(backend):
+    """The store a bulk export or import should use: the configured one, or the named backend"""
+    if backend == 'dynamodb':
+        if dynamodb_store:
+            return dynamodb_store
+        if not aws_available:
+            raise click.ClickException("AWS integration is not available")
+        return DynamoDBJournalStore(table_name=os.environ.get('DYNAMODB_TABLE_NAME'),
+                                    region=os.environ.get('AWS_REGION', 'us-east-1'))
+    if backend == 'local':
+        return get_local_store()
+    return dynamodb_store or get_local_store()
+
+def _report_throughput(verb):
+    return lambda summary: click.echo(f"{verb} {summary['entries']} entries ({summary['rate']} entries/s)")
+
+@app.cli.command('export-journal')
+@click.argument('path')
+@click.option('--backend', type=click.Choice(['local', 'dynamodb']), help="Defaults to the configured store")
+@click.option('--segments', default=4, show_default=True, help="Parallel DynamoDB scan segments")
+@click.option('--restart', is_flag=True, help="Ignore any checkpoint and start over")
+def export_journal_command(path, backend, segments, restart):
+    """Stream every journal entry to a JSONL file, resuming from PATH.checkpoint if present"""
+    checkpoint = path + '.checkpoint'
+    if restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    summary = export_journal(_transfer_store(backend), path, checkpoint, segments=segments,
+                             report=_report_throughput("Exported"))
+    click.echo(f"Exported {summary['entries']} entries in {summary['seconds']}s ({summary['rate']} entries/s)")
+
+@app.cli.command('import-journal')
+@click.argument('path')
+@click.option('--backend', type=click.Choice(['local', 'dynamodb']), help="Defaults to the configured store")
+@click.option('--batch-size', default=500, show_default=True, help="Entries written between checkpoints")
+@click.option('--restart', is_flag=True, help="Ignore any checkpoint and start over")
+def import_journal_command(path, backend, batch_size, restart):
+    """Load a JSONL export, keeping entry IDs, resuming from PATH.checkpoint if present
+
+    In DynamoDB an imported entry overwrites any stored entry with the same
+    ID; the local journal moves such stored entries to new IDs instead.
+    """
+    checkpoint = path + '.checkpoint'
+    if restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    store = _transfer_store(backend)
+    summary = import_journal(path, store, checkpoint, batch_size=batch_size, report=_report_throughput("Imported"))
+    if hasattr(store, 'invalidate'):
+        store.invalidate()
+    get_journal_versions().bump()
+    click.echo(f"Imported {summary['entries']} entries in {summary['seconds']}s ({summary['rate']} entries/s)")
+    click.echo("Run rebuild-search-index and backfill-journal-stats to index the imported entries")
 
 @app.route('/')
 def home():
@@ -268,11 +750,68 @@ def download_ppt(ppt_id):
         flash("You need to enter the password to download this file.", "warning")
         return redirect(url_for('login', ppt_id=ppt_id))
     
+    file_name = PPTX_FILES[ppt_id]
+    path = os.path.join(app.root_path, PPTX_FOLDER, file_name)
     try:
-        return send_from_directory(PPTX_FOLDER, PPTX_FILES[ppt_id], as_attachment=True)
+        stat = os.stat(path)
     except FileNotFoundError:
         flash("File not found on server. Please place the file in the 'secure_powerpoints' folder.", "error")
         return redirect(url_for('powerpoint_page', ppt_id=ppt_id))
+    
+    if PPTX_SERVE_MODE in ('x-accel', 'x-sendfile'):
+        response = _offload_presentation(path, file_name)
+    else:
+        response = _send_presentation(path, file_name, stat)
+    # Behind the session check, so only the browser that logged in may keep a copy
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Cookie')
+    return response
+
+_presentation_etags = {}
+
+def _presentation_etag(path, stat):
+    """Strong ETag from the file's contents, hashed once per size and modification time"""
+    key = (stat.st_size, stat.st_mtime_ns)
+    cached = _presentation_etags.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    etag = digest.hexdigest()[:32]
+    _presentation_etags[path] = (key, etag)
+    return etag
+
+def _send_presentation(path, file_name, stat):
+    """Send a presentation from this worker, answering Range, If-Range and If-None-Match
+
+    Werkzeug serves a range by wrapping the file in an iterator, which
+    gunicorn has to copy through Python. Gunicorn sends a plain file wrapper
+    with sendfile() from the file's current offset and stops at
+    Content-Length, so under gunicorn a range gets a file seeked to its
+    start instead.
+    """
+    response = send_file(path, as_attachment=True, download_name=file_name,
+                         etag=_presentation_etag(path, stat), last_modified=stat.st_mtime)
+    # Werkzeug only says so on partial responses; clients need it up front to resume
+    response.headers.setdefault('Accept-Ranges', 'bytes')
+    if response.status_code == 206 and request.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn/'):
+        response.response.close()
+        f = open(path, 'rb')
+        f.seek(response.content_range.start)
+        response.response = wrap_file(request.environ, f)
+    return response
+
+def _offload_presentation(path, file_name):
+    """Hand the transfer to the front proxy, which then also handles ranges and validators"""
+    response = app.response_class(mimetype=mimetypes.guess_type(file_name)[0] or 'application/octet-stream')
+    response.headers.set('Content-Disposition', 'attachment', filename=file_name)
+    if PPTX_SERVE_MODE == 'x-accel':
+        response.headers['X-Accel-Redirect'] = f"{PPTX_ACCEL_PREFIX.rstrip('/')}/{quote(file_name)}"
+    else:
+        response.headers['X-Sendfile'] = os.path.abspath(path)
+    return response
 
 @app.route('/powerpoint/<ppt_id>')
 def powerpoint_page(ppt_id):
@@ -282,6 +821,11 @@ def powerpoint_page(ppt_id):
     
     return render_template(f'{ppt_id}.html', ppt_id=ppt_id, ppt_file_name=PPTX_FILES.get(ppt_id))
 
+def _hashing_busy(template):
+    """Shed a login or registration while the hashing pool is saturated"""
+    flash("We're handling a lot of sign-ins right now. Please try again in a moment.", "warning")
+    return render_template(template), 503, {"Retry-After": "1"}
+
 @app.route('/journal_login', methods=['GET', 'POST'])
 def journal_login():
     """Login page for journal access"""
@@ -290,14 +834,17 @@ def journal_login():
         password = request.form.get('password', '')
         
         if username and password:
-            if verify_user(username, password):
+            try:
+                verified = verify_user(username, password)
+            except HashingBusy:
+                return _hashing_busy('journal_login.html')
+            if verified:
                 # Store lowercase username in session
                 username_lower = username.lower()
                 session['journal_username'] = username_lower
                 
                 # Get display name or use the entered username
-                users = get_users()
-                display_name = users[username_lower].get('display_name', username)
+                display_name = get_user_store().get(username_lower).get('display_name', username)
                 # Ensure display name is capitalized
                 display_name = display_name.capitalize() if display_name else username.capitalize()
                 
@@ -327,7 +874,10 @@ def journal_register():
         elif password != confirm_password:
             flash("Passwords do not match", "error")
         else:
-            success, message = register_user(username, password)
+            try:
+                success, message = register_user(username, password)
+            except HashingBusy:
+                return _hashing_busy('journal_register.html')
             if success:
                 # Store lowercase username in session
                 session['journal_username'] = username.lower()
@@ -339,6 +889,7 @@ def journal_register():
     return render_template('journal_register.html')
 
 @app.route('/journal', methods=['GET', 'POST'])
+@journal_conditional
 def journal():
     # Check if user is authenticated
     username = session.get('journal_username')
@@ -383,23 +934,26 @@ def journal():
                 "action_item": action_item,
                 "tags": tags
             }
-            add_journal_entry(entry_data)
-            flash("Journal entry added successfully!", "success")
+            try:
+                add_journal_entry(entry_data)
+                flash("Journal entry added successfully!", "success")
+            except JournalRestoring:
+                flash("Your journal is being restored from backup. Please try again in a moment.", "warning")
         else:
             flash("Please fill in all required fields.", "error")
         return redirect(url_for('journal'))
     
-    # Get entries for current user only
-    entries = get_user_journal_entries(username)
+    # Get the newest page of entries for current user only
+    entries, next_cursor = _journal_page(username)
     
     # Get display name
-    users = get_users()
-    display_name = users[username].get('display_name', username)
+    display_name = (get_user_store().get(username) or {}).get('display_name', username)
     # Ensure display name is capitalized
     display_name = display_name.capitalize() if display_name else username.capitalize()
     
     return render_template('journal.html', 
                          entries=entries, 
+                         next_cursor=next_cursor,
                          focuses=JOURNAL_FOCUSES,
                          mood_options=MOOD_OPTIONS,
                          energy_levels=ENERGY_LEVELS,
@@ -407,7 +961,80 @@ def journal():
                          aws_enabled=bool(aws_backup or dynamodb_store),
                          username=username,
                          display_name=display_name,
-                         get_tag_color=get_tag_color)
+                         entry_cards=render_entry_cards(entries))
+
+@app.route('/journal/entries')
+@journal_conditional
+def journal_entries():
+    """Older journal entries for lazy loading, as JSON plus rendered cards"""
+    username = session.get('journal_username')
+    if not username:
+        return {"error": "Not logged in"}, 401
+    
+    before_id = request.args.get('before', type=int)
+    entries, next_cursor = _journal_page(username, before_id)
+    html = render_entry_cards(entries)
+    return {"entries": entries, "html": html, "next_cursor": next_cursor}
+
+@app.route('/journal/search')
+@journal_conditional
+def journal_search():
+    """Ranked full-text search over the user's journal"""
+    username = session.get('journal_username')
+    if not username:
+        return {"error": "Not logged in"}, 401
+    
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', JOURNAL_PAGE_SIZE, type=int), 100))
+    entries = get_search_index().search(username, query, limit)
+    html = render_entry_cards(entries)
+    return {"query": query, "entries": entries, "html": html}
+
+@app.route('/journal/tags')
+@journal_conditional
+def journal_tags():
+    """The user's tags with precomputed entry counts"""
+    username = session.get('journal_username')
+    if not username:
+        return {"error": "Not logged in"}, 401
+    
+    return {"tags": get_tag_index().facets(username)}
+
+@app.route('/journal/tags/entries')
+@journal_conditional
+def journal_tag_entries():
+    """The user's entries filtered by tags, matching all (mode=and) or any (mode=or)"""
+    username = session.get('journal_username')
+    if not username:
+        return {"error": "Not logged in"}, 401
+    
+    tags = [tag for tag in request.args.get('tags', '').split(',') if tag.strip()]
+    mode = request.args.get('mode', 'and')
+    if mode not in ('and', 'or'):
+        return {"error": "mode must be 'and' or 'or'"}, 400
+    
+    before_id = request.args.get('before', type=int)
+    entry_ids = get_tag_index().entry_ids(username, tags, mode, JOURNAL_PAGE_SIZE + 1, before_id)
+    next_cursor = entry_ids[JOURNAL_PAGE_SIZE - 1] if len(entry_ids) > JOURNAL_PAGE_SIZE else None
+    entries = get_user_journal_entries_by_ids(username, entry_ids[:JOURNAL_PAGE_SIZE])
+    html = render_entry_cards(entries)
+    return {"tags": tags, "mode": mode, "entries": entries, "html": html, "next_cursor": next_cursor}
+
+@app.route('/journal/stats')
+def journal_stats():
+    """Mood, energy and focus trends plus journaling streaks from the precomputed rollups"""
+    username = session.get('journal_username')
+    if not username:
+        return {"error": "Not logged in"}, 401
+    
+    period = request.args.get('period', 'week')
+    if period not in PERIODS:
+        return {"error": f"period must be one of {', '.join(PERIODS)}"}, 400
+    
+    limit = max(1, min(request.args.get('limit', 12, type=int), 366))
+    rollups = get_rollups()
+    return {"period": period, "buckets": rollups.buckets(username, period, limit),
+            "streaks": rollups.streaks(username)}
 
 @app.route('/logout_journal', methods=['POST'])
 def logout_journal():
@@ -419,7 +1046,20 @@ def logout_journal():
 @app.route('/health')
 def health():
     """Health check endpoint for monitoring"""
-    return {"status": "healthy", "aws_backup": bool(aws_backup), "dynamodb": bool(dynamodb_store)}, 200
+    return {"status": "healthy", "aws_backup": bool(aws_backup), "dynamodb": bool(dynamodb_store),
+            "sqlite": bool(sqlite_store), "backup": dict(backup_worker.status(), **aws_backup.status()) if backup_worker else None,
+            "restore": restore_progress.status() if restore_progress else None,
+            "readiness": readiness.status() if readiness else None,
+            "cache": dynamodb_store.status() if hasattr(dynamodb_store, 'status') else None,
+            "fragments": get_fragment_cache().status() if get_fragment_cache() else None}, 200
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: 503 until AWS credentials and resources have been checked"""
+    start_background_tasks()
+    if readiness and not readiness.ready():
+        return {"ready": False, **readiness.status()}, 503
+    return {"ready": True}, 200
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5002))
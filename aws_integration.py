@@ -1,22 +1,113 @@
-import boto3
-import json
+import atexit
+import gzip
+import hashlib
 import os
+import queue
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from decimal import Decimal
 from botocore.exceptions import ClientError
 import logging
 
+import journal_codec
+from journal_store import file_lock
+
 logger = logging.getLogger(__name__)
 
+# Short timeouts and few retries, so an unreachable AWS fails fast instead of hanging a worker
+AWS_CONNECT_TIMEOUT = float(os.environ.get('AWS_CONNECT_TIMEOUT', 2))
+AWS_READ_TIMEOUT = float(os.environ.get('AWS_READ_TIMEOUT', 10))
+AWS_MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', 3))
+
+
+def aws_client(service, region=None, resource=False):
+    """Create a boto3 client, or resource, with short timeouts
+
+    boto3 is imported here rather than at module level, since loading it
+    takes longer than the rest of the app's startup. Each call uses its own
+    session, as boto3's default session is not safe to share across threads.
+    """
+    import boto3
+    from botocore.config import Config
+    config = Config(connect_timeout=AWS_CONNECT_TIMEOUT, read_timeout=AWS_READ_TIMEOUT,
+                    retries={'max_attempts': AWS_MAX_ATTEMPTS, 'mode': 'standard'})
+    session = boto3.session.Session()
+    if resource:
+        return session.resource(service, region_name=region, config=config)
+    return session.client(service, region_name=region, config=config)
+
+
 class AWSJournalBackup:
-    """Handles AWS S3 backup for journal entries"""
+    """Handles AWS S3 backup for journal entries
+    
+    Backups are gzipped and incremental. ``manifest.json`` names a full
+    snapshot plus the deltas written since, each holding only the entries
+    above the previous checkpoint ID. After ``full_every`` deltas, or when
+    entries behind the checkpoint change, a new snapshot replaces the chain,
+    which bounds how many objects a restore has to read.
+    
+    The manifest also records a SHA-256 digest of the backed-up journal, so
+    a backup of unchanged entries, such as the re-save right after a
+    restore, uploads nothing. The manifest itself is re-read with its ETag,
+    so an unchanged one costs a 304 rather than a download.
+    
+    Manifest updates are serialized by an flock on lock_path, shared by
+    every worker on the node. A journal with fewer entries or a lower top
+    ID than the backup is refused rather than allowed to replace it, since
+    that is what an empty or half-restored journal looks like. The chain a
+    snapshot replaces stays listed as ``superseded`` and is only deleted by
+    the snapshot after it, so a reader holding the previous manifest can
+    still restore from it.
+    
+    Nothing touches the network until first use: the S3 client is created
+    per process on demand, and the bucket is checked before the first
+    backup or restore, or by probe().
+    """
+    
+    PREFIX = 'journal_backups/'
+    MANIFEST_KEY = PREFIX + 'manifest.json'
+    # Written by earlier versions as an uncompressed full copy on every backup
+    LEGACY_KEY = PREFIX + 'latest.json'
     
-    def __init__(self, bucket_name=None, region='us-east-1'):
+    def __init__(self, bucket_name=None, region='us-east-1', full_every=None, lock_path=None):
         self.bucket_name = bucket_name or os.environ.get('S3_BACKUP_BUCKET')
         self.region = region
-        
-        if self.bucket_name:
-            self.s3_client = boto3.client('s3', region_name=self.region)
+        self.lock_path = lock_path
+        self.full_every = full_every or int(os.environ.get('BACKUP_FULL_EVERY', 24))
+        self.restore_part_size = int(os.environ.get('RESTORE_PART_SIZE', 8 * 1024 * 1024))
+        self.restore_workers = int(os.environ.get('RESTORE_WORKERS', 8))
+        self._manifest = (None, None)
+        self._stats_lock = threading.Lock()
+        self._stats = {"uploaded": 0, "skipped": 0, "refused": 0, "bytes_uploaded": 0}
+        self._write_lock = threading.Lock()
+        self._client = None
+        self._client_pid = None
+        self._client_lock = threading.Lock()
+        self._bucket_ready = False
+    
+    @property
+    def s3_client(self):
+        """This process's S3 client, created on first use"""
+        with self._client_lock:
+            # Clients are not fork-safe, so a preloaded app's workers each make their own
+            if self._client is None or self._client_pid != os.getpid():
+                self._client = aws_client('s3', self.region)
+                self._client_pid = os.getpid()
+            return self._client
+    
+    def probe(self):
+        """Check, creating if needed, the backup bucket; for readiness checks"""
+        self._ensure_bucket()
+        return True
+    
+    def _ensure_bucket(self):
+        if not self._bucket_ready:
             self._ensure_bucket_exists()
+            self._bucket_ready = True
     
     def _ensure_bucket_exists(self):
         """Create S3 bucket if it doesn't exist"""
@@ -43,106 +134,560 @@ class AWSJournalBackup:
                     logger.error(f"Failed to create bucket: {create_error}")
                     raise
     
-    def backup_entries(self, entries):
-        """Backup journal entries to S3"""
+    def _single_writer(self):
+        """Hold the lock that lets one writer at a time read-modify-write the manifest"""
+        return file_lock(self.lock_path) if self.lock_path else self._write_lock
+    
+    def backup_entries(self, entries, allow_shrink=False):
+        """Back up journal entries to S3 as a delta since the last checkpoint, or a full snapshot
+        
+        Refuses, returning False, to replace a backup holding more entries or
+        higher IDs than the journal unless allow_shrink is set, e.g. after
+        deliberately deleting entries.
+        """
         if not self.bucket_name:
             logger.warning("No S3 bucket configured for backup")
             return False
             
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            key = f"journal_backups/journal_entries_{timestamp}.json"
-            
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=key,
-                Body=json.dumps(entries, indent=2),
-                ContentType='application/json',
-                ServerSideEncryption='AES256'
-            )
-            
-            # Also update the 'latest' backup
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key='journal_backups/latest.json',
-                Body=json.dumps(entries, indent=2),
-                ContentType='application/json',
-                ServerSideEncryption='AES256'
-            )
-            
-            logger.info(f"Successfully backed up {len(entries)} entries to S3")
-            return True
-            
+            self._ensure_bucket()
+            with self._single_writer():
+                return self._backup_entries(entries, allow_shrink)
         except ClientError as e:
             logger.error(f"Failed to backup to S3: {e}")
             return False
     
-    def restore_from_backup(self):
-        """Restore journal entries from S3 backup"""
+    def _backup_entries(self, entries, allow_shrink):
+        manifest = self._read_manifest()
+        entries = sorted(entries, key=_backup_id)
+        lines = _encode_lines(entries)
+        checkpoint = manifest['max_id'] if manifest else 0
+        split = sum(1 for e in entries if _backup_id(e) <= checkpoint)
+        prefix_hash = hashlib.sha256(b''.join(lines[:split]))
+        full_hash = prefix_hash.copy()
+        full_hash.update(b''.join(lines[split:]))
+        digest = full_hash.hexdigest()
+        
+        if manifest is not None and manifest.get('digest') == digest:
+            self._count("skipped")
+            logger.debug("Journal unchanged since the last backup, skipping upload")
+            return True
+        if manifest is not None and not allow_shrink and (
+                len(entries) < manifest['count'] or _backup_id(entries[-1] if entries else {}) < manifest['max_id']):
+            self._count("refused")
+            logger.error(f"Refusing to replace a backup of {manifest['count']} entries up to ID {manifest['max_id']} "
+                         f"with a journal of {len(entries)}; it may be empty or only partly restored")
+            return False
+        if manifest is None or len(manifest['deltas']) >= self.full_every:
+            return self._write_snapshot(entries, manifest, lines, digest)
+        
+        if 'digest' in manifest:
+            unchanged = prefix_hash.hexdigest() == manifest['digest']
+        else:
+            unchanged = split == manifest['count']
+        if not unchanged:
+            # Entries behind the checkpoint were deleted or edited, which a delta cannot express
+            return self._write_snapshot(entries, manifest, lines, digest)
+        
+        if split == len(entries):
+            self._count("skipped")
+            return True
+        max_id = _backup_id(entries[-1])
+        key = f"{self.PREFIX}deltas/delta_{_stamp()}_{max_id}.json.gz"
+        self._put_entries(key, lines[split:])
+        manifest['deltas'].append({'key': key, 'count': len(entries) - split, 'max_id': max_id})
+        manifest['count'] = len(entries)
+        manifest['max_id'] = max_id
+        manifest['digest'] = digest
+        self._write_manifest(manifest)
+        
+        logger.info(f"Backed up {len(entries) - split} new entries to S3 ({len(manifest['deltas'])} deltas)")
+        return True
+    
+    def compact(self):
+        """Fold the snapshot and its deltas, as stored in S3, into a new snapshot"""
+        try:
+            self._ensure_bucket()
+            with self._single_writer():
+                manifest = self._read_manifest()
+                if manifest is None:
+                    return False
+                entries = self._restore(manifest)
+                lines = _encode_lines(entries)
+                return self._write_snapshot(entries, manifest, lines, hashlib.sha256(b''.join(lines)).hexdigest())
+        except ClientError as e:
+            logger.error(f"Failed to compact S3 backups: {e}")
+            return False
+    
+    def status(self):
+        """Upload counters for health checks"""
+        with self._stats_lock:
+            return dict(self._stats)
+    
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+    
+    def restore_from_backup(self, progress=None):
+        """Restore journal entries from the latest snapshot plus its deltas"""
         if not self.bucket_name:
             return None
             
         try:
-            response = self.s3_client.get_object(
-                Bucket=self.bucket_name,
-                Key='journal_backups/latest.json'
-            )
-            entries = json.loads(response['Body'].read())
-            logger.info(f"Restored {len(entries)} entries from S3 backup")
+            self._ensure_bucket()
+            manifest = self._read_manifest()
+            if manifest is None:
+                return self._restore_legacy(progress)
+            entries = self._restore(manifest, progress)
+            logger.info(f"Restored {len(entries)} entries from S3 backup ({len(manifest['deltas'])} deltas)")
             return entries
             
         except ClientError as e:
-            if e.response['Error']['Code'] == 'NoSuchKey':
-                logger.info("No backup found in S3")
-            else:
-                logger.error(f"Failed to restore from S3: {e}")
+            logger.error(f"Failed to restore from S3: {e}")
+            if progress:
+                progress.fail(e)
             return None
+    
+    def backup_max_id(self):
+        """Highest entry ID in the backup, from the manifest alone, or None without a manifest"""
+        if not self.bucket_name:
+            return None
+        self._ensure_bucket()
+        manifest = self._read_manifest()
+        return manifest['max_id'] if manifest else None
+    
+    def _restore(self, manifest, progress=None):
+        """Download the chain to disk with ranged GETs and parse it entry by entry"""
+        progress = progress or RestoreProgress()
+        keys = [manifest['snapshot']] + [delta['key'] for delta in manifest['deltas']]
+        by_id = {}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = [os.path.join(tmp_dir, f"{i}.json.gz") for i in range(len(keys))]
+            self._download(keys, paths, progress)
+            for path in paths:
+                for entry in _iter_entries_file(path):
+                    by_id[_backup_id(entry)] = entry
+                    progress.add_entries(1)
+        return [by_id[entry_id] for entry_id in sorted(by_id)]
+    
+    def _download(self, keys, paths, progress):
+        """Fetch objects into files as parallel ranged GETs of restore_part_size bytes"""
+        parts = []
+        sizes = []
+        for key, path in zip(keys, paths):
+            size = self.s3_client.head_object(Bucket=self.bucket_name, Key=key)['ContentLength']
+            sizes.append(size)
+            parts.extend((key, path, start, min(start + self.restore_part_size, size) - 1)
+                         for start in range(0, size, self.restore_part_size))
+        progress.start(len(keys), sum(sizes))
+        
+        files = {}
+        try:
+            for path, size in zip(paths, sizes):
+                files[path] = open(path, 'wb')
+                files[path].truncate(size)
+            
+            def fetch(part):
+                key, path, start, end = part
+                response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key, Range=f"bytes={start}-{end}")
+                offset = start
+                # Stream each range straight to its place in the file instead of buffering it
+                for chunk in response['Body'].iter_chunks(1024 * 1024):
+                    os.pwrite(files[path].fileno(), chunk, offset)
+                    offset += len(chunk)
+                    progress.add_bytes(len(chunk))
+            
+            with ThreadPoolExecutor(max_workers=self.restore_workers) as pool:
+                list(pool.map(fetch, parts))
+        finally:
+            for f in files.values():
+                f.close()
+    
+    def _restore_legacy(self, progress=None):
+        """Download the uncompressed latest.json written before manifests existed, then parse it from disk"""
+        progress = progress or RestoreProgress()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'latest.json')
+            try:
+                self._download([self.LEGACY_KEY], [path], progress)
+            except ClientError as e:
+                if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                    logger.info("No backup found in S3")
+                    return None
+                raise
+            with open(path, 'rb') as f:
+                entries = journal_codec.loads(f.read())
+        progress.add_entries(len(entries))
+        logger.info(f"Restored {len(entries)} entries from legacy S3 backup")
+        return entries
+    
+    def _write_snapshot(self, entries, previous, lines, digest):
+        """Upload a full snapshot and point the manifest at it
+
+        The chain it replaces is kept as superseded, and the chain superseded
+        before that is deleted.
+        """
+        key = f"{self.PREFIX}snapshots/snapshot_{_stamp()}.json.gz"
+        self._put_entries(key, lines)
+        self._write_manifest({
+            'version': 1,
+            'snapshot': key,
+            'deltas': [],
+            'count': len(entries),
+            'max_id': max((_backup_id(e) for e in entries), default=0),
+            'digest': digest,
+            'superseded': [previous['snapshot']] + [delta['key'] for delta in previous['deltas']] if previous else [],
+        })
+        if previous:
+            stale = previous.get('superseded', [])
+            for i in range(0, len(stale), 1000):
+                self.s3_client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={'Objects': [{'Key': stale_key} for stale_key in stale[i:i + 1000]], 'Quiet': True})
+        logger.info(f"Backed up full snapshot of {len(entries)} entries to S3")
+        return True
+    
+    def _read_manifest(self):
+        """Read the manifest, reusing the last copy seen while its ETag still matches"""
+        etag, cached = self._manifest
+        try:
+            if etag:
+                response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self.MANIFEST_KEY, IfNoneMatch=etag)
+            else:
+                response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self.MANIFEST_KEY)
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code in ('304', 'NotModified'):
+                return journal_codec.loads(cached)
+            if code == 'NoSuchKey':
+                self._manifest = (None, None)
+                return None
+            raise
+        body = response['Body'].read()
+        self._manifest = (response.get('ETag'), body)
+        return journal_codec.loads(body)
+    
+    def _write_manifest(self, manifest):
+        body = journal_codec.dumps(manifest).encode('utf-8')
+        response = self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=self.MANIFEST_KEY,
+            Body=body,
+            ContentType='application/json',
+            ServerSideEncryption='AES256'
+        )
+        self._manifest = (response.get('ETag'), body)
+    
+    def _put_entries(self, key, lines):
+        body = gzip.compress(b''.join(lines))
+        self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=key,
+            Body=body,
+            ContentType='application/x-ndjson',
+            ContentEncoding='gzip',
+            ServerSideEncryption='AES256'
+        )
+        self._count("uploaded")
+        self._count("bytes_uploaded", len(body))
+    
+    def _get_entries(self, key):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'entries.json.gz')
+            self._download([key], [path], RestoreProgress())
+            return list(_iter_entries_file(path))
+
+
+class RestoreProgress:
+    """Thread-safe progress of a restore, for health checks"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status = {"state": "idle", "objects": 0, "bytes_total": 0, "bytes_done": 0, "entries": 0,
+                        "error": None, "started_at": None, "finished_at": None}
+    
+    def start(self, objects, bytes_total):
+        with self._lock:
+            self._status.update(state="running", objects=objects, bytes_total=bytes_total,
+                                started_at=self._status["started_at"] or datetime.now().isoformat(timespec='seconds'))
+    
+    def add_bytes(self, count):
+        with self._lock:
+            self._status["bytes_done"] += count
+    
+    def add_entries(self, count):
+        with self._lock:
+            self._status["entries"] += count
+    
+    def finish(self, state="done"):
+        with self._lock:
+            self._status.update(state=state, finished_at=datetime.now().isoformat(timespec='seconds'))
+    
+    def fail(self, error):
+        with self._lock:
+            self._status.update(state="failed", error=str(error),
+                                finished_at=datetime.now().isoformat(timespec='seconds'))
+    
+    def status(self):
+        with self._lock:
+            return dict(self._status)
+
+
+def _iter_entries_file(path):
+    """Yield entries from a gzipped backup file one line at a time"""
+    with gzip.open(path, 'rb') as f:
+        if f.peek(1)[:1] == b'[':
+            # Snapshots written as a single JSON array
+            yield from journal_codec.loads(f.read())
+            return
+        for line in f:
+            if line.strip():
+                yield journal_codec.loads(line)
+
+
+def _encode_lines(entries):
+    """Encode entries one per line, so restores can parse as they read"""
+    return [(journal_codec.dumps(entry, default=_json_default) + '\n').encode('utf-8') for entry in entries]
+
+
+def _backup_id(entry):
+    return int(entry.get('id') or 0)
+
+
+def _stamp():
+    return datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+
+
+def _json_default(value):
+    """Encode DynamoDB's Decimal numbers as plain JSON numbers"""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+class BackupWorker:
+    """Runs S3 backups on a background thread, coalescing bursts of writes
+    
+    request() only marks the journal dirty and returns. The worker waits out
+    a debounce window so a burst of writes becomes one upload of the latest
+    journal, retries failed uploads with exponential backoff, and flushes any
+    pending backup when the process exits.
+    """
+    
+    def __init__(self, backup, load_entries, debounce=2.0, max_retries=5, backoff=1.0):
+        self.backup = backup
+        self.load_entries = load_entries
+        self.debounce = debounce
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._dirty = False
+        self._wake = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+        self._status = {"pending": False, "uploads": 0, "failures": 0, "retries": 0,
+                        "last_success": None, "last_error": None}
+        atexit.register(self.flush)
+    
+    def request(self):
+        """Ask for a backup of the current journal; returns immediately"""
+        with self._lock:
+            self._dirty = True
+            self._idle.clear()
+            self._status["pending"] = True
+            # Threads do not survive a fork, so each gunicorn worker starts its own
+            if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+        self._wake.set()
+    
+    def _run(self):
+        while True:
+            self._wake.wait()
+            # Let the burst finish; requests arriving meanwhile ride along
+            time.sleep(self.debounce)
+            self._wake.clear()
+            self._upload_pending()
+    
+    def _upload_pending(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+        succeeded = False
+        error = "backup_entries returned False"
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._status["retries"] += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                succeeded = self.backup.backup_entries(self.load_entries())
+            except Exception as e:
+                logger.error(f"Background backup failed: {e}")
+                error = str(e)
+            if succeeded:
+                break
+        with self._lock:
+            if succeeded:
+                self._status["uploads"] += 1
+                self._status["last_success"] = datetime.now().isoformat(timespec='seconds')
+            else:
+                self._status["failures"] += 1
+                self._status["last_error"] = error
+                logger.error(f"Giving up on backup after {self.max_retries + 1} attempts")
+            self._status["pending"] = self._dirty
+            if not self._dirty:
+                self._idle.set()
+    
+    def flush(self, timeout=None):
+        """Upload any pending backup now, e.g. at shutdown"""
+        self._upload_pending()
+        return self._idle.wait(timeout)
+    
+    def status(self):
+        """Backup counters and state for health checks"""
+        with self._lock:
+            return dict(self._status)
 
 
 class DynamoDBJournalStore:
-    """Alternative storage backend using DynamoDB"""
+    """Alternative storage backend using DynamoDB
+    
+    The DynamoDB resource is created per process on first use, and the table
+    is checked (or created) then too, so constructing the store is free.
+    
+    A global secondary index on username and timestamp lets one user's
+    entries be read with Query, newest first and a page at a time, so a
+    page view costs capacity for that page rather than the whole table.
+    """
+    
+    # Reserved item holding the entry ID counter; never returned as an entry
+    COUNTER_ID = 0
+    USER_INDEX = 'username-timestamp-index'
+    USER_INDEX_SPEC = {
+        'IndexName': USER_INDEX,
+        'KeySchema': [
+            {'AttributeName': 'username', 'KeyType': 'HASH'},
+            {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+        ],
+        'Projection': {'ProjectionType': 'ALL'}
+    }
+    USER_INDEX_ATTRIBUTES = [
+        {'AttributeName': 'username', 'AttributeType': 'S'},
+        {'AttributeName': 'timestamp', 'AttributeType': 'S'}
+    ]
     
     def __init__(self, table_name=None, region='us-east-1'):
         self.table_name = table_name or os.environ.get('DYNAMODB_TABLE_NAME', 'gvisit-journal-entries')
         self.region = region
-        
-        if self.table_name:
-            self.dynamodb = boto3.resource('dynamodb', region_name=self.region)
-            self._ensure_table_exists()
+        self._counter_ready = False
+        self._resources = (None, None, None)
+        self._resources_lock = threading.Lock()
+    
+    def _get_resources(self):
+        """This process's DynamoDB resource and table, created on first use"""
+        with self._resources_lock:
+            pid, dynamodb, table = self._resources
+            if pid != os.getpid():
+                dynamodb = aws_client('dynamodb', self.region, resource=True)
+                table = self._ensure_table_exists(dynamodb)
+                self._resources = (os.getpid(), dynamodb, table)
+            return dynamodb, table
+    
+    @property
+    def dynamodb(self):
+        return self._get_resources()[0]
+    
+    @property
+    def table(self):
+        return self._get_resources()[1]
+    
+    def probe(self):
+        """Check, creating if needed, the table; for readiness checks"""
+        self._get_resources()
+        return True
     
-    def _ensure_table_exists(self):
-        """Create DynamoDB table if it doesn't exist"""
+    def _ensure_table_exists(self, dynamodb):
+        """Create DynamoDB table if it doesn't exist, and its per-user index if that is missing"""
+        table = dynamodb.Table(self.table_name)
         try:
-            self.table = self.dynamodb.Table(self.table_name)
-            self.table.load()
+            table.load()
         except ClientError as e:
             if e.response['Error']['Code'] == 'ResourceNotFoundException':
                 try:
-                    self.table = self.dynamodb.create_table(
+                    table = dynamodb.create_table(
                         TableName=self.table_name,
                         KeySchema=[
                             {'AttributeName': 'id', 'KeyType': 'HASH'}
                         ],
                         AttributeDefinitions=[
                             {'AttributeName': 'id', 'AttributeType': 'N'}
-                        ],
+                        ] + self.USER_INDEX_ATTRIBUTES,
+                        GlobalSecondaryIndexes=[self.USER_INDEX_SPEC],
                         BillingMode='PAY_PER_REQUEST'
                     )
-                    self.table.wait_until_exists()
+                    table.wait_until_exists()
                     logger.info(f"Created DynamoDB table: {self.table_name}")
                 except ClientError as create_error:
                     logger.error(f"Failed to create table: {create_error}")
                     raise
+                return table
+            else:
+                raise
+        if not any(index['IndexName'] == self.USER_INDEX for index in table.global_secondary_indexes or []):
+            # Tables created before the index existed; queries fall back to a scan until it is backfilled
+            try:
+                table.update(AttributeDefinitions=self.USER_INDEX_ATTRIBUTES,
+                             GlobalSecondaryIndexUpdates=[{'Create': self.USER_INDEX_SPEC}])
+                logger.info(f"Adding index {self.USER_INDEX} to DynamoDB table {self.table_name}")
+            except ClientError as e:
+                logger.error(f"Failed to add index {self.USER_INDEX}: {e}")
+        return table
+    
+    def _ensure_counter(self):
+        """Seed the ID counter from existing entries the first time it is used"""
+        if self._counter_ready:
+            return
+        if 'Item' not in self.table.get_item(Key={'id': self.COUNTER_ID}):
+            # One-off scan so IDs continue after entries written before the counter existed
+            highest = max((int(e['id']) for e in self.get_all_entries()), default=0)
+            try:
+                self.table.put_item(
+                    Item={'id': self.COUNTER_ID, 'next_id': highest},
+                    ConditionExpression='attribute_not_exists(id)'
+                )
+            except ClientError as e:
+                # Another worker seeded it first
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+        self._counter_ready = True
+    
+    def allocate_id(self):
+        """Atomically take the next entry ID with a single UpdateItem"""
+        self._ensure_counter()
+        response = self.table.update_item(
+            Key={'id': self.COUNTER_ID},
+            UpdateExpression='ADD next_id :one',
+            ExpressionAttributeValues={':one': 1},
+            ReturnValues='UPDATED_NEW'
+        )
+        return int(response['Attributes']['next_id'])
     
     def add_entry(self, entry):
-        """Add a journal entry to DynamoDB"""
+        """Add a journal entry to DynamoDB, allocating its ID if it has none"""
         try:
-            self.table.put_item(Item=entry)
+            if entry.get('id') is None:
+                entry = dict(entry, id=self.allocate_id())
+            # Never overwrite an existing entry with a colliding ID
+            self.table.put_item(Item=entry, ConditionExpression='attribute_not_exists(id)')
             logger.info(f"Added entry {entry['id']} to DynamoDB")
-            return True
+            return entry
         except ClientError as e:
             logger.error(f"Failed to add entry to DynamoDB: {e}")
-            return False
+            return None
     
     def get_all_entries(self):
         """Retrieve all journal entries from DynamoDB"""
@@ -155,6 +700,8 @@ class DynamoDBJournalStore:
                 response = self.table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
                 entries.extend(response.get('Items', []))
             
+            entries = [e for e in entries if int(e.get('id', 0)) != self.COUNTER_ID]
+            
             # Sort by ID
             entries.sort(key=lambda x: int(x.get('id', 0)))
             
@@ -165,7 +712,155 @@ class DynamoDBJournalStore:
             logger.error(f"Failed to retrieve entries from DynamoDB: {e}")
             return []
     
-    def delete_entry(self, entry_id):
+    def scan_pages(self, segments=4, start_keys=None, page_size=None, queue_size=8):
+        """Scan the table as parallel segments, yielding (segment, items, last_key) page by page
+        
+        Each segment is scanned on its own thread with its own connection,
+        and pages are handed over through a small bounded queue, so memory
+        stays flat however large the table is. last_key is None on a
+        segment's final page. start_keys maps a segment to the key to resume
+        it from, or to False to skip it as finished.
+        """
+        start_keys = start_keys or {}
+        active = [segment for segment in range(segments) if start_keys.get(segment) is not False]
+        pages = queue.Queue(maxsize=queue_size)
+        stop = threading.Event()
+        
+        def hand_over(page):
+            while not stop.is_set():
+                try:
+                    pages.put(page, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def scan(segment):
+            try:
+                # Resources are not thread-safe, so each segment gets its own
+                table = aws_client('dynamodb', self.region, resource=True).Table(self.table_name)
+                kwargs = {'Segment': segment, 'TotalSegments': segments}
+                if page_size:
+                    kwargs['Limit'] = page_size
+                last_key = start_keys.get(segment)
+                while True:
+                    if last_key:
+                        kwargs['ExclusiveStartKey'] = last_key
+                    response = table.scan(**kwargs)
+                    last_key = response.get('LastEvaluatedKey')
+                    items = [item for item in response.get('Items', []) if int(item.get('id', 0)) != self.COUNTER_ID]
+                    if not hand_over((segment, items, last_key)) or not last_key:
+                        return
+            except Exception as e:
+                hand_over(e)
+        
+        with ThreadPoolExecutor(max_workers=max(len(active), 1)) as pool:
+            for segment in active:
+                pool.submit(scan, segment)
+            remaining = len(active)
+            try:
+                while remaining:
+                    page = pages.get()
+                    if isinstance(page, Exception):
+                        raise page
+                    if page[2] is None:
+                        remaining -= 1
+                    yield page
+            finally:
+                stop.set()
+    
+    def put_entries(self, entries):
+        """Write entries, keeping their IDs, in BatchWriteItem requests; returns how many were written
+        
+        boto3's batch writer sends 25 puts per request and resends any
+        unprocessed items DynamoDB hands back when throttled. The ID counter
+        is then moved past the highest imported ID.
+        """
+        count = 0
+        highest = 0
+        with self.table.batch_writer(overwrite_by_pkeys=['id']) as batch:
+            for entry in entries:
+                item = _to_item(entry)
+                batch.put_item(Item=item)
+                count += 1
+                highest = max(highest, int(item['id']))
+        if highest:
+            try:
+                self.table.update_item(
+                    Key={'id': self.COUNTER_ID},
+                    UpdateExpression='SET next_id = :highest',
+                    ConditionExpression='attribute_not_exists(next_id) OR next_id < :highest',
+                    ExpressionAttributeValues={':highest': highest}
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+        return count
+    
+    def get_user_entries(self, username, limit=None, cursor=None):
+        """Query one user's entries newest first, returning (entries, next_cursor)
+        
+        cursor is the ID of the last entry of the previous page; next_cursor
+        is None once there are no older entries.
+        """
+        if limit is not None and limit <= 0:
+            return [], None
+        query = {'IndexName': self.USER_INDEX, 'KeyConditionExpression': 'username = :username',
+                 'ExpressionAttributeValues': {':username': username}, 'ScanIndexForward': False}
+        try:
+            if cursor is not None:
+                last = self.table.get_item(Key={'id': int(cursor)}).get('Item')
+                if not last or last.get('username') != username:
+                    return [], None
+                query['ExclusiveStartKey'] = {'id': last['id'], 'username': username, 'timestamp': last['timestamp']}
+            entries = []
+            while True:
+                if limit is not None:
+                    query['Limit'] = limit - len(entries)
+                response = self.table.query(**query)
+                entries.extend(response.get('Items', []))
+                if 'LastEvaluatedKey' not in response or (limit is not None and len(entries) >= limit):
+                    break
+                query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ValidationException':
+                logger.error(f"Failed to query entries from DynamoDB: {e}")
+                return [], None
+            # The index is still being backfilled
+            logger.warning(f"Index {self.USER_INDEX} is not queryable yet, scanning: {e}")
+            return self._scan_user_entries(username, limit, cursor)
+        more = 'LastEvaluatedKey' in response
+        return entries, int(entries[-1]['id']) if more and entries else None
+    
+    def _scan_user_entries(self, username, limit, cursor):
+        """get_user_entries via a filtered scan, for tables whose index is not ready"""
+        entries = [e for e in self.get_all_entries() if e.get('username') == username]
+        if cursor is not None:
+            entries = [e for e in entries if int(e['id']) < int(cursor)]
+        entries.sort(key=lambda e: (e.get('timestamp') or '', int(e['id'])), reverse=True)
+        if limit is None or len(entries) <= limit:
+            return entries, None
+        return entries[:limit], int(entries[limit - 1]['id'])
+    
+    def get_user_entries_by_ids(self, username, entry_ids):
+        """Retrieve one user's entries with the given IDs via BatchGetItem, in the order given"""
+        entry_ids = [int(entry_id) for entry_id in entry_ids]
+        by_id = {}
+        try:
+            for start in range(0, len(entry_ids), 100):
+                request = {self.table_name: {'Keys': [{'id': entry_id} for entry_id in entry_ids[start:start + 100]]}}
+                while request:
+                    response = self.dynamodb.batch_get_item(RequestItems=request)
+                    for item in response.get('Responses', {}).get(self.table_name, []):
+                        by_id[int(item['id'])] = item
+                    request = response.get('UnprocessedKeys')
+        except ClientError as e:
+            logger.error(f"Failed to batch get entries from DynamoDB: {e}")
+            return []
+        return [by_id[entry_id] for entry_id in entry_ids
+                if entry_id in by_id and by_id[entry_id].get('username') == username]
+    
+    def delete_entry(self, entry_id, username=None):
         """Delete a journal entry from DynamoDB"""
         try:
             self.table.delete_item(Key={'id': entry_id})
@@ -176,11 +871,234 @@ class DynamoDBJournalStore:
             return False
 
 
+class CachedJournalStore:
+    """Write-through, per-user read cache in front of DynamoDBJournalStore
+    
+    Each cached user holds their newest entries, newest first, as far back
+    as pages have been read, so repeat page views and "load more" within
+    that range cost no DynamoDB reads. Entries added or deleted through this
+    store update the cache as they are written. Given a generation callable
+    returning a user's current journal generation, as shared by every worker,
+    a cached user is read again as soon as their generation moves on, so
+    writes from other workers on this node show up at once. Writes made
+    elsewhere are picked up once a user's entries expire after ttl seconds,
+    and only the max_users most recently read users are kept.
+    """
+    
+    def __init__(self, store, ttl=30.0, max_users=1000, generation=None):
+        self.store = store
+        self.ttl = ttl
+        self.max_users = max_users
+        self.generation = generation
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+    
+    def __getattr__(self, name):
+        # Everything not cached goes straight to the wrapped store
+        return getattr(self.store, name)
+    
+    def _generation(self, username):
+        """The user's current generation, or None without a generation callable"""
+        return self.generation(username) if self.generation else None
+    
+    def _lookup(self, username, generation=None):
+        """The user's cache record if it is fresh, marking it most recently used"""
+        record = self._users.get(username)
+        if record is None:
+            return None
+        if record["expires"] <= time.monotonic() or record["generation"] != generation:
+            del self._users[username]
+            return None
+        self._users.move_to_end(username)
+        return record
+    
+    def _count(self, name):
+        self._stats[name] += 1
+    
+    def get_user_entries(self, username, limit=None, cursor=None):
+        """get_user_entries served from the user's cached entries, reading only what is not cached yet"""
+        if limit is not None and limit <= 0:
+            return [], None
+        generation = self._generation(username)
+        with self._lock:
+            record = self._lookup(username, generation)
+            if record is None:
+                record = {"entries": [], "complete": False, "version": 0, "generation": generation,
+                          "expires": time.monotonic() + self.ttl}
+            entries, complete, version = list(record["entries"]), record["complete"], record["version"]
+        
+        start = 0
+        if cursor is not None:
+            positions = [i for i, e in enumerate(entries) if int(e['id']) == int(cursor)]
+            if not positions:
+                with self._lock:
+                    self._count("misses")
+                return self.store.get_user_entries(username, limit, cursor)
+            start = positions[0] + 1
+        end = None if limit is None else start + limit
+        
+        fetched = False
+        if not complete and (end is None or len(entries) <= end):
+            # One extra entry tells whether anything older exists
+            more, next_cursor = self.store.get_user_entries(
+                username, None if end is None else end + 1 - len(entries),
+                cursor=int(entries[-1]['id']) if entries else None)
+            entries.extend(more)
+            complete = next_cursor is None
+            fetched = True
+        
+        with self._lock:
+            self._count("misses" if fetched else "hits")
+            current = self._users.get(username)
+            # Skip caching if a write changed the user's entries while we read
+            if fetched and (current is None or current is record) and record["version"] == version:
+                record.update(entries=entries, complete=complete)
+                self._users[username] = record
+                self._users.move_to_end(username)
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+                    self._count("evictions")
+        
+        page = entries[start:end]
+        has_more = end is not None and (len(entries) > end or not complete)
+        return page, int(page[-1]['id']) if has_more and page else None
+    
+    def get_user_entries_by_ids(self, username, entry_ids):
+        """Entries by ID from the user's cached entries when all are cached, else from DynamoDB"""
+        generation = self._generation(username)
+        with self._lock:
+            record = self._lookup(username, generation)
+            by_id = {int(e['id']): e for e in record["entries"]} if record else {}
+            wanted = [int(entry_id) for entry_id in entry_ids]
+            if record and (record["complete"] or all(entry_id in by_id for entry_id in wanted)):
+                self._count("hits")
+                return [by_id[entry_id] for entry_id in wanted if entry_id in by_id]
+            self._count("misses")
+        return self.store.get_user_entries_by_ids(username, entry_ids)
+    
+    def add_entry(self, entry):
+        """Add an entry to DynamoDB and to its user's cached entries"""
+        entry = self.store.add_entry(entry)
+        if entry:
+            with self._lock:
+                # A stale record is dropped on its next read, so it needs no generation check here
+                record = self._users.get(entry.get('username'))
+                if record is not None:
+                    key = _index_key(entry)
+                    entries = record["entries"]
+                    position = next((i for i, e in enumerate(entries) if _index_key(e) < key), len(entries))
+                    # Past the cached range the entry is read with the next page instead
+                    if position < len(entries) or record["complete"]:
+                        entries.insert(position, entry)
+                        record["version"] += 1
+        return entry
+    
+    def delete_entry(self, entry_id, username=None):
+        """Delete an entry from DynamoDB and from any cached entries"""
+        deleted = self.store.delete_entry(entry_id, username)
+        if deleted:
+            with self._lock:
+                for name, record in self._users.items():
+                    if username is None or name == username:
+                        record["entries"] = [e for e in record["entries"] if int(e['id']) != int(entry_id)]
+                        record["version"] += 1
+        return deleted
+    
+    def invalidate(self, username=None):
+        """Drop one user's cached entries, or everyone's"""
+        with self._lock:
+            if username is None:
+                self._users.clear()
+            else:
+                self._users.pop(username, None)
+    
+    def status(self):
+        """Hit, miss and eviction counters for health checks"""
+        with self._lock:
+            return dict(self._stats, users=len(self._users))
+
+
+def _to_item(entry):
+    """A journal entry as a DynamoDB item: floats as Decimal, and no empty index keys"""
+    if entry.get('id') is None:
+        raise ValueError("Imported entries must have an ID")
+    item = {}
+    for key, value in entry.items():
+        if key in ('username', 'timestamp') and not value:
+            # Items missing an index key are simply left out of the index
+            continue
+        item[key] = Decimal(str(value)) if isinstance(value, float) else value
+    return item
+
+
+def _index_key(entry):
+    """Sort key of the username/timestamp index, with the ID breaking ties"""
+    return (entry.get('timestamp') or '', int(entry.get('id') or 0))
+
+
+class ReadinessProbe:
+    """Runs startup checks, such as credentials and bucket access, on a background thread
+    
+    Workers serve requests as soon as they boot; ready() stays False until
+    every check has passed, so a load balancer can hold traffic back until
+    then. Failed checks are retried every retry_interval seconds.
+    """
+    
+    def __init__(self, checks, retry_interval=30.0):
+        self.checks = checks
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+        self._results = {name: {"ok": False, "error": None} for name in checks}
+        self._ran = not checks
+    
+    def start(self):
+        """Start the checks in this process, unless they are already running"""
+        with self._lock:
+            if self._thread_pid == os.getpid() or not self.checks:
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+    
+    def _run(self):
+        while True:
+            for name, check in self.checks.items():
+                if self._results[name]["ok"]:
+                    continue
+                try:
+                    result = {"ok": bool(check()), "error": None}
+                except Exception as e:
+                    logger.warning(f"Readiness check {name} failed: {e}")
+                    result = {"ok": False, "error": str(e)}
+                with self._lock:
+                    self._results[name] = result
+            with self._lock:
+                self._ran = True
+                if all(r["ok"] for r in self._results.values()):
+                    return
+            time.sleep(self.retry_interval)
+    
+    def ready(self):
+        """Whether every check has passed"""
+        with self._lock:
+            return self._ran and all(r["ok"] for r in self._results.values())
+    
+    def status(self):
+        """Per-check results for health checks"""
+        with self._lock:
+            state = "pending" if not self._ran else "ready" if all(
+                r["ok"] for r in self._results.values()) else "failed"
+            return {"state": state, "checks": {name: dict(r) for name, r in self._results.items()}}
+
+
 # Utility function to check AWS credentials
 def check_aws_credentials():
     """Check if AWS credentials are configured"""
     try:
-        sts = boto3.client('sts')
+        sts = aws_client('sts')
         identity = sts.get_caller_identity()
         logger.info(f"AWS credentials valid. Account: {identity['Account']}")
         return True
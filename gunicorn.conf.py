@@ -0,0 +1,15 @@
+# Gunicorn settings, read by `gunicorn -c gunicorn.conf.py app:app`
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+threads = int(os.environ.get('GUNICORN_THREADS', 2))
+
+# Import the app once in the master so workers share its memory copy-on-write
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Background threads do not survive the fork, so each worker starts its own
+    from app import start_background_tasks
+    start_background_tasks()
@@ -96,6 +96,24 @@ resource "aws_dynamodb_table" "journal_entries" {
     type = "N"
   }
 
+  attribute {
+    name = "username"
+    type = "S"
+  }
+
+  attribute {
+    name = "timestamp"
+    type = "S"
+  }
+
+  # Per-user reads query this index, newest first, instead of scanning the table
+  global_secondary_index {
+    name            = "username-timestamp-index"
+    hash_key        = "username"
+    range_key       = "timestamp"
+    projection_type = "ALL"
+  }
+
   # Enable point-in-time recovery
   point_in_time_recovery {
     enabled = true
@@ -142,6 +160,7 @@ resource "aws_iam_role_policy" "app_policy" {
         Action = [
           "s3:GetObject",
           "s3:PutObject",
+          "s3:DeleteObject",
           "s3:ListBucket"
         ]
         Resource = [
@@ -153,12 +172,19 @@ resource "aws_iam_role_policy" "app_policy" {
         Effect = "Allow"
         Action = [
           "dynamodb:GetItem",
+          "dynamodb:BatchGetItem",
+          "dynamodb:BatchWriteItem",
           "dynamodb:PutItem",
+          "dynamodb:UpdateItem",
           "dynamodb:DeleteItem",
+          "dynamodb:DescribeTable",
           "dynamodb:Scan",
           "dynamodb:Query"
         ]
-        Resource = aws_dynamodb_table.journal_entries.arn
+        Resource = [
+          aws_dynamodb_table.journal_entries.arn,
+          "${aws_dynamodb_table.journal_entries.arn}/index/*"
+        ]
       }
     ]
   })
@@ -0,0 +1,193 @@
+import bisect
+import mmap
+import struct
+import threading
+import logging
+
+import journal_codec
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'GVJARC01'
+# Magic, header length, entry count
+_PREAMBLE = struct.Struct('<8sII')
+TIMESTAMP_WIDTH = 19  # "YYYY-mm-dd HH:MM:SS"
+# Short, repetitive string fields stored as uint16 codes into a per-segment string table
+CODED_FIELDS = ('username', 'focus', 'mood', 'energy')
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+class ArchiveSegment:
+    """Immutable, memory-mapped columnar file of cold journal entries
+
+    Layout, all sections 8-byte aligned and little-endian::
+
+        preamble   magic, header length, entry count
+        header     JSON string tables for the coded columns
+        ids        int64 per entry, ascending
+        timestamps 19 ASCII bytes per entry, zero bytes when absent
+        codes      uint16 per entry for each of CODED_FIELDS, 0 when absent
+        offsets    uint64 per entry + 1 into the text area
+        text       every other field of each entry as compact JSON
+
+    Column reads are zero-copy slices of the mapping, so paging by ID and
+    rolling up mood, energy and focus never parse an entry's text. A field
+    only goes in a column when it is a string of the right shape; anything
+    else stays in the entry's JSON so entries round-trip exactly.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, header_len, count = _PREAMBLE.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a journal archive segment")
+        pos = _PREAMBLE.size
+        header = journal_codec.loads(bytes(view[pos:pos + header_len]))
+        pos = _align(pos + header_len)
+        self._strings = {field: [None] + header['strings'][field] for field in CODED_FIELDS}
+        self._count = count
+        self._ids = view[pos:pos + 8 * count].cast('q')
+        pos += 8 * count
+        self._timestamps = view[pos:pos + TIMESTAMP_WIDTH * count]
+        pos = _align(pos + TIMESTAMP_WIDTH * count)
+        self._codes = {}
+        for field in CODED_FIELDS:
+            self._codes[field] = view[pos:pos + 2 * count].cast('H')
+            pos = _align(pos + 2 * count)
+        self._offsets = view[pos:pos + 8 * (count + 1)].cast('Q')
+        pos += 8 * (count + 1)
+        self._text = view[pos:]
+        self._views = [view, self._ids, self._timestamps, self._offsets, self._text] + list(self._codes.values())
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def ids(self):
+        """Entry IDs as a zero-copy int64 view, ascending"""
+        return self._ids
+
+    def _timestamp(self, i):
+        raw = self._timestamps[i * TIMESTAMP_WIDTH:(i + 1) * TIMESTAMP_WIDTH]
+        return None if raw[0] == 0 else bytes(raw).decode('ascii')
+
+    def _columns(self, i):
+        """Column fields of entry i, leaving out any kept in its JSON"""
+        fields = {'id': self._ids[i]}
+        timestamp = self._timestamp(i)
+        if timestamp is not None:
+            fields['timestamp'] = timestamp
+        for field in CODED_FIELDS:
+            code = self._codes[field][i]
+            if code:
+                fields[field] = self._strings[field][code]
+        return fields
+
+    def entry(self, i):
+        """Decode entry i in full"""
+        entry = self._columns(i)
+        start, end = self._offsets[i], self._offsets[i + 1]
+        if end > start:
+            entry.update(journal_codec.loads(bytes(self._text[start:end])))
+        return entry
+
+    def find(self, entry_id):
+        """Position of an entry ID, or None"""
+        i = bisect.bisect_left(self._ids, entry_id)
+        if i < self._count and self._ids[i] == entry_id:
+            return i
+        return None
+
+    def latest(self, limit, before_id=None, skip=()):
+        """Up to limit entries with IDs below before_id, newest first, skipping deleted IDs"""
+        end = self._count if before_id is None else bisect.bisect_left(self._ids, before_id)
+        page = []
+        for i in range(end - 1, -1, -1):
+            if len(page) >= limit:
+                break
+            if self._ids[i] not in skip:
+                page.append(self.entry(i))
+        return page
+
+    def entries(self, skip=()):
+        """Every entry in ID order, skipping deleted IDs"""
+        return [self.entry(i) for i in range(self._count) if self._ids[i] not in skip]
+
+    def summaries(self, skip=()):
+        """ID, timestamp, username, focus, mood and energy of every entry, read from the columns only"""
+        for i in range(self._count):
+            if self._ids[i] not in skip:
+                yield self._columns(i)
+
+    def close(self):
+        """Release the views and the mapping"""
+        for view in reversed(self._views):
+            view.release()
+        self._mmap.close()
+
+    @staticmethod
+    def encode(entries):
+        """Serialize entries, sorted by integer ID, into segment bytes"""
+        strings = {field: {} for field in CODED_FIELDS}
+        ids, timestamps, texts = [], [], []
+        codes = {field: [] for field in CODED_FIELDS}
+        for entry in entries:
+            rest = dict(entry)
+            ids.append(rest.pop('id'))
+            timestamp = rest.get('timestamp')
+            if isinstance(timestamp, str) and len(timestamp) == TIMESTAMP_WIDTH and timestamp.isascii():
+                timestamps.append(rest.pop('timestamp').encode('ascii'))
+            else:
+                timestamps.append(b'\0' * TIMESTAMP_WIDTH)
+            for field in CODED_FIELDS:
+                value = rest.get(field)
+                table = strings[field]
+                if isinstance(value, str) and (value in table or len(table) < 0xFFFF):
+                    codes[field].append(table.setdefault(rest.pop(field), len(table) + 1))
+                else:
+                    codes[field].append(0)
+            texts.append(journal_codec.dumps(rest).encode('utf-8') if rest else b'')
+
+        count = len(ids)
+        header = journal_codec.dumps({'strings': {field: list(table) for field, table in strings.items()}})
+        header = header.encode('utf-8')
+        parts = [_PREAMBLE.pack(MAGIC, len(header), count), header]
+
+        def pad():
+            size = sum(len(p) for p in parts)
+            parts.append(b'\0' * (_align(size) - size))
+
+        pad()
+        parts.append(struct.pack(f'<{count}q', *ids))
+        parts.append(b''.join(timestamps))
+        pad()
+        for field in CODED_FIELDS:
+            parts.append(struct.pack(f'<{count}H', *codes[field]))
+            pad()
+        offsets = [0]
+        for text in texts:
+            offsets.append(offsets[-1] + len(text))
+        parts.append(struct.pack(f'<{count + 1}Q', *offsets))
+        parts.extend(texts)
+        return b''.join(parts)
+
+
+class SegmentCache:
+    """Open segments shared by one store, reused until they drop out of its snapshot"""
+
+    def __init__(self):
+        self._segments = {}
+        self._lock = threading.Lock()
+
+    def open(self, paths):
+        """Open (or reuse) the segments at paths, dropping any no longer listed"""
+        with self._lock:
+            # A dropped segment is unmapped once no reader still holds it
+            self._segments = {path: self._segments.get(path) or ArchiveSegment(path) for path in paths}
+            return [self._segments[path] for path in paths]
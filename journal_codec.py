@@ -0,0 +1,183 @@
+import gc
+import json
+import os
+import sys
+import logging
+from contextlib import contextmanager
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Every field the app writes on an entry, in on-disk column order
+ENTRY_FIELDS = ('id', 'username', 'timestamp', 'date', 'time', 'focus', 'content', 'mood', 'energy',
+                'gratitude', 'action_item', 'tags', 'version')
+_FIELD_SET = frozenset(ENTRY_FIELDS)
+# Fields drawn from a small set of values, shared between entries once decoded
+_SHARED_FIELDS = ('username', 'date', 'focus', 'mood', 'energy', 'version')
+
+
+class JsonCodec:
+    """Compact JSON via the standard library"""
+
+    name = 'json'
+
+    @staticmethod
+    def dumps(obj, default=None):
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, default=default)
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    """Compact JSON via orjson, several times faster than the standard library"""
+
+    name = 'orjson'
+
+    @staticmethod
+    def dumps(obj, default=None):
+        return orjson.dumps(obj, default=default).decode()
+
+    @staticmethod
+    def loads(data):
+        return orjson.loads(data)
+
+
+CODECS = {'json': JsonCodec}
+if orjson is not None:
+    CODECS['orjson'] = OrjsonCodec
+
+
+def get_codec(name=None):
+    """Look up a codec by name; 'auto' picks orjson when it is installed"""
+    name = name or os.environ.get('JOURNAL_CODEC', 'auto')
+    if name == 'auto':
+        return OrjsonCodec if orjson is not None else JsonCodec
+    if name not in CODECS:
+        logger.warning(f"Journal codec {name!r} is not available, using json")
+        return JsonCodec
+    return CODECS[name]
+
+
+codec = get_codec()
+
+
+def set_codec(name):
+    """Switch the codec used by dumps() and loads()"""
+    global codec
+    codec = get_codec(name)
+    return codec
+
+
+def dumps(obj, default=None):
+    """Encode obj as compact JSON text with the current codec"""
+    return codec.dumps(obj, default)
+
+
+def loads(data):
+    """Decode JSON text or bytes with the current codec"""
+    return codec.loads(data)
+
+
+@contextmanager
+def gc_paused():
+    """Pause the cyclic garbage collector while decoding many small objects
+
+    Decoding a large journal allocates hundreds of thousands of lists and
+    strings, none of them cyclic, and each batch of allocations would
+    otherwise trigger a collection pass over everything allocated so far.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class JournalEntry:
+    """Journal entry held in slots rather than a per-entry dict
+
+    Large journals keep thousands of entries in memory, and a dict repeating
+    the same keys for each costs several times more than fixed slots. Fields
+    an entry never had stay unset, so to_dict() round-trips it exactly, and
+    keys outside ENTRY_FIELDS are kept in ``extra``.
+    """
+
+    __slots__ = ENTRY_FIELDS + ('extra',)
+
+    def __init__(self, id=None, username=None, timestamp=None, date=None, time=None, focus=None, content=None,
+                 mood=None, energy=None, gratitude=None, action_item=None, tags=None, version=None):
+        self.id = id
+        self.username = username
+        self.timestamp = timestamp
+        self.date = date
+        self.time = time
+        self.focus = focus
+        self.content = content
+        self.mood = mood
+        self.energy = energy
+        self.gratitude = gratitude
+        self.action_item = action_item
+        self.tags = tags
+        self.version = version
+        self.extra = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build an entry from a dict, keeping exactly the keys it has"""
+        if len(data) == len(ENTRY_FIELDS) and _FIELD_SET.issuperset(data):
+            return cls(**data)
+        entry = cls.__new__(cls)
+        entry.extra = None
+        for key, value in data.items():
+            if key in _FIELD_SET:
+                setattr(entry, key, value)
+            else:
+                if entry.extra is None:
+                    entry.extra = {}
+                entry.extra[key] = value
+        return entry
+
+    @classmethod
+    def decode(cls, item):
+        """Build an entry from its on-disk form, a row in ENTRY_FIELDS order or a plain object"""
+        entry = cls(*item) if isinstance(item, list) else cls.from_dict(item)
+        for field in _SHARED_FIELDS:
+            value = getattr(entry, field, None)
+            if type(value) is str:
+                setattr(entry, field, sys.intern(value))
+        return entry
+
+    def encode(self):
+        """On-disk form: a bare row when the entry has exactly ENTRY_FIELDS, else an object"""
+        if self.extra is None:
+            try:
+                return [getattr(self, field) for field in ENTRY_FIELDS]
+            except AttributeError:
+                pass
+        return self.to_dict()
+
+    def to_dict(self):
+        """The entry as a plain dict, as the rest of the app uses it"""
+        data = {}
+        for field in ENTRY_FIELDS:
+            try:
+                data[field] = getattr(self, field)
+            except AttributeError:
+                continue
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def get(self, key, default=None):
+        """Read a field like dict.get, for code that handles both forms"""
+        if key in _FIELD_SET:
+            return getattr(self, key, default)
+        return (self.extra or {}).get(key, default)
@@ -0,0 +1,130 @@
+from collections import OrderedDict
+import threading
+import logging
+
+from journal_store import SQLiteConnections
+
+logger = logging.getLogger(__name__)
+
+
+class FragmentCache:
+    """Rendered HTML fragments keyed by entry ID and version, evicted least recently used
+
+    Entries never change once written, so a card rendered for one request can
+    be reused by every later one as long as the version it was rendered for
+    still matches. Memory is bounded by the total size of the fragments held.
+    With a path, fragments are also kept in SQLite, so they survive restarts
+    and are shared between workers; only the latest version of each entry is
+    stored there, which keeps the file no bigger than the journal.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS journal_fragments (
+            entry_id INTEGER PRIMARY KEY,
+            version TEXT NOT NULL,
+            html TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, path=None):
+        self.max_bytes = max_bytes
+        self.path = path
+        self._fragments = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._connections = None
+        if path:
+            self._connections = SQLiteConnections(path)
+            with self._connections.get() as conn:
+                conn.executescript(self.SCHEMA)
+
+    def get_many(self, keys):
+        """Cached fragments for (entry_id, version) pairs, as a dict by entry ID"""
+        found, missing = {}, []
+        with self._lock:
+            for entry_id, version in keys:
+                cached = self._fragments.get(entry_id)
+                if cached is not None and cached[0] == version:
+                    self._fragments.move_to_end(entry_id)
+                    found[entry_id] = cached[1]
+                    self._stats["hits"] += 1
+                else:
+                    missing.append((entry_id, version))
+        if missing and self._connections:
+            on_disk = self._read(missing)
+            if on_disk:
+                self._remember(on_disk)
+                found.update((entry_id, html) for entry_id, (version, html) in on_disk.items())
+                with self._lock:
+                    self._stats["disk_hits"] += len(on_disk)
+            missing = [key for key in missing if key[0] not in on_disk]
+        with self._lock:
+            self._stats["misses"] += len(missing)
+        return found
+
+    def put_many(self, fragments):
+        """Store rendered fragments given as (entry_id, version, html)"""
+        if not fragments:
+            return
+        self._remember({entry_id: (version, html) for entry_id, version, html in fragments})
+        if self._connections:
+            try:
+                with self._connections.get() as conn:
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO journal_fragments (entry_id, version, html) VALUES (?, ?, ?)',
+                        fragments)
+            except Exception as e:
+                # The cache is an optimization; a failed write only costs a re-render later
+                logger.warning(f"Failed to persist {len(fragments)} rendered fragments: {e}")
+
+    def _read(self, keys):
+        """Fragments on disk whose stored version matches the one asked for"""
+        wanted = dict(keys)
+        found = {}
+        try:
+            ids = list(wanted)
+            # Stay well under SQLite's bound parameter limit
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows = self._connections.get().execute(
+                    f"SELECT entry_id, version, html FROM journal_fragments "
+                    f"WHERE entry_id IN ({','.join('?' * len(chunk))})", chunk)
+                for entry_id, version, html in rows:
+                    if wanted.get(entry_id) == version:
+                        found[entry_id] = (version, html)
+        except Exception as e:
+            logger.warning(f"Failed to read rendered fragments: {e}")
+        return found
+
+    def _remember(self, fragments):
+        """Add fragments to the in-memory LRU, evicting the oldest past max_bytes"""
+        with self._lock:
+            for entry_id, (version, html) in fragments.items():
+                size = len(html.encode('utf-8'))
+                if size > self.max_bytes:
+                    continue
+                previous = self._fragments.pop(entry_id, None)
+                if previous is not None:
+                    self._size -= previous[2]
+                self._fragments[entry_id] = (version, html, size)
+                self._size += size
+            while self._size > self.max_bytes:
+                _, (_, _, size) = self._fragments.popitem(last=False)
+                self._size -= size
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        """Drop every cached fragment, in memory and on disk"""
+        with self._lock:
+            self._fragments.clear()
+            self._size = 0
+        if self._connections:
+            with self._connections.get() as conn:
+                conn.execute('DELETE FROM journal_fragments')
+
+    def status(self):
+        """Hit, miss and eviction counts plus what is held in memory"""
+        with self._lock:
+            return dict(self._stats, fragments=len(self._fragments), bytes=self._size,
+                        max_bytes=self.max_bytes, persistent=bool(self._connections))
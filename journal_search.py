@@ -0,0 +1,214 @@
+import hashlib
+import re
+import sqlite3
+import logging
+
+import journal_codec
+from journal_store import SQLiteConnections
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Split text into lowercase search terms"""
+    return [token.lower() for token in _TOKEN.findall(text or '')]
+
+
+class JournalSearchIndex:
+    """Full-text search index over journal entries
+
+    Backed by an SQLite FTS5 table, which gives an inverted index with BM25
+    ranking and prefix lookups, shared by every gunicorn worker and updated
+    one entry at a time. Each row carries an owner token derived from the
+    username, so a query intersects with that user's postings only. The
+    entry itself is stored alongside so results need no second lookup.
+    """
+
+    SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS entry_search USING fts5(
+            owner, focus, content, tags, gratitude, action_item,
+            entry UNINDEXED,
+            prefix='2 3'
+        );
+    """
+    # BM25 column weights in schema order; owner only filters
+    WEIGHTS = (0.0, 1.0, 1.0, 2.0, 1.0, 1.0)
+    TEXT_COLUMNS = 'focus content tags gratitude action_item'
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._connections = SQLiteConnections(db_path)
+        with self._connections.get() as conn:
+            conn.executescript(self.SCHEMA)
+
+    @staticmethod
+    def _owner_token(username):
+        # A single alphanumeric token survives the tokenizer for any username
+        return 'u' + hashlib.sha1((username or '').encode('utf-8')).hexdigest()[:20]
+
+    def _row(self, entry):
+        return (
+            int(entry['id']),
+            self._owner_token(entry.get('username')),
+            entry.get('focus') or '',
+            entry.get('content') or '',
+            ' '.join(entry.get('tags') or []),
+            ' '.join(entry.get('gratitude') or []),
+            entry.get('action_item') or '',
+            journal_codec.dumps(entry, default=str),
+        )
+
+    def _insert(self, conn, entries):
+        rows = [self._row(entry) for entry in entries]
+        conn.executemany('DELETE FROM entry_search WHERE rowid = ?', [(row[0],) for row in rows])
+        conn.executemany(
+            'INSERT INTO entry_search (rowid, owner, focus, content, tags, gratitude, action_item, entry) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def add_entry(self, entry):
+        """Index one new or changed entry"""
+        with self._connections.get() as conn:
+            self._insert(conn, [entry])
+
+    def remove_entry(self, entry_id):
+        """Drop an entry from the index"""
+        with self._connections.get() as conn:
+            conn.execute('DELETE FROM entry_search WHERE rowid = ?', (int(entry_id),))
+
+    def rebuild(self, entries):
+        """Replace the whole index with the given entries, returning how many were indexed"""
+        count = 0
+        with self._connections.get() as conn:
+            conn.execute('DELETE FROM entry_search')
+            batch = []
+            for entry in entries:
+                batch.append(entry)
+                if len(batch) >= 500:
+                    self._insert(conn, batch)
+                    count += len(batch)
+                    batch = []
+            self._insert(conn, batch)
+            count += len(batch)
+            conn.execute("INSERT INTO entry_search (entry_search) VALUES ('optimize')")
+        return count
+
+    def search(self, username, query, limit=20):
+        """Find a user's entries matching every query term as a prefix, best first"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # Terms are \w+ only, so quoting them is enough to keep FTS syntax out
+        terms = ' AND '.join(f'"{term}"*' for term in terms)
+        match = f'owner:"{self._owner_token(username)}" AND {{{self.TEXT_COLUMNS}}}: ({terms})'
+        weights = ', '.join(str(w) for w in self.WEIGHTS)
+        try:
+            rows = self._connections.get().execute(
+                f'SELECT entry FROM entry_search WHERE entry_search MATCH ? '
+                f'ORDER BY bm25(entry_search, {weights}) LIMIT ?', (match, limit)).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Search failed for query {query!r}: {e}")
+            return []
+        return [journal_codec.loads(row[0]) for row in rows]
+
+
+class JournalTagIndex:
+    """Per-user tag index with precomputed tag counts
+
+    Maps (username, tag) to entry IDs and keeps a running count per tag,
+    both updated as entries are written, so tag filters and facet counts
+    never rescan entries. Tags are matched case-insensitively.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tag_entries (
+            username TEXT NOT NULL,
+            tag TEXT NOT NULL,
+            entry_id INTEGER NOT NULL,
+            PRIMARY KEY (username, tag, entry_id)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS tag_counts (
+            username TEXT NOT NULL,
+            tag TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (username, tag)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._connections = SQLiteConnections(db_path)
+        with self._connections.get() as conn:
+            conn.executescript(self.SCHEMA)
+
+    @staticmethod
+    def _normalize(tags):
+        return sorted({tag.strip().lower() for tag in tags or [] if tag and tag.strip()})
+
+    def _insert(self, conn, entry):
+        username = entry.get('username') or ''
+        for tag in self._normalize(entry.get('tags')):
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO tag_entries (username, tag, entry_id) VALUES (?, ?, ?)',
+                (username, tag, int(entry['id'])))
+            if cursor.rowcount:
+                conn.execute(
+                    'INSERT INTO tag_counts (username, tag, count) VALUES (?, ?, 1) '
+                    'ON CONFLICT (username, tag) DO UPDATE SET count = count + 1', (username, tag))
+
+    def add_entry(self, entry):
+        """Index a new entry's tags and bump their counts"""
+        with self._connections.get() as conn:
+            self._insert(conn, entry)
+
+    def remove_entry(self, entry_id, username):
+        """Drop an entry from the index and decrement its tags' counts"""
+        username = username or ''
+        with self._connections.get() as conn:
+            tags = [row[0] for row in conn.execute(
+                'SELECT tag FROM tag_entries WHERE username = ? AND entry_id = ?', (username, int(entry_id)))]
+            conn.execute('DELETE FROM tag_entries WHERE username = ? AND entry_id = ?', (username, int(entry_id)))
+            conn.executemany(
+                'UPDATE tag_counts SET count = count - 1 WHERE username = ? AND tag = ?',
+                [(username, tag) for tag in tags])
+            conn.execute('DELETE FROM tag_counts WHERE username = ? AND count <= 0', (username,))
+
+    def rebuild(self, entries):
+        """Replace the whole index with the given entries, returning how many were indexed"""
+        count = 0
+        with self._connections.get() as conn:
+            conn.execute('DELETE FROM tag_entries')
+            conn.execute('DELETE FROM tag_counts')
+            for entry in entries:
+                self._insert(conn, entry)
+                count += 1
+        return count
+
+    def facets(self, username):
+        """A user's tags with their entry counts, most used first"""
+        rows = self._connections.get().execute(
+            'SELECT tag, count FROM tag_counts WHERE username = ? ORDER BY count DESC, tag',
+            (username or '',))
+        return [{"tag": tag, "count": count} for tag, count in rows]
+
+    def entry_ids(self, username, tags, mode='and', limit=None, before_id=None):
+        """IDs of a user's entries having all (mode='and') or any (mode='or') of the tags, newest first"""
+        tags = self._normalize(tags)
+        if not tags:
+            return []
+        placeholders = ', '.join('?' for _ in tags)
+        sql = f'SELECT entry_id FROM tag_entries WHERE username = ? AND tag IN ({placeholders})'
+        params = [username or ''] + tags
+        if before_id is not None:
+            sql += ' AND entry_id < ?'
+            params.append(int(before_id))
+        sql += ' GROUP BY entry_id'
+        if mode == 'and':
+            sql += ' HAVING COUNT(*) = ?'
+            params.append(len(tags))
+        sql += ' ORDER BY entry_id DESC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+        return [row[0] for row in self._connections.get().execute(sql, params)]
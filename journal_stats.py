@@ -0,0 +1,150 @@
+from datetime import date, datetime, timedelta
+import logging
+
+from journal_store import SQLiteConnections
+
+logger = logging.getLogger(__name__)
+
+MOOD_SCORES = {"excellent": 5, "good": 4, "okay": 3, "bad": 2, "awful": 1}
+ENERGY_SCORES = {"High": 3, "Medium": 2, "Low": 1}
+PERIODS = ("day", "week", "month")
+
+
+def entry_buckets(entry):
+    """The day, week and month buckets an entry falls into, or None if it has no usable timestamp"""
+    try:
+        written = datetime.strptime(entry.get('timestamp') or '', "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None
+    year, week, _ = written.isocalendar()
+    return {
+        "day": written.strftime("%Y-%m-%d"),
+        "week": f"{year}-W{week:02d}",
+        "month": written.strftime("%Y-%m"),
+    }
+
+
+class JournalRollups:
+    """Per-user mood, energy and focus rollups by day, week and month
+
+    Each entry adds its mood and energy scores and its focus to one bucket
+    per period as it is written, so reading trends costs one row per bucket
+    no matter how many entries a user has.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS rollups (
+            username TEXT NOT NULL,
+            period TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            entries INTEGER NOT NULL DEFAULT 0,
+            mood_total INTEGER NOT NULL DEFAULT 0,
+            mood_count INTEGER NOT NULL DEFAULT 0,
+            energy_total INTEGER NOT NULL DEFAULT 0,
+            energy_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (username, period, bucket)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS rollup_focus (
+            username TEXT NOT NULL,
+            period TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            focus TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (username, period, bucket, focus)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._connections = SQLiteConnections(db_path)
+        with self._connections.get() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _apply(self, conn, entry, sign):
+        """Add (sign=1) or subtract (sign=-1) an entry from its buckets"""
+        buckets = entry_buckets(entry)
+        if buckets is None:
+            return False
+        username = entry.get('username') or ''
+        mood = MOOD_SCORES.get(entry.get('mood'))
+        energy = ENERGY_SCORES.get(entry.get('energy'))
+        for period, bucket in buckets.items():
+            conn.execute(
+                'INSERT INTO rollups (username, period, bucket, entries, mood_total, mood_count, '
+                'energy_total, energy_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (username, period, bucket) DO UPDATE SET '
+                'entries = entries + excluded.entries, '
+                'mood_total = mood_total + excluded.mood_total, mood_count = mood_count + excluded.mood_count, '
+                'energy_total = energy_total + excluded.energy_total, '
+                'energy_count = energy_count + excluded.energy_count',
+                (username, period, bucket, sign, sign * (mood or 0), sign * (mood is not None),
+                 sign * (energy or 0), sign * (energy is not None)))
+            if entry.get('focus'):
+                conn.execute(
+                    'INSERT INTO rollup_focus (username, period, bucket, focus, count) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT (username, period, bucket, focus) DO UPDATE SET count = count + excluded.count',
+                    (username, period, bucket, entry['focus'], sign))
+        return True
+
+    def add_entry(self, entry):
+        """Fold a new entry into its day, week and month buckets"""
+        with self._connections.get() as conn:
+            self._apply(conn, entry, 1)
+
+    def remove_entry(self, entry):
+        """Take a deleted entry back out of its buckets"""
+        with self._connections.get() as conn:
+            self._apply(conn, entry, -1)
+            conn.execute('DELETE FROM rollups WHERE entries <= 0')
+            conn.execute('DELETE FROM rollup_focus WHERE count <= 0')
+
+    def rebuild(self, entries):
+        """Backfill rollups from existing entries, returning how many were counted"""
+        count = 0
+        with self._connections.get() as conn:
+            conn.execute('DELETE FROM rollups')
+            conn.execute('DELETE FROM rollup_focus')
+            for entry in entries:
+                count += self._apply(conn, entry, 1)
+        return count
+
+    def buckets(self, username, period='week', limit=12):
+        """The most recent buckets for a period, oldest first, with averages and focus counts"""
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period: {period}")
+        conn = self._connections.get()
+        rows = conn.execute(
+            'SELECT bucket, entries, mood_total, mood_count, energy_total, energy_count FROM rollups '
+            'WHERE username = ? AND period = ? ORDER BY bucket DESC LIMIT ?',
+            (username or '', period, limit)).fetchall()
+        if not rows:
+            return []
+        focus = {}
+        for bucket, name, count in conn.execute(
+                'SELECT bucket, focus, count FROM rollup_focus '
+                'WHERE username = ? AND period = ? AND bucket >= ? AND count > 0',
+                (username or '', period, rows[-1][0])):
+            focus.setdefault(bucket, {})[name] = count
+        return [{
+            "bucket": bucket,
+            "entries": entries,
+            "avg_mood": round(mood_total / mood_count, 2) if mood_count else None,
+            "avg_energy": round(energy_total / energy_count, 2) if energy_count else None,
+            "focus": focus.get(bucket, {}),
+        } for bucket, entries, mood_total, mood_count, energy_total, energy_count in reversed(rows)]
+
+    def streaks(self, username, today=None):
+        """Current and longest runs of consecutive days with at least one entry"""
+        days = [date.fromisoformat(row[0]) for row in self._connections.get().execute(
+            "SELECT bucket FROM rollups WHERE username = ? AND period = 'day' AND entries > 0 ORDER BY bucket",
+            (username or '',))]
+        longest = run = 0
+        previous = None
+        for day in days:
+            run = run + 1 if previous and day - previous == timedelta(days=1) else 1
+            longest = max(longest, run)
+            previous = day
+        today = today or date.today()
+        # A streak is still alive until a whole day passes without an entry
+        current = run if previous and today - previous <= timedelta(days=1) else 0
+        return {"current": current, "longest": longest}
@@ -0,0 +1,807 @@
+import bisect
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from urllib.parse import quote
+import logging
+
+import journal_codec
+from journal_archive import ArchiveSegment, SegmentCache
+from journal_codec import ENTRY_FIELDS, JournalEntry, gc_paused
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Only used where flock is unavailable, so locking is per-process there
+_fallback_lock = threading.RLock()
+
+# Snapshots are written with the generation as their first key
+_GENERATION_PREFIX = re.compile(r'\{"generation":(\d+)')
+
+
+class LocalJournalStore:
+    """Append-only local storage for journal entries
+
+    Entries live in a compacted JSON snapshot (``path``) plus a JSONL log of
+    changes made since that snapshot (``path + '.log'``). The snapshot stores
+    each entry as a bare row in ENTRY_FIELDS order rather than repeating its
+    keys, and entries are held in memory as slot-based JournalEntry objects.
+    Adding an entry is a single small append to the log; once the log grows
+    past ``compact_threshold`` bytes it is folded back into the snapshot by a
+    background thread.
+
+    With ``archive_after_days`` set, compaction also moves the oldest entries
+    past that age into an immutable memory-mapped ArchiveSegment listed in
+    the snapshot, so only the hot tail is parsed into Python objects. Cold
+    entries are deleted by ID in the snapshot rather than rewritten.
+
+    The first log line is a header carrying the snapshot generation it
+    belongs to and the next free entry ID. Compaction writes the new snapshot
+    before resetting the log, so a crash in between leaves a log whose
+    generation is older than the snapshot and is ignored on the next read.
+    A torn trailing line from a crash mid-append is dropped on read and
+    trimmed off before the next append.
+    """
+
+    def __init__(self, path, compact_threshold=1024 * 1024, archive_after_days=None):
+        self.path = path
+        self.log_path = path + '.log'
+        self.lock_path = path + '.lock'
+        self.compact_threshold = compact_threshold
+        self.archive_after_days = archive_after_days
+        self._compaction_thread = None
+        self._cache = FileCache()
+        self._segments = SegmentCache()
+
+    def _locked(self, shared=False):
+        return file_lock(self.lock_path, shared)
+
+    def exists(self):
+        """Check whether the store has any data on disk"""
+        return os.path.exists(self.path) or os.path.exists(self.log_path)
+
+    def _read_snapshot(self):
+        """Read the compacted snapshot, returning (generation, entries, next_id, archive)"""
+        if not os.path.exists(self.path):
+            return 0, [], 1, _empty_archive()
+        with gc_paused():
+            try:
+                with open(self.path, 'rb') as f:
+                    data = journal_codec.loads(f.read())
+            except ValueError:
+                logger.error(f"Journal snapshot {self.path} is corrupt, ignoring it")
+                return 0, [], 1, _empty_archive()
+            # Journals written before the log existed are a bare list of entries
+            if isinstance(data, list):
+                entries = [JournalEntry.from_dict(e) for e in data]
+                return 0, entries, _next_free_id(entries), _empty_archive()
+            entries = _decode_entries(data.get('entries', []), data.get('fields'))
+        archive = dict(_empty_archive(), **data.get('archive', {}))
+        return data.get('generation', 0), entries, data.get('next_id') or _next_free_id(entries), archive
+
+    def _read_log(self):
+        """Read the log, returning (header, records) without any torn tail"""
+        if not os.path.exists(self.log_path):
+            return None, []
+        with open(self.log_path, 'r', encoding='utf-8') as f:
+            lines = f.read().split('\n')
+        # Anything after the final newline is an incomplete append
+        lines = lines[:-1]
+        header = None
+        records = []
+        for line in lines:
+            if not line:
+                continue
+            record = journal_codec.loads(line)
+            if 'op' in record:
+                records.append(record)
+            else:
+                header = record
+        return header, records
+
+    def _load(self):
+        """Replay the log over the snapshot, returning (generation, entries, next_id, archive)"""
+        generation, entries, next_id, archive = self._read_snapshot()
+        header, records = self._read_log()
+        if header is None or header.get('generation', 0) < generation:
+            # Log predates the current snapshot (or is missing entirely)
+            records = []
+
+        deleted = set()
+        for record in records:
+            if record['op'] == 'add':
+                entries.append(JournalEntry.from_dict(record['entry']))
+            elif record['op'] == 'delete':
+                deleted.add(record['id'])
+            next_id = record['next_id']
+        if deleted:
+            hot_ids = {e.id for e in entries}
+            entries = [e for e in entries if e.id not in deleted]
+            if archive['segments']:
+                archive['deleted'] = archive['deleted'] + sorted(deleted - hot_ids)
+        return generation, entries, next_id, archive
+
+    def get_all_entries(self):
+        """Retrieve all journal entries ordered by ID
+
+        Parsed entries are cached until the snapshot or log changes on disk,
+        whichever worker changed it; callers get their own dict copies.
+        """
+        entries, _, segments, deleted = self._cached()
+        cold = [e for segment in segments for e in segment.entries(deleted)]
+        return cold + [e.to_dict() for e in entries]
+
+    def get_latest_entries(self, limit, before_id=None):
+        """Retrieve up to limit entries with IDs below before_id, newest first"""
+        entries, ids, segments, deleted = self._cached()
+        end = len(ids) if before_id is None else bisect.bisect_left(ids, before_id)
+        page = [e.to_dict() for e in entries[max(0, end - limit):end][::-1]]
+        # Archived IDs all sit below the hot ones, so older pages continue into the segments
+        for segment in reversed(segments):
+            if len(page) >= limit:
+                break
+            page.extend(segment.latest(limit - len(page), before_id, deleted))
+        return page
+
+    def get_entries_by_ids(self, entry_ids):
+        """Retrieve the entries with the given IDs, in the order given"""
+        entries, ids, segments, deleted = self._cached()
+        found = []
+        for entry_id in entry_ids:
+            i = bisect.bisect_left(ids, entry_id)
+            if i < len(ids) and ids[i] == entry_id:
+                found.append(entries[i].to_dict())
+            elif entry_id not in deleted:
+                for segment in segments:
+                    j = segment.find(entry_id)
+                    if j is not None:
+                        found.append(segment.entry(j))
+                        break
+        return found
+
+    def get_entry_summaries(self):
+        """ID, timestamp, username, focus, mood and energy of every entry, without decoding archived text"""
+        entries, _, segments, deleted = self._cached()
+        for segment in segments:
+            yield from segment.summaries(deleted)
+        for entry in entries:
+            yield entry.to_dict()
+
+    def _cached(self):
+        """Cached (entries, ids, segments, deleted IDs), with hot entries sorted by ID"""
+        return self._cache.get(self.path, [self.path, self.log_path], self._load_locked)
+
+    def _load_locked(self):
+        with self._locked(shared=True):
+            _, entries, _, archive = self._load()
+            segments = self._segments.open([self._segment_path(name) for name in archive['segments']])
+        # Concurrent writers can append slightly out of order
+        entries.sort(key=_entry_id)
+        return entries, [_entry_id(e) for e in entries], segments, frozenset(archive['deleted'])
+
+    def _segment_path(self, name):
+        return os.path.join(os.path.dirname(self.path), name)
+
+    def _last_log_line(self):
+        """Return the last complete log line, trimming any torn tail first"""
+        with open(self.log_path, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            window = 4096
+            while True:
+                start = max(0, size - window)
+                f.seek(start)
+                lines = f.read().split(b'\n')
+                # lines[-2] is only known to be complete once a newline precedes it
+                if len(lines) >= 3 or start == 0:
+                    break
+                window *= 2
+            if lines[-1]:
+                logger.warning(f"Trimming torn record from {self.log_path}")
+                f.truncate(size - len(lines[-1]))
+            return lines[-2].decode() if len(lines) >= 2 else None
+
+    def _snapshot_generation(self):
+        """Read the snapshot generation from the head of the file"""
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, 'r', encoding='utf-8', errors='replace') as f:
+            head = f.read(64)
+        match = _GENERATION_PREFIX.match(head)
+        if match:
+            return int(match.group(1))
+        if head.lstrip().startswith('['):
+            return 0
+        return self._read_snapshot()[0]
+
+    def _next_id(self):
+        """Find the next free entry ID from the log, resetting a missing or stale log"""
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'r', encoding='utf-8') as f:
+                header = f.readline()
+            if header.endswith('\n') and journal_codec.loads(header).get('generation', 0) >= self._snapshot_generation():
+                return journal_codec.loads(self._last_log_line())['next_id']
+        generation, _, next_id, _ = self._load()
+        atomic_write(self.log_path, self._encode({'generation': generation, 'next_id': next_id}) + '\n')
+        return next_id
+
+    def _append(self, record):
+        """Append one record to the log and flush it to disk"""
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(self._encode(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def add_entry(self, entry):
+        """Append a journal entry, assigning it the next free ID unless it has one"""
+        with self._locked():
+            next_id = self._next_id()
+            if entry.get('id') is None:
+                entry = dict(entry, id=next_id)
+            self._append({'op': 'add', 'next_id': max(next_id, entry['id'] + 1), 'entry': entry})
+        self._maybe_compact()
+        return entry
+
+    def delete_entry(self, entry_id):
+        """Record the deletion of a journal entry"""
+        with self._locked():
+            next_id = self._next_id()
+            self._append({'op': 'delete', 'next_id': next_id, 'id': entry_id})
+        self._maybe_compact()
+        return True
+
+    def replace_all(self, entries):
+        """Replace the whole journal, e.g. after restoring from a backup"""
+        with self._locked():
+            entries = [JournalEntry.from_dict(e) for e in entries]
+            self._write_generation(self._snapshot_generation() + 1, entries, _next_free_id(entries),
+                                   _empty_archive())
+
+    def compact(self):
+        """Fold the log into a new snapshot and start an empty log, archiving cold entries"""
+        with self._locked():
+            generation, entries, next_id, archive = self._load()
+            if self.archive_after_days is not None:
+                entries = self._archive_cold(entries, generation + 1, archive)
+            self._write_generation(generation + 1, entries, next_id, archive)
+        logger.info(f"Compacted journal {self.path} ({len(entries)} hot entries)")
+
+    def _archive_cold(self, entries, generation, archive):
+        """Write the oldest entries past the archive age to a new segment, returning the rest"""
+        cutoff = (datetime.now() - timedelta(days=self.archive_after_days)).strftime("%Y-%m-%d %H:%M:%S")
+        entries = sorted(entries, key=_entry_id)
+        # Only a prefix by ID is archived, so every archived ID stays below every hot one
+        count = 0
+        for entry in entries:
+            timestamp = entry.get('timestamp')
+            if not isinstance(entry.get('id'), int) or not isinstance(timestamp, str) or timestamp >= cutoff:
+                break
+            count += 1
+        if not count:
+            return entries
+        name = f"{os.path.basename(self.path)}.{generation}.seg"
+        atomic_write(self._segment_path(name), ArchiveSegment.encode(e.to_dict() for e in entries[:count]))
+        archive['segments'] = archive['segments'] + [name]
+        logger.info(f"Archived {count} entries from {self.path} to {name}")
+        return entries[count:]
+
+    def _write_generation(self, generation, entries, next_id, archive):
+        # Snapshot first: until the log is reset it is older than the snapshot and ignored
+        atomic_write(self.path, self._encode({'generation': generation, 'next_id': next_id,
+                                              'fields': ENTRY_FIELDS, 'entries': [e.encode() for e in entries],
+                                              'archive': archive}))
+        atomic_write(self.log_path, self._encode({'generation': generation, 'next_id': next_id}) + '\n')
+        self._remove_unlisted_segments(archive['segments'])
+
+    def _remove_unlisted_segments(self, names):
+        """Delete segment files the current snapshot no longer lists (caller holds the lock)"""
+        pattern = re.compile(re.escape(os.path.basename(self.path)) + r'\.\d+\.seg')
+        directory = os.path.dirname(self.path) or '.'
+        for filename in os.listdir(directory):
+            if pattern.fullmatch(filename) and filename not in names:
+                os.remove(os.path.join(directory, filename))
+
+    def _maybe_compact(self):
+        """Start a background compaction once the log is big enough"""
+        try:
+            if os.path.getsize(self.log_path) < self.compact_threshold:
+                return
+        except OSError:
+            return
+        if self._compaction_thread and self._compaction_thread.is_alive():
+            return
+        self._compaction_thread = threading.Thread(target=self._compact_quietly, daemon=True)
+        self._compaction_thread.start()
+
+    def _compact_quietly(self):
+        try:
+            self.compact()
+        except Exception as e:
+            logger.error(f"Background compaction of {self.path} failed: {e}")
+
+    @staticmethod
+    def _encode(obj):
+        return journal_codec.dumps(obj)
+
+
+class PartitionedJournalStore:
+    """Local journal storage partitioned into one append-only store per user
+
+    Each user's entries live in their own LocalJournalStore under
+    ``<journal>_partitions/``, so reading or writing one user's journal never
+    touches anyone else's data. Entry IDs stay unique across partitions via
+    a shared counter file. An existing single-file journal at ``path`` is
+    split into partitions the first time the store is used and then left in
+    place untouched. Only the max_partitions most recently used partitions
+    are kept open with their parsed entries, so a long-running worker holds
+    its active users' journals rather than everyone's.
+    """
+
+    SHARED_PARTITION = 'unassigned'
+    # Longest partition name used as is; leaves room under the 255-byte file name
+    # limit for the suffixes of the log, lock, archive segment and temp files
+    MAX_PARTITION_NAME = 120
+
+    def __init__(self, path, compact_threshold=1024 * 1024, archive_after_days=None, max_partitions=256):
+        self.path = path
+        self.compact_threshold = compact_threshold
+        self.archive_after_days = archive_after_days
+        self.max_partitions = max_partitions
+        self.partition_dir = os.path.splitext(path)[0] + '_partitions'
+        self.lock_path = self.partition_dir + '.lock'
+        self.counter_path = os.path.join(self.partition_dir, 'next_id')
+        self.marker_path = os.path.join(self.partition_dir, '.migrated')
+        self._partitions = OrderedDict()
+        self._partitions_lock = threading.Lock()
+        self._migrated = False
+
+    def exists(self):
+        """Check whether the store has any data on disk"""
+        return os.path.exists(self.marker_path) or os.path.exists(self.path)
+
+    def _ensure_migrated(self):
+        """Split a legacy single-file journal into per-user partitions once"""
+        if self._migrated or os.path.exists(self.marker_path):
+            self._migrated = True
+            return
+        with file_lock(self.lock_path):
+            if not os.path.exists(self.marker_path):
+                entries = LocalJournalStore(self.path).get_all_entries() if os.path.exists(self.path) else []
+                self._write_partitions(entries)
+                logger.info(f"Partitioned {len(entries)} journal entries from {self.path}")
+        self._migrated = True
+
+    def _write_partitions(self, entries):
+        """Replace every partition with the given entries (caller holds the lock)"""
+        os.makedirs(self.partition_dir, exist_ok=True)
+        by_partition = {}
+        for entry in entries:
+            by_partition.setdefault(self._partition_name(entry.get('username')), []).append(entry)
+        for name in set(self._partition_names()) | set(by_partition):
+            self._partition(name).replace_all(by_partition.get(name, []))
+        atomic_write(self.counter_path, str(_next_free_id(entries)))
+        atomic_write(self.marker_path, '')
+
+    @classmethod
+    def _partition_name(cls, username):
+        if not username:
+            return cls.SHARED_PARTITION
+        # Prefix keeps user partitions apart from the shared one; quoting keeps names path-safe
+        name = 'user_' + quote(username, safe='')
+        if len(name) > cls.MAX_PARTITION_NAME:
+            # Quoting can grow a name ninefold, so long ones keep a readable head plus a hash
+            digest = hashlib.sha1(username.encode('utf-8')).hexdigest()
+            name = name[:cls.MAX_PARTITION_NAME - len(digest) - 1] + '_' + digest
+        return name
+
+    def _partition(self, name):
+        with self._partitions_lock:
+            store = self._partitions.get(name)
+            if store is None:
+                store = LocalJournalStore(os.path.join(self.partition_dir, name + '.json'),
+                                          compact_threshold=self.compact_threshold,
+                                          archive_after_days=self.archive_after_days)
+                self._partitions[name] = store
+                # An evicted partition is just reread from disk when next used
+                while len(self._partitions) > self.max_partitions:
+                    self._partitions.popitem(last=False)
+            else:
+                self._partitions.move_to_end(name)
+            return store
+
+    def _partition_names(self):
+        if not os.path.isdir(self.partition_dir):
+            return []
+        names = set()
+        for filename in os.listdir(self.partition_dir):
+            # Strip the exact suffix, as usernames can themselves contain '.json'
+            for suffix in ('.json.log', '.json'):
+                if filename.endswith(suffix):
+                    names.add(filename[:-len(suffix)])
+                    break
+        return sorted(names)
+
+    def _allocate_id(self, reserve_below=None):
+        """Take the next entry ID from the shared counter file in O(1)
+
+        With reserve_below, move the counter up to at least that ID instead
+        of taking one.
+        """
+        with file_lock(self.counter_path + '.lock'):
+            with open(self.counter_path, 'a+') as f:
+                f.seek(0)
+                value = f.read()
+                # Reseed from the partitions if the counter file went missing
+                entry_id = int(value) if value else _next_free_id(self.get_all_entries())
+                f.seek(0)
+                f.truncate()
+                f.write(str(max(entry_id, reserve_below) if reserve_below else entry_id + 1))
+        return entry_id
+
+    def reserve_ids(self, next_id):
+        """Never hand out IDs below next_id, e.g. those of a backup still being restored"""
+        self._ensure_migrated()
+        self._allocate_id(reserve_below=next_id)
+
+    def get_all_entries(self):
+        """Retrieve every user's entries, ordered by ID"""
+        self._ensure_migrated()
+        entries = []
+        for name in self._partition_names():
+            entries.extend(self._partition(name).get_all_entries())
+        entries.sort(key=_entry_id)
+        return entries
+
+    def get_user_entries(self, username):
+        """Retrieve one user's entries, reading only their partition"""
+        self._ensure_migrated()
+        return self._partition(self._partition_name(username)).get_all_entries()
+
+    def get_latest_user_entries(self, username, limit, before_id=None):
+        """Retrieve a page of one user's entries older than before_id, newest first"""
+        self._ensure_migrated()
+        return self._partition(self._partition_name(username)).get_latest_entries(limit, before_id)
+
+    def get_user_entries_by_ids(self, username, entry_ids):
+        """Retrieve one user's entries with the given IDs, in the order given"""
+        self._ensure_migrated()
+        return self._partition(self._partition_name(username)).get_entries_by_ids(entry_ids)
+
+    def add_entry(self, entry):
+        """Append an entry to its owner's partition"""
+        self._ensure_migrated()
+        # Shared, so writes run side by side but never in the middle of a replace or merge
+        with file_lock(self.lock_path, shared=True):
+            entry = dict(entry, id=self._allocate_id())
+            return self._partition(self._partition_name(entry.get('username'))).add_entry(entry)
+
+    def delete_entry(self, entry_id, username=None):
+        """Delete an entry, searching every partition if no owner is given"""
+        self._ensure_migrated()
+        names = [self._partition_name(username)] if username else self._partition_names()
+        for name in names:
+            partition = self._partition(name)
+            if partition.get_entries_by_ids([entry_id]):
+                return partition.delete_entry(entry_id)
+        return False
+
+    def replace_all(self, entries):
+        """Replace the whole journal, e.g. after restoring from a backup"""
+        with file_lock(self.lock_path):
+            self._write_partitions(entries)
+        self._migrated = True
+
+    def merge_entries(self, entries):
+        """Add entries with their IDs, e.g. from a backup, keeping every entry already stored
+
+        A stored entry that differs from an incoming one with the same ID is
+        moved to a new ID rather than overwritten.
+        """
+        self._ensure_migrated()
+        with file_lock(self.lock_path):
+            merged, moved = _merge_by_id(entries, self.get_all_entries())
+            # Keep any IDs reserved above the merged entries, which rewriting the partitions would reset
+            reserved = self._allocate_id(reserve_below=1)
+            self._write_partitions(merged)
+            self._allocate_id(reserve_below=reserved)
+        return moved
+
+    def get_entry_summaries(self):
+        """Every user's entry summaries, reading archived entries from their columns only"""
+        self._ensure_migrated()
+        for name in self._partition_names():
+            yield from self._partition(name).get_entry_summaries()
+
+    def compact(self):
+        """Compact every partition now, archiving cold entries if enabled"""
+        self._ensure_migrated()
+        for name in self._partition_names():
+            self._partition(name).compact()
+
+
+class SQLiteJournalStore:
+    """Journal storage in a local SQLite database
+
+    Runs in WAL mode so readers never block the single writer and several
+    gunicorn workers can share one database file. Entries are kept as JSON
+    documents alongside indexed username/timestamp columns, with tags in a
+    join table for per-user tag lookups.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT,
+            timestamp TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_entries_username_timestamp ON entries (username, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_entries_username_id ON entries (username, id);
+        CREATE TABLE IF NOT EXISTS entry_tags (
+            entry_id INTEGER NOT NULL REFERENCES entries (id) ON DELETE CASCADE,
+            username TEXT,
+            tag TEXT NOT NULL,
+            PRIMARY KEY (entry_id, tag)
+        );
+        CREATE INDEX IF NOT EXISTS idx_entry_tags_username_tag ON entry_tags (username, tag);
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._existed = os.path.exists(db_path)
+        self._connections = SQLiteConnections(db_path)
+        with self._connection() as conn:
+            had_tags = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entry_tags'").fetchone()
+            conn.executescript(self.SCHEMA)
+            if not had_tags:
+                # Databases written while the join table was missing get their tags filled in once
+                conn.execute(
+                    "INSERT OR IGNORE INTO entry_tags (entry_id, username, tag) "
+                    "SELECT e.id, e.username, t.value FROM entries e, json_each(e.data, '$.tags') t "
+                    "WHERE json_type(e.data, '$.tags') = 'array'")
+
+    def _connection(self):
+        return self._connections.get()
+
+    def exists(self):
+        """Check whether the database existed or has been written to"""
+        return self._existed
+
+    @staticmethod
+    def _row_to_entry(row):
+        entry = {'id': row[0]}
+        entry.update(journal_codec.loads(row[1]))
+        return entry
+
+    def _query(self, sql, params=()):
+        return [self._row_to_entry(row) for row in self._connection().execute(sql, params)]
+
+    def get_all_entries(self):
+        """Retrieve all journal entries ordered by ID"""
+        return self._query('SELECT id, data FROM entries ORDER BY id')
+
+    def get_user_entries(self, username):
+        """Retrieve one user's entries via the (username, timestamp) index"""
+        return self._query(
+            'SELECT id, data FROM entries WHERE username IS ? ORDER BY timestamp, id', (username,))
+
+    def get_latest_user_entries(self, username, limit, before_id=None):
+        """Retrieve a page of one user's entries older than before_id, newest first"""
+        if before_id is None:
+            return self._query(
+                'SELECT id, data FROM entries WHERE username IS ? ORDER BY id DESC LIMIT ?', (username, limit))
+        return self._query(
+            'SELECT id, data FROM entries WHERE username IS ? AND id < ? ORDER BY id DESC LIMIT ?',
+            (username, before_id, limit))
+
+    def get_user_entries_by_ids(self, username, entry_ids):
+        """Retrieve one user's entries with the given IDs, in the order given"""
+        entry_ids = [int(entry_id) for entry_id in entry_ids]
+        if not entry_ids:
+            return []
+        placeholders = ', '.join('?' for _ in entry_ids)
+        by_id = {entry['id']: entry for entry in self._query(
+            f'SELECT id, data FROM entries WHERE username IS ? AND id IN ({placeholders})',
+            [username] + entry_ids)}
+        return [by_id[entry_id] for entry_id in entry_ids if entry_id in by_id]
+
+    def get_user_entries_by_tag(self, username, tag):
+        """Retrieve one user's entries carrying a tag via the tag join table"""
+        return self._query(
+            'SELECT e.id, e.data FROM entry_tags t JOIN entries e ON e.id = t.entry_id '
+            'WHERE t.username IS ? AND t.tag = ? ORDER BY e.timestamp, e.id', (username, tag))
+
+    def _insert(self, conn, entry):
+        data = {k: v for k, v in entry.items() if k != 'id'}
+        cursor = conn.execute(
+            'INSERT INTO entries (id, username, timestamp, data) VALUES (?, ?, ?, ?)',
+            (entry.get('id'), entry.get('username'), entry.get('timestamp'), journal_codec.dumps(data)))
+        entry_id = cursor.lastrowid
+        conn.executemany(
+            'INSERT OR IGNORE INTO entry_tags (entry_id, username, tag) VALUES (?, ?, ?)',
+            [(entry_id, entry.get('username'), tag) for tag in entry.get('tags') or []])
+        return entry_id
+
+    def add_entry(self, entry):
+        """Insert a journal entry, assigning it the next free ID unless it has one"""
+        conn = self._connection()
+        with conn:
+            entry_id = self._insert(conn, entry)
+        self._existed = True
+        return dict(entry, id=entry_id)
+
+    def delete_entry(self, entry_id, username=None):
+        """Delete a journal entry and its tags"""
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute('DELETE FROM entries WHERE id = ?', (entry_id,))
+        return cursor.rowcount > 0
+
+    def replace_all(self, entries):
+        """Replace the whole journal, e.g. after restoring from a backup"""
+        conn = self._connection()
+        with conn:
+            conn.execute('DELETE FROM entries')
+            for entry in entries:
+                self._insert(conn, entry)
+        self._existed = True
+
+    def reserve_ids(self, next_id):
+        """Never hand out IDs below next_id, e.g. those of a backup still being restored"""
+        conn = self._connection()
+        with conn:
+            # AUTOINCREMENT never goes below the table's sqlite_sequence row
+            if not conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'entries'",
+                                (next_id - 1,)).rowcount:
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('entries', ?)", (next_id - 1,))
+        self._existed = True
+
+    def merge_entries(self, entries):
+        """Add entries with their IDs, e.g. from a backup, keeping every entry already stored
+
+        A stored entry that differs from an incoming one with the same ID is
+        moved to a new ID rather than overwritten.
+        """
+        conn = self._connection()
+        with conn:
+            # Take the write lock before reading, so no entry is added between the read and the merge
+            conn.execute('BEGIN IMMEDIATE')
+            merged, moved = _merge_by_id(entries, self._query('SELECT id, data FROM entries ORDER BY id'))
+            conn.execute('DELETE FROM entries')
+            for entry in merged:
+                self._insert(conn, entry)
+        self._existed = True
+        return moved
+
+
+class SQLiteConnections:
+    """Per-thread SQLite connections in WAL mode
+
+    Connections must not be shared across threads or forked workers, so each
+    thread gets its own and a forked process opens fresh ones.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def get(self):
+        """Get this thread's connection, opening one if needed"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+class FileCache:
+    """Cache of values parsed from files, invalidated when the files change
+
+    Each value is stored with the stat signature (inode, size, mtime, ctime)
+    of the files it was read from. Every writer either appends or replaces
+    files by rename, so any write from any process changes the signature and
+    the next lookup reloads.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, paths, load):
+        """Return the cached value for key, calling load() if the files changed"""
+        # Stat before loading so a write racing the load forces another reload
+        signature = tuple(file_signature(path) for path in paths)
+        cached = self._values.get(key)
+        if cached is not None and cached[0] == signature:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        value = load()
+        self._values[key] = (signature, value)
+        return value
+
+
+def atomic_write(path, data):
+    """Write text or bytes to a file via a fsynced temp file and rename"""
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, 'wb') if isinstance(data, bytes) else open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def file_signature(path):
+    """Stat signature used to detect changes to a file, or None if it is missing"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+
+@contextmanager
+def file_lock(lock_path, shared=False):
+    """Hold an flock on lock_path, which is shared between gunicorn workers"""
+    if fcntl is None:
+        with _fallback_lock:
+            yield
+        return
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _entry_id(entry):
+    return int(entry.get('id') or 0)
+
+
+def _empty_archive():
+    return {'segments': [], 'deleted': []}
+
+
+def _decode_entries(items, fields=None):
+    """Decode snapshot entries, remapping rows written with a different field order"""
+    if fields is None or tuple(fields) == ENTRY_FIELDS:
+        return [JournalEntry.decode(item) for item in items]
+    return [JournalEntry.from_dict(dict(zip(fields, item)) if isinstance(item, list) else item)
+            for item in items]
+
+
+def _merge_by_id(incoming, stored):
+    """Incoming entries plus stored ones in ID order, and how many stored ones had to move to a new ID"""
+    merged = {_entry_id(e): e for e in incoming}
+    next_id = max(_next_free_id(incoming), _next_free_id(stored))
+    moved = 0
+    for entry in stored:
+        entry_id = _entry_id(entry)
+        if entry_id in merged and merged[entry_id] != entry:
+            logger.warning(f"Entry {entry_id} clashes with an incoming entry, moving it to ID {next_id}")
+            entry = dict(entry, id=next_id)
+            entry_id = next_id
+            next_id += 1
+            moved += 1
+        merged[entry_id] = entry
+    return [merged[entry_id] for entry_id in sorted(merged)], moved
+
+
+def _next_free_id(entries):
+    """Next ID after the highest one in a list of entries"""
+    return max((_entry_id(e) for e in entries), default=0) + 1
@@ -0,0 +1,147 @@
+import os
+import time
+import logging
+
+import journal_codec
+from journal_store import atomic_write
+
+logger = logging.getLogger(__name__)
+
+
+class Throughput:
+    """Counts transferred entries and reports the rate every few seconds"""
+
+    def __init__(self, report=None, every=5.0):
+        self.report = report
+        self.every = every
+        self.count = 0
+        self.started = time.monotonic()
+        self._last_report = self.started
+
+    def add(self, count):
+        self.count += count
+        now = time.monotonic()
+        if self.report and now - self._last_report >= self.every:
+            self._last_report = now
+            self.report(self.summary())
+
+    def summary(self):
+        """Entries so far, seconds elapsed and entries per second"""
+        seconds = time.monotonic() - self.started
+        return {"entries": self.count, "seconds": round(seconds, 2),
+                "rate": round(self.count / seconds, 1) if seconds else 0.0}
+
+
+def _read_checkpoint(checkpoint_path):
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, 'rb') as f:
+        return journal_codec.loads(f.read())
+
+
+def _write_checkpoint(checkpoint_path, state, output=None):
+    """Record how far a transfer got, after making the output durable up to there"""
+    if output is not None:
+        output.flush()
+        os.fsync(output.fileno())
+    atomic_write(checkpoint_path, journal_codec.dumps(state, default=_json_number))
+
+
+def _json_number(value):
+    # DynamoDB keys come back as Decimal
+    return int(value) if value == value.to_integral_value() else float(value)
+
+
+def _line(entry):
+    return (journal_codec.dumps(entry, default=_json_number) + '\n').encode('utf-8')
+
+
+def export_journal(source, path, checkpoint_path=None, segments=4, page_size=None, report=None,
+                   checkpoint_every=5.0):
+    """Write every entry in source to a JSONL file, one entry per line
+
+    A DynamoDB source is read with parallel segmented scans and streamed
+    straight to the file. With a checkpoint_path, the file offset and each
+    segment's last key are saved as pages are written, and a later call
+    truncates the file back to the checkpoint and carries on from there.
+    Other stores are written out in one pass. Returns the throughput summary.
+    """
+    checkpoint = _read_checkpoint(checkpoint_path)
+    throughput = Throughput(report)
+    with open(path, 'r+b' if checkpoint else 'wb') as f:
+        if checkpoint:
+            f.truncate(checkpoint['offset'])
+            f.seek(checkpoint['offset'])
+            logger.info(f"Resuming export to {path} at byte {checkpoint['offset']}")
+
+        if hasattr(source, 'scan_pages'):
+            segments = checkpoint['total_segments'] if checkpoint else segments
+            state = {int(segment): key for segment, key in checkpoint['segments'].items()} if checkpoint else {}
+            saved = time.monotonic()
+            for segment, items, last_key in source.scan_pages(segments, dict(state), page_size=page_size):
+                f.write(b''.join(_line(item) for item in items))
+                throughput.add(len(items))
+                state[segment] = last_key or False
+                if checkpoint_path and time.monotonic() - saved >= checkpoint_every:
+                    _write_checkpoint(checkpoint_path, {
+                        'offset': f.tell(), 'total_segments': segments,
+                        'segments': {str(segment): key for segment, key in state.items()}}, output=f)
+                    saved = time.monotonic()
+        else:
+            for entry in source.get_all_entries():
+                f.write(_line(entry))
+                throughput.add(1)
+
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    summary = throughput.summary()
+    logger.info(f"Exported {summary['entries']} entries to {path} ({summary['rate']} entries/s)")
+    return summary
+
+
+def import_journal(path, target, checkpoint_path=None, batch_size=500, report=None):
+    """Load a JSONL export into target, keeping entry IDs
+
+    Stores with put_entries (DynamoDB) are fed batch_size entries at a time
+    while the file is read, so memory stays flat; after each batch the file
+    offset reached is saved to checkpoint_path, and a later call resumes
+    from it. There an imported entry overwrites any stored one with its ID.
+    Local stores merge the imported entries in one step under their lock,
+    moving any stored entry whose ID clashes with a different imported one
+    to a new ID. Returns the throughput summary.
+    """
+    checkpoint = _read_checkpoint(checkpoint_path)
+    throughput = Throughput(report)
+    with open(path, 'rb') as f:
+        if hasattr(target, 'put_entries'):
+            if checkpoint:
+                f.seek(checkpoint['offset'])
+                logger.info(f"Resuming import from {path} at byte {checkpoint['offset']}")
+            while True:
+                batch = []
+                while len(batch) < batch_size:
+                    line = f.readline()
+                    if not line:
+                        break
+                    if line.strip():
+                        batch.append(journal_codec.loads(line))
+                if not batch:
+                    break
+                throughput.add(target.put_entries(batch))
+                if checkpoint_path:
+                    _write_checkpoint(checkpoint_path, {'offset': f.tell()})
+        else:
+            entries = []
+            for line in f:
+                if line.strip():
+                    entries.append(journal_codec.loads(line))
+                    throughput.add(1)
+            moved = target.merge_entries(entries)
+            if moved:
+                logger.warning(f"Moved {moved} stored entries to new IDs to make way for imported ones")
+
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    summary = throughput.summary()
+    logger.info(f"Imported {summary['entries']} entries from {path} ({summary['rate']} entries/s)")
+    return summary
@@ -0,0 +1,59 @@
+from datetime import datetime, timezone
+import logging
+
+from journal_store import SQLiteConnections
+
+logger = logging.getLogger(__name__)
+
+# Row bumped by writes that can touch any user's entries, such as a restore
+ALL_USERS = '*'
+
+
+class JournalVersions:
+    """Per-user journal generation numbers, bumped after every write
+
+    Every worker shares them through SQLite, so the generation pins down the
+    state of a user's journal and can serve as an HTTP validator without
+    reading any entries. Writes that replace the whole journal bump a
+    generation shared by all users instead.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS journal_versions (
+            username TEXT PRIMARY KEY,
+            generation INTEGER NOT NULL,
+            modified TEXT NOT NULL
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._connections = SQLiteConnections(db_path)
+        with self._connections.get() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def get(self, username):
+        """The user's version as a string plus when it last changed, or None if never"""
+        rows = dict((name, (generation, modified)) for name, generation, modified in self._connections.get().execute(
+            'SELECT username, generation, modified FROM journal_versions WHERE username IN (?, ?)',
+            (username or '', ALL_USERS)))
+        shared, shared_modified = rows.get(ALL_USERS, (0, None))
+        own, own_modified = rows.get(username or '', (0, None))
+        modified = max(filter(None, (shared_modified, own_modified)), default=None)
+        return f"{shared}.{own}", datetime.fromisoformat(modified) if modified else None
+
+    def bump(self, username=ALL_USERS):
+        """Move a user's journal, or with no user everyone's, to a new version"""
+        # Whole seconds, as that is all Last-Modified can carry
+        modified = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+        with self._connections.get() as conn:
+            conn.execute(
+                'INSERT INTO journal_versions (username, generation, modified) VALUES (?, 1, ?) '
+                'ON CONFLICT (username) DO UPDATE SET generation = generation + 1, modified = excluded.modified',
+                (username or '', modified))
+
+    def generation(self, username=ALL_USERS):
+        """A user's own generation number, by default the one shared by all users"""
+        row = self._connections.get().execute(
+            'SELECT generation FROM journal_versions WHERE username = ?', (username or '',)).fetchone()
+        return row[0] if row else 0
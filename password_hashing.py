@@ -0,0 +1,104 @@
+import os
+import threading
+import logging
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash
+
+logger = logging.getLogger(__name__)
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool is saturated and a request should be shed"""
+
+
+class PasswordHasher:
+    """Password hashing and verification on a bounded process pool
+
+    Hashing is deliberately slow, so running it on gunicorn's request threads
+    lets a burst of logins stall every other request on the worker. Work goes
+    to a small process pool instead; once max_pending hashes are queued or
+    running, further calls raise HashingBusy straight away so the caller can
+    answer 503 rather than pile up. With workers=0 hashing runs inline.
+    """
+
+    def __init__(self, method='pbkdf2:sha256:600000', salt_length=16, workers=2, max_pending=16, timeout=10):
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        self._method_prefix = None
+
+    def _get_pool(self):
+        """Get this process's pool, starting one after a fork"""
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _discard_pool(self, pool):
+        """Drop a broken pool so the next call starts a fresh one"""
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy("Password hashing pool is saturated")
+        if not self.workers:
+            try:
+                return func(*args)
+            finally:
+                self._slots.release()
+        pool = self._get_pool()
+        try:
+            future = pool.submit(func, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._discard_pool(pool)
+            logger.warning("Password hashing pool broke, starting a new one")
+            raise HashingBusy("Password hashing pool is restarting")
+        except Exception:
+            self._slots.release()
+            raise
+        # Hold the slot until the hash actually finishes, not just until we stop waiting
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise HashingBusy("Password hashing timed out")
+        except BrokenProcessPool:
+            # A pool process died, e.g. killed for memory; every later submit would fail too
+            self._discard_pool(pool)
+            logger.warning("Password hashing pool broke, starting a new one")
+            raise HashingBusy("Password hashing pool is restarting")
+
+    def hash(self, password):
+        """Hash a password with the configured method"""
+        pwhash = self._run(generate_password_hash, password, self.method, self.salt_length)
+        self._method_prefix = pwhash.split('$', 1)[0]
+        return pwhash
+
+    def verify(self, pwhash, password):
+        """Check a password against a stored hash"""
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """Whether a stored hash was made with different parameters than the configured ones"""
+        if self._method_prefix is None:
+            # werkzeug expands e.g. 'pbkdf2' to 'pbkdf2:sha256:600000', so learn the full form once
+            self.hash('')
+        return pwhash.split('$', 1)[0] != self._method_prefix
+
+    def shutdown(self):
+        """Stop the pool's worker processes"""
+        with self._pool_lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False)
+            self._pool = None
@@ -2,11 +2,12 @@ import unittest
 import json
 import os
 import tempfile
+import shutil
 from datetime import datetime
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app import app, add_journal_entry, get_journal_entries
+from app import app, add_journal_entry, get_journal_entries, get_user_journal_entries, get_user_journal_page, register_user, verify_user, get_tag_color
 
 class TestGVisitApp(unittest.TestCase):
     """Test suite for GVisit Flask application"""
@@ -18,21 +19,34 @@ class TestGVisitApp(unittest.TestCase):
         self.app.config['SECRET_KEY'] = 'test-secret-key'
         self.client = self.app.test_client()
         
-        # Create a temporary file for journal entries
-        self.temp_journal = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json')
-        self.temp_journal.write('[]')
-        self.temp_journal.close()
+        # Create a temporary journal file (the store keeps its log next to it)
+        self.temp_dir = tempfile.mkdtemp()
+        temp_journal = os.path.join(self.temp_dir, 'journal_entries.json')
+        with open(temp_journal, 'w') as f:
+            f.write('[]')
         
-        # Override the journal file path
+        # Override the journal and users file paths
         import app as app_module
         self.original_journal_file = app_module.JOURNAL_FILE
-        app_module.JOURNAL_FILE = self.temp_journal.name
+        self.original_users_file = app_module.USERS_FILE
+        self.original_search_index_path = app_module.SEARCH_INDEX_PATH
+        app_module.JOURNAL_FILE = temp_journal
+        app_module.USERS_FILE = os.path.join(self.temp_dir, 'users.json')
+        app_module.SEARCH_INDEX_PATH = os.path.join(self.temp_dir, 'search_index.db')
         
     def tearDown(self):
         """Clean up temporary files"""
         import app as app_module
         app_module.JOURNAL_FILE = self.original_journal_file
-        os.unlink(self.temp_journal.name)
+        app_module.USERS_FILE = self.original_users_file
+        app_module.SEARCH_INDEX_PATH = self.original_search_index_path
+        shutil.rmtree(self.temp_dir)
+        
+    def login_journal_user(self, username='alice'):
+        """Register a journal user and log the test client in as them"""
+        register_user(username, 'password123')
+        with self.client.session_transaction() as sess:
+            sess['journal_username'] = username
         
     def test_home_page(self):
         """Test that home page loads successfully"""
@@ -138,6 +152,210 @@ class TestGVisitApp(unittest.TestCase):
         self.assertEqual(data['status'], 'healthy')
         self.assertIn('aws_backup', data)
         self.assertIn('dynamodb', data)
+        self.assertIn('backup', data)
+        
+    def test_ready_endpoint_waits_for_checks(self):
+        """Test that /ready answers 503 until the readiness checks pass"""
+        import app as app_module
+        from aws_integration import ReadinessProbe
+        original = app_module.readiness
+        try:
+            app_module.readiness = ReadinessProbe({'s3': lambda: False}, retry_interval=60)
+            app_module.readiness.start()
+            app_module.readiness._thread.join(0.5)
+            response = self.client.get('/ready')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(json.loads(response.data)['state'], 'failed')
+            
+            app_module.readiness = ReadinessProbe({})
+            self.assertEqual(self.client.get('/ready').status_code, 200)
+        finally:
+            app_module.readiness = original
+        
+    def test_journal_renders_newest_page_only(self):
+        """Test that /journal renders only the newest page of entries"""
+        import app as app_module
+        self.login_journal_user()
+        for i in range(app_module.JOURNAL_PAGE_SIZE + 5):
+            add_journal_entry({'username': 'alice', 'focus': 'Brain Dump', 'content': f'Entry number {i}.',
+                               'mood': 'good', 'energy': 'High'})
+        
+        response = self.client.get('/journal')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'Entry number {app_module.JOURNAL_PAGE_SIZE + 4}.'.encode(), response.data)
+        self.assertNotIn(b'Entry number 4.', response.data)
+        self.assertIn(b'data-next-cursor="6"', response.data)
+        
+    def test_journal_entries_cursor_pagination(self):
+        """Test fetching older entries page by page"""
+        import app as app_module
+        self.login_journal_user()
+        for i in range(app_module.JOURNAL_PAGE_SIZE + 5):
+            add_journal_entry({'username': 'alice', 'focus': 'Brain Dump', 'content': f'Entry number {i}.',
+                               'mood': 'good', 'energy': 'High'})
+        
+        data = self.client.get('/journal/entries').get_json()
+        self.assertEqual(len(data['entries']), app_module.JOURNAL_PAGE_SIZE)
+        self.assertEqual(data['next_cursor'], 6)
+        
+        data = self.client.get(f"/journal/entries?before={data['next_cursor']}").get_json()
+        self.assertEqual([e['id'] for e in data['entries']], [5, 4, 3, 2, 1])
+        self.assertIsNone(data['next_cursor'])
+        self.assertIn('Entry number 0.', data['html'])
+        
+    def test_journal_conditional_get(self):
+        """Test that an unchanged journal answers 304 without reading entries, until the user writes"""
+        import app as app_module
+        self.login_journal_user()
+        add_journal_entry({'username': 'alice', 'focus': 'Brain Dump', 'content': 'First.',
+                           'mood': 'good', 'energy': 'High'})
+        first = self.client.get('/journal')
+        etag = first.headers['ETag']
+        self.assertIn('private', first.headers['Cache-Control'])
+        
+        original_page = app_module._journal_page
+        try:
+            app_module._journal_page = None  # Any storage read would now fail
+            response = self.client.get('/journal', headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.headers['ETag'], etag)
+        finally:
+            app_module._journal_page = original_page
+        
+        add_journal_entry({'username': 'alice', 'focus': 'Brain Dump', 'content': 'Second.',
+                           'mood': 'good', 'energy': 'High'})
+        response = self.client.get('/journal', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Second.', response.data)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        
+        entries = self.client.get('/journal/entries')
+        self.assertEqual(self.client.get('/journal/entries', headers={'If-None-Match': entries.headers['ETag']})
+                         .status_code, 304)
+        self.login_journal_user('bob')
+        self.assertEqual(self.client.get('/journal', headers={'If-None-Match': etag}).status_code, 200)
+        
+    def test_journal_validators_follow_rebuilds_and_skip_dynamodb(self):
+        """Test that a search index rebuild changes the ETag, and DynamoDB journals get none"""
+        import app as app_module
+        from app import rebuild_search_index
+        self.login_journal_user()
+        add_journal_entry({'username': 'alice', 'focus': 'Brain Dump', 'content': 'First.',
+                           'mood': 'good', 'energy': 'High'})
+        etag = self.client.get('/journal/entries').headers['ETag']
+        rebuild_search_index()
+        response = self.client.get('/journal/entries', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        
+        class RemoteStore:
+            def get_user_entries(self, username, limit=None, cursor=None):
+                return [], None
+        
+        original_store = app_module.dynamodb_store
+        try:
+            app_module.dynamodb_store = RemoteStore()
+            response = self.client.get('/journal/entries', headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('ETag', response.headers)
+        finally:
+            app_module.dynamodb_store = original_store
+        
+    def test_entry_cards_are_cached(self):
+        """Test that entry cards are rendered once and then reused from the fragment cache"""
+        import app as app_module
+        self.login_journal_user()
+        add_journal_entry({'username': 'alice', 'focus': 'Brain Dump', 'content': 'Line one\nLine two',
+                           'mood': 'excellent', 'energy': 'High', 'tags': ['work']})
+        first = self.client.get('/journal/entries').get_json()['html']
+        self.assertIn('Line one<br>Line two', first)
+        
+        self.assertEqual(self.client.get('/journal/entries').get_json()['html'], first)
+        self.assertIn('Line one<br>Line two', self.client.get('/journal').get_data(as_text=True))
+        status = app_module.get_fragment_cache().status()
+        self.assertEqual((status['misses'], status['hits']), (1, 2))
+        
+    def test_journal_entries_requires_login(self):
+        """Test that the entries API needs a journal session"""
+        response = self.client.get('/journal/entries')
+        self.assertEqual(response.status_code, 401)
+        
+    def test_journal_search(self):
+        """Test that new entries are searchable right away"""
+        self.login_journal_user()
+        add_journal_entry({'username': 'alice', 'focus': 'Learning Log', 'content': 'Studied Python generators',
+                           'mood': 'good', 'energy': 'High', 'tags': ['learning']})
+        add_journal_entry({'username': 'bob', 'focus': 'Learning Log', 'content': 'Python for Bob',
+                           'mood': 'good', 'energy': 'High'})
+        
+        data = self.client.get('/journal/search?q=pyth gen').get_json()
+        
+        self.assertEqual([e['content'] for e in data['entries']], ['Studied Python generators'])
+        self.assertIn('Studied Python generators', data['html'])
+        self.assertEqual(self.client.get('/journal/search?q=').get_json()['entries'], [])
+        
+        add_journal_entry({'username': 'alice', 'content': 'More Python'})
+        # SQLite reads a negative LIMIT as no limit at all
+        self.assertEqual(len(self.client.get('/journal/search?q=python&limit=-1').get_json()['entries']), 1)
+        
+    def test_journal_tag_facets_and_filters(self):
+        """Test tag counts and filtering entries by tags"""
+        self.login_journal_user()
+        for content, tags in [('One', ['work', 'goals']), ('Two', ['work']), ('Three', ['health'])]:
+            add_journal_entry({'username': 'alice', 'content': content, 'tags': tags})
+        
+        tags = self.client.get('/journal/tags').get_json()['tags']
+        self.assertEqual(tags[0], {'tag': 'work', 'count': 2})
+        
+        data = self.client.get('/journal/tags/entries?tags=work,goals&mode=and').get_json()
+        self.assertEqual([e['content'] for e in data['entries']], ['One'])
+        data = self.client.get('/journal/tags/entries?tags=work,health&mode=or').get_json()
+        self.assertEqual([e['content'] for e in data['entries']], ['Three', 'Two', 'One'])
+        self.assertEqual(self.client.get('/journal/tags/entries?tags=work&mode=xor').status_code, 400)
+        
+    def test_rebuild_search_index_command(self):
+        """Test that the CLI command indexes existing entries"""
+        import app as app_module
+        add_journal_entry({'username': 'alice', 'content': 'Written before indexing'})
+        app_module.get_search_index().rebuild([])
+        
+        result = self.app.test_cli_runner().invoke(args=['rebuild-search-index'])
+        
+        self.assertIn('Indexed 1 journal entries', result.output)
+        self.assertEqual(len(app_module.get_search_index().search('alice', 'indexing')), 1)
+        
+    def test_journal_stats(self):
+        """Test that stats come from rollups kept up to date as entries are added"""
+        self.login_journal_user()
+        add_journal_entry({'username': 'alice', 'focus': 'Daily Reflection', 'mood': 'good', 'energy': 'High'})
+        add_journal_entry({'username': 'alice', 'focus': 'Daily Reflection', 'mood': 'okay', 'energy': 'Low'})
+        
+        data = self.client.get('/journal/stats?period=day').get_json()
+        
+        self.assertEqual(len(data['buckets']), 1)
+        self.assertEqual(data['buckets'][0]['entries'], 2)
+        self.assertEqual(data['buckets'][0]['avg_mood'], 3.5)
+        self.assertEqual(data['buckets'][0]['avg_energy'], 2)
+        self.assertEqual(data['buckets'][0]['focus'], {'Daily Reflection': 2})
+        self.assertEqual(data['streaks'], {'current': 1, 'longest': 1})
+        self.assertEqual(self.client.get('/journal/stats?period=year').status_code, 400)
+        
+        import app as app_module
+        app_module.get_rollups().add_entry({'username': 'alice', 'timestamp': '2024-01-01 09:00:00', 'mood': 'good'})
+        # SQLite reads a negative LIMIT as no limit at all
+        self.assertEqual(len(self.client.get('/journal/stats?period=day&limit=-1').get_json()['buckets']), 1)
+        
+    def test_backfill_journal_stats_command(self):
+        """Test that the CLI command builds rollups for existing entries"""
+        import app as app_module
+        add_journal_entry({'username': 'alice', 'mood': 'excellent'})
+        app_module.get_rollups().rebuild([])
+        
+        result = self.app.test_cli_runner().invoke(args=['backfill-journal-stats'])
+        
+        self.assertIn('Rolled up 1 journal entries', result.output)
+        self.assertEqual(app_module.get_rollups().buckets('alice', 'month')[0]['avg_mood'], 5)
         
     def test_secure_download_without_auth(self):
         """Test that download requires authentication"""
@@ -145,6 +363,69 @@ class TestGVisitApp(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'You need to enter the password', response.data)
         
+    def download_presentation(self, **kwargs):
+        """Authenticate for ppt1, put a presentation in a temporary folder and request it"""
+        import app as app_module
+        with open(os.path.join(self.temp_dir, 'presentation1.pptx'), 'wb') as f:
+            f.write(b'0123456789')
+        with self.client.session_transaction() as sess:
+            sess['authenticated_ppt1'] = True
+        original_folder = app_module.PPTX_FOLDER
+        try:
+            app_module.PPTX_FOLDER = self.temp_dir
+            return self.client.get('/download_ppt/ppt1', **kwargs)
+        finally:
+            app_module.PPTX_FOLDER = original_folder
+        
+    def test_secure_download_ranges_and_validators(self):
+        """Test that downloads resume with Range, honour If-Range and revalidate with the ETag"""
+        full = self.download_presentation()
+        self.assertEqual(full.data, b'0123456789')
+        self.assertEqual(full.headers['Accept-Ranges'], 'bytes')
+        self.assertIn('private', full.headers['Cache-Control'])
+        etag = full.headers['ETag']
+        
+        self.assertEqual(self.download_presentation(headers={'If-None-Match': etag}).status_code, 304)
+        partial = self.download_presentation(headers={'Range': 'bytes=4-', 'If-Range': etag})
+        self.assertEqual((partial.status_code, partial.data), (206, b'456789'))
+        self.assertEqual(partial.headers['Content-Range'], 'bytes 4-9/10')
+        stale = self.download_presentation(headers={'Range': 'bytes=4-', 'If-Range': '"stale"'})
+        self.assertEqual((stale.status_code, stale.data), (200, b'0123456789'))
+        
+    def test_secure_download_offloaded_to_proxy(self):
+        """Test that offload modes leave the transfer to the proxy after the session check"""
+        import app as app_module
+        original_mode = app_module.PPTX_SERVE_MODE
+        try:
+            app_module.PPTX_SERVE_MODE = 'x-accel'
+            response = self.download_presentation()
+            self.assertEqual(response.headers['X-Accel-Redirect'], '/protected-pptx/presentation1.pptx')
+            self.assertEqual(response.data, b'')
+            self.assertIn('attachment', response.headers['Content-Disposition'])
+            
+            app_module.PPTX_SERVE_MODE = 'x-sendfile'
+            response = self.download_presentation()
+            self.assertEqual(response.headers['X-Sendfile'], os.path.join(self.temp_dir, 'presentation1.pptx'))
+        finally:
+            app_module.PPTX_SERVE_MODE = original_mode
+        
+    def test_secure_download_range_is_sendfile_ready_under_gunicorn(self):
+        """Test that gunicorn gets a file wrapper seeked to the range start rather than an iterator"""
+        import app as app_module
+        path = os.path.join(self.temp_dir, 'presentation1.pptx')
+        with open(path, 'wb') as f:
+            f.write(b'0123456789')
+        with self.app.test_request_context(headers={'Range': 'bytes=3-5'},
+                                           environ_base={'SERVER_SOFTWARE': 'gunicorn/21.2.0'}):
+            response = app_module._send_presentation(path, 'presentation1.pptx', os.stat(path))
+            file = response.response.file
+            try:
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response.headers['Content-Length'], '3')
+                self.assertEqual(file.tell(), 3)
+            finally:
+                file.close()
+        
     def test_static_css_loads(self):
         """Test that static CSS file loads"""
         response = self.client.get('/static/css/style.css')
@@ -157,19 +438,26 @@ class TestJournalFunctions(unittest.TestCase):
     
     def setUp(self):
         """Set up temporary journal file"""
-        self.temp_journal = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json')
-        self.temp_journal.write('[]')
-        self.temp_journal.close()
+        self.temp_dir = tempfile.mkdtemp()
+        temp_journal = os.path.join(self.temp_dir, 'journal_entries.json')
+        with open(temp_journal, 'w') as f:
+            f.write('[]')
         
         import app as app_module
         self.original_journal_file = app_module.JOURNAL_FILE
-        app_module.JOURNAL_FILE = self.temp_journal.name
+        self.original_users_file = app_module.USERS_FILE
+        self.original_search_index_path = app_module.SEARCH_INDEX_PATH
+        app_module.JOURNAL_FILE = temp_journal
+        app_module.USERS_FILE = os.path.join(self.temp_dir, 'users.json')
+        app_module.SEARCH_INDEX_PATH = os.path.join(self.temp_dir, 'search_index.db')
         
     def tearDown(self):
         """Clean up"""
         import app as app_module
         app_module.JOURNAL_FILE = self.original_journal_file
-        os.unlink(self.temp_journal.name)
+        app_module.USERS_FILE = self.original_users_file
+        app_module.SEARCH_INDEX_PATH = self.original_search_index_path
+        shutil.rmtree(self.temp_dir)
         
     def test_get_empty_journal_entries(self):
         """Test getting entries from empty journal"""
@@ -197,6 +485,212 @@ class TestJournalFunctions(unittest.TestCase):
         self.assertEqual(entries[0]['energy'], 'High')
         self.assertEqual(len(entries[0]['gratitude']), 2)
         
+    def test_get_user_journal_entries(self):
+        """Test that a user's full journal holds only their own entries, oldest first"""
+        add_journal_entry({'username': 'alice', 'content': 'First', 'timestamp': '2024-01-01 09:00:00'})
+        add_journal_entry({'username': 'bob', 'content': 'Bob entry', 'timestamp': '2024-01-01 10:00:00'})
+        add_journal_entry({'username': 'alice', 'content': 'Second', 'timestamp': '2024-01-02 09:00:00'})
+        
+        self.assertEqual([e['content'] for e in get_user_journal_entries('alice')], ['First', 'Second'])
+        self.assertEqual(get_user_journal_entries(''), [])
+        
+    def test_get_user_journal_entries_queries_dynamodb_per_user(self):
+        """Test that DynamoDB journals are read with the per-user query, not a scan"""
+        import app as app_module
+        
+        class QueryOnlyStore:
+            def get_user_entries(self, username, limit=None, cursor=None):
+                return [{'id': 2, 'username': username}, {'id': 1, 'username': username}], None
+        
+        original_store = app_module.dynamodb_store
+        try:
+            app_module.dynamodb_store = QueryOnlyStore()
+            self.assertEqual([e['id'] for e in get_user_journal_entries('alice')], [1, 2])
+        finally:
+            app_module.dynamodb_store = original_store
+        
+    def test_get_user_journal_page(self):
+        """Test that users only see their own entries"""
+        add_journal_entry({'username': 'alice', 'content': 'Alice entry'})
+        add_journal_entry({'username': 'bob', 'content': 'Bob entry'})
+        
+        entries = get_user_journal_page('alice')
+        
+        self.assertEqual([e['content'] for e in entries], ['Alice entry'])
+        self.assertEqual(len(get_journal_entries()), 2)
+        self.assertEqual(get_user_journal_page(''), [])
+        
+    def test_tag_color_keywords(self):
+        """Test keyword categories, with earlier categories winning"""
+        self.assertEqual(get_tag_color('Workout'), 'primary')
+        self.assertEqual(get_tag_color('Budget meeting'), 'primary')
+        self.assertEqual(get_tag_color('mealprep-diet'), 'danger')
+        self.assertEqual(get_tag_color('artsy'), 'purple')
+        
+    def test_tag_color_fallback_is_stable(self):
+        """Test that unmatched tags get the same color in every process"""
+        import subprocess
+        script = "import sys; sys.path.insert(0, '.'); from app import get_tag_color; print(get_tag_color('zzqx'))"
+        colors = {
+            subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                           cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           env=dict(os.environ, PYTHONHASHSEED=seed)).stdout.strip()
+            for seed in ('1', '2')
+        }
+        self.assertEqual(colors, {get_tag_color('zzqx')})
+        
+    def test_registration_is_case_insensitive(self):
+        """Test that a name registered once cannot be taken again in another case"""
+        import app as app_module
+        success, _ = register_user('Alice', 'password123')
+        
+        self.assertTrue(success)
+        self.assertIsNotNone(app_module.get_user_store().get('alice'))
+        self.assertFalse(register_user('alice', 'password123')[0])
+        
+    def test_empty_journal_restored_from_backup(self):
+        """Test that an empty journal is restored from S3 outside of any request"""
+        import app as app_module
+        from aws_integration import RestoreProgress
+        
+        class FakeBackup:
+            def backup_max_id(self):
+                return 1
+            
+            def restore_from_backup(self, progress=None):
+                return [{'id': 1, 'username': 'alice', 'content': 'restored'}]
+        
+        os.remove(app_module.JOURNAL_FILE)
+        original = (app_module.aws_backup, app_module.restore_progress)
+        try:
+            app_module.aws_backup, app_module.restore_progress = FakeBackup(), RestoreProgress()
+            self.assertEqual(get_journal_entries(), [])
+            
+            self.assertTrue(app_module.restore_journal_from_backup())
+            self.assertEqual([e['content'] for e in get_journal_entries()], ['restored'])
+            self.assertEqual(app_module.restore_progress.status()['state'], 'done')
+            self.assertFalse(app_module.restore_journal_from_backup())
+        finally:
+            app_module.aws_backup, app_module.restore_progress = original
+        
+    def test_entries_written_during_restore_keep_their_own_ids(self):
+        """Test that a write while the backup downloads neither takes nor overwrites a restored ID"""
+        import app as app_module
+        from aws_integration import RestoreProgress
+        test = self
+        
+        class SlowBackup:
+            def backup_max_id(self):
+                return 2
+            
+            def restore_from_backup(self, progress=None):
+                test.assertEqual(app_module._restore_state(), app_module.RESTORE_DOWNLOADING)
+                test.written = add_journal_entry({'username': 'bob', 'content': 'during restore'})
+                return [{'id': 1, 'username': 'alice', 'content': 'one', 'timestamp': '2024-01-01 09:00:00'},
+                        {'id': 2, 'username': 'alice', 'content': 'two', 'timestamp': '2024-01-02 09:00:00'}]
+        
+        os.remove(app_module.JOURNAL_FILE)
+        original = (app_module.aws_backup, app_module.restore_progress)
+        try:
+            app_module.aws_backup, app_module.restore_progress = SlowBackup(), RestoreProgress()
+            app_module._set_restore_state(app_module.RESTORE_RESERVING)
+            self.assertTrue(app_module.restore_journal_from_backup())
+        finally:
+            app_module.aws_backup, app_module.restore_progress = original
+        
+        self.assertEqual(self.written['id'], 3)
+        self.assertEqual([(e['id'], e['content']) for e in get_journal_entries()],
+                         [(1, 'one'), (2, 'two'), (3, 'during restore')])
+        self.assertIsNone(app_module._restore_state())
+        self.assertEqual([e['id'] for e in app_module.get_search_index().search('alice', 'one')], [1])
+        self.assertEqual(app_module.get_rollups().buckets('alice', 'month')[0]['entries'], 2)
+        
+    def test_legacy_restore_does_not_hold_writes(self):
+        """Test that without a manifest to reserve from, writes go ahead during the download and clashes move"""
+        import app as app_module
+        from aws_integration import RestoreProgress
+        test = self
+        
+        class LegacyBackup:
+            def backup_max_id(self):
+                return None
+            
+            def restore_from_backup(self, progress=None):
+                test.assertEqual(app_module._restore_state(), app_module.RESTORE_DOWNLOADING)
+                test.written = add_journal_entry({'username': 'bob', 'content': 'during restore'})
+                return [{'id': 1, 'username': 'alice', 'content': 'one'}]
+        
+        os.remove(app_module.JOURNAL_FILE)
+        original = (app_module.aws_backup, app_module.restore_progress)
+        try:
+            app_module.aws_backup, app_module.restore_progress = LegacyBackup(), RestoreProgress()
+            app_module._set_restore_state(app_module.RESTORE_RESERVING)
+            self.assertTrue(app_module.restore_journal_from_backup())
+        finally:
+            app_module.aws_backup, app_module.restore_progress = original
+        
+        self.assertEqual([(e['id'], e['content']) for e in get_journal_entries()],
+                         [(1, 'one'), (2, 'during restore')])
+        
+    def test_writes_wait_for_restore_to_reserve_ids(self):
+        """Test that a new entry is refused while a restore has not reserved the backup's IDs"""
+        import app as app_module
+        original_wait = app_module.RESTORE_WRITE_WAIT
+        try:
+            app_module.RESTORE_WRITE_WAIT = 0
+            app_module._set_restore_state(app_module.RESTORE_RESERVING)
+            with self.assertRaises(app_module.JournalRestoring):
+                add_journal_entry({'username': 'alice', 'content': 'Too soon'})
+        finally:
+            app_module.RESTORE_WRITE_WAIT = original_wait
+            app_module._set_restore_state(None)
+        
+        self.assertEqual(get_journal_entries(), [])
+        
+    def test_users_migrated_from_users_file(self):
+        """Test that users registered in users.json can still log in"""
+        import app as app_module
+        from werkzeug.security import generate_password_hash
+        with open(app_module.USERS_FILE, 'w') as f:
+            json.dump({'bob': {'password_hash': generate_password_hash('secret123'), 'display_name': 'Bob'}}, f)
+        
+        self.assertTrue(verify_user('Bob', 'secret123'))
+        self.assertFalse(verify_user('bob', 'wrong'))
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, 'users.db')))
+        
+    def test_login_upgrades_password_hash(self):
+        """Test that a hash made with old parameters is replaced on login"""
+        import app as app_module
+        from password_hashing import PasswordHasher
+        original_hasher = app_module.password_hasher
+        try:
+            app_module.password_hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=0)
+            register_user('alice', 'password123')
+            app_module.password_hasher = PasswordHasher(method='pbkdf2:sha256:2000', workers=0)
+            
+            self.assertTrue(verify_user('alice', 'password123'))
+            
+            pwhash = app_module.get_user_store().get('alice')['password_hash']
+            self.assertTrue(pwhash.startswith('pbkdf2:sha256:2000$'))
+            self.assertTrue(verify_user('alice', 'password123'))
+        finally:
+            app_module.password_hasher = original_hasher
+        
+    def test_login_shed_when_hashing_busy(self):
+        """Test that logins get a fast 503 when the hashing pool is saturated"""
+        import app as app_module
+        from password_hashing import PasswordHasher
+        register_user('alice', 'password123')
+        original_hasher = app_module.password_hasher
+        try:
+            app_module.password_hasher = PasswordHasher(workers=0, max_pending=0)
+            response = app.test_client().post('/journal_login', data={'username': 'alice', 'password': 'password123'})
+        finally:
+            app_module.password_hasher = original_hasher
+        
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        
 
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
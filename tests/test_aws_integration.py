@@ -0,0 +1,431 @@
+import unittest
+import os
+import sys
+import threading
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+try:
+    from moto import mock_dynamodb, mock_s3
+    moto_available = True
+except ImportError:
+    moto_available = False
+
+import gzip
+
+import boto3
+import journal_codec
+from aws_integration import (AWSJournalBackup, BackupWorker, CachedJournalStore, DynamoDBJournalStore, ReadinessProbe,
+                             RestoreProgress)
+
+
+@unittest.skipUnless(moto_available, "moto is not installed")
+class TestDynamoDBJournalStore(unittest.TestCase):
+    """Test the DynamoDB store against moto's local DynamoDB"""
+
+    def setUp(self):
+        """Start a mocked DynamoDB with fake credentials"""
+        for key in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN'):
+            os.environ[key] = 'testing'
+        self.mock = mock_dynamodb()
+        self.mock.start()
+        self.store = DynamoDBJournalStore(table_name='test-journal', region='us-east-1')
+
+    def tearDown(self):
+        """Stop the mock"""
+        self.mock.stop()
+
+    def test_add_entry_allocates_sequential_ids(self):
+        """Test that IDs come from the counter without scanning"""
+        first = self.store.add_entry({'id': None, 'username': 'alice', 'content': 'a'})
+        second = self.store.add_entry({'username': 'bob', 'content': 'b'})
+
+        self.assertEqual((first['id'], second['id']), (1, 2))
+        self.assertEqual([int(e['id']) for e in self.store.get_all_entries()], [1, 2])
+
+    def test_counter_continues_after_existing_entries(self):
+        """Test that a table written before the counter existed is not overwritten"""
+        self.store.table.put_item(Item={'id': 5, 'content': 'legacy'})
+
+        entry = self.store.add_entry({'content': 'new'})
+
+        self.assertEqual(entry['id'], 6)
+        self.assertEqual(len(self.store.get_all_entries()), 2)
+
+    def test_add_entry_refuses_to_overwrite(self):
+        """Test that an explicit colliding ID is rejected"""
+        self.store.add_entry({'id': 3, 'content': 'original'})
+
+        self.assertIsNone(self.store.add_entry({'id': 3, 'content': 'clobber'}))
+        self.assertEqual(self.store.get_all_entries()[0]['content'], 'original')
+
+    def test_get_user_entries_by_ids(self):
+        """Test batch lookups keep order and only return the user's entries"""
+        for name in ['alice', 'bob', 'alice']:
+            self.store.add_entry({'username': name, 'content': name})
+
+        entries = self.store.get_user_entries_by_ids('alice', [3, 2, 1])
+
+        self.assertEqual([int(e['id']) for e in entries], [3, 1])
+
+
+    def test_get_user_entries_pages_newest_first(self):
+        """Test that a user's entries come from the index by timestamp, a page at a time, without other users'"""
+        # Backdated, so timestamp order is the reverse of ID order
+        for i, name in enumerate(['alice', 'bob', 'alice', 'alice', 'bob', 'alice']):
+            self.store.add_entry({'username': name, 'timestamp': f'2024-01-0{9 - i} 09:00:00', 'content': name})
+
+        first, cursor = self.store.get_user_entries('alice', limit=2)
+        second, end = self.store.get_user_entries('alice', limit=10, cursor=cursor)
+
+        self.assertEqual([int(e['id']) for e in first], [1, 3])
+        self.assertEqual(cursor, 3)
+        self.assertEqual([int(e['id']) for e in second], [4, 6])
+        self.assertIsNone(end)
+        self.assertEqual(self.store.get_user_entries('carol'), ([], None))
+
+    def test_index_added_to_existing_table(self):
+        """Test that a table created before the index gets it on first use"""
+        client = boto3.client('dynamodb', region_name='us-east-1')
+        client.create_table(TableName='legacy-journal', KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+                            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'N'}],
+                            BillingMode='PAY_PER_REQUEST')
+        store = DynamoDBJournalStore(table_name='legacy-journal', region='us-east-1')
+        store.add_entry({'username': 'alice', 'timestamp': '2024-01-01 09:00:00'})
+
+        indexes = client.describe_table(TableName='legacy-journal')['Table']['GlobalSecondaryIndexes']
+        self.assertEqual([index['IndexName'] for index in indexes], [DynamoDBJournalStore.USER_INDEX])
+        self.assertEqual(len(store.get_user_entries('alice')[0]), 1)
+
+
+@unittest.skipUnless(moto_available, "moto is not installed")
+class TestCachedJournalStore(unittest.TestCase):
+    """Test the write-through cache against moto's local DynamoDB"""
+
+    def setUp(self):
+        """Start a mocked DynamoDB and count the reads that reach it"""
+        for key in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN'):
+            os.environ[key] = 'testing'
+        self.mock = mock_dynamodb()
+        self.mock.start()
+        self.dynamodb = DynamoDBJournalStore(table_name='test-journal', region='us-east-1')
+        # Backdated, so newest first is ascending ID order
+        for i in range(1, 6):
+            self.dynamodb.add_entry({'username': 'alice', 'timestamp': f'2024-01-0{9 - i} 09:00:00'})
+        self.reads = []
+        query = self.dynamodb.get_user_entries
+        self.dynamodb.get_user_entries = lambda *args, **kwargs: self.reads.append(args) or query(*args, **kwargs)
+        self.store = CachedJournalStore(self.dynamodb, ttl=60, max_users=2)
+
+    def tearDown(self):
+        """Stop the mock"""
+        self.mock.stop()
+
+    def ids(self, entries):
+        return [int(e['id']) for e in entries]
+
+    def test_repeat_pages_cost_no_reads(self):
+        """Test that pages already read are served from memory, and older ones read only what is missing"""
+        page, cursor = self.store.get_user_entries('alice', limit=2)
+        self.assertEqual((self.ids(page), cursor), ([1, 2], 2))
+        self.assertEqual(self.store.get_user_entries('alice', limit=2), (page, cursor))
+        self.assertEqual(len(self.reads), 1)
+
+        page, cursor = self.store.get_user_entries('alice', limit=2, cursor=2)
+        self.assertEqual((self.ids(page), cursor), ([3, 4], 4))
+        page, cursor = self.store.get_user_entries('alice', limit=2, cursor=4)
+        self.assertEqual((self.ids(page), cursor), ([5], None))
+        reads = len(self.reads)
+
+        self.assertEqual(self.ids(self.store.get_user_entries('alice')[0]), [1, 2, 3, 4, 5])
+        self.assertEqual(self.ids(self.store.get_user_entries('alice', 2, cursor=2)[0]), [3, 4])
+        self.assertEqual(self.ids(self.store.get_user_entries_by_ids('alice', [5, 1])), [5, 1])
+        self.assertEqual(len(self.reads), reads)
+        self.assertEqual(self.store.status()['misses'], reads)
+
+    def test_writes_go_through_to_the_cache(self):
+        """Test that added and deleted entries show up without another read"""
+        self.store.get_user_entries('alice')
+        entry = self.store.add_entry({'username': 'alice', 'timestamp': '2024-01-09 09:00:00'})
+        self.store.delete_entry(2, 'alice')
+
+        self.assertEqual(self.ids(self.store.get_user_entries('alice')[0]), [entry['id'], 1, 3, 4, 5])
+        self.assertEqual(len(self.reads), 1)
+        self.assertEqual(self.ids(self.dynamodb.get_user_entries('alice')[0]), [entry['id'], 1, 3, 4, 5])
+
+    def test_writes_from_other_workers_are_read_again(self):
+        """Test that a cached user is read again once their shared generation moves on"""
+        generations = {'alice': 1}
+        self.store.generation = generations.get
+        self.store.get_user_entries('alice')
+        self.store.get_user_entries('alice')
+        self.assertEqual(len(self.reads), 1)
+
+        # Another worker writes straight to DynamoDB and bumps the generation
+        entry = self.dynamodb.add_entry({'username': 'alice', 'timestamp': '2024-01-09 09:00:00'})
+        generations['alice'] = 2
+        self.assertEqual(self.ids(self.store.get_user_entries('alice')[0]), [entry['id'], 1, 2, 3, 4, 5])
+        self.assertEqual(len(self.reads), 2)
+        self.assertEqual(self.ids(self.store.get_user_entries_by_ids('alice', [entry['id']])), [entry['id']])
+        self.assertEqual(len(self.reads), 2)
+
+    def test_expired_and_evicted_users_are_read_again(self):
+        """Test the TTL and the LRU bound"""
+        self.store.get_user_entries('alice')
+        self.store.get_user_entries('bob')
+        self.store.get_user_entries('carol')
+        self.assertEqual(self.store.status()['evictions'], 1)
+        self.store.get_user_entries('alice')
+        self.assertEqual(len(self.reads), 4)
+
+        self.store.ttl = 0
+        self.store.invalidate()
+        self.store.get_user_entries('alice')
+        self.store.get_user_entries('alice')
+        self.assertEqual(len(self.reads), 6)
+
+@unittest.skipUnless(moto_available, "moto is not installed")
+class TestAWSJournalBackup(unittest.TestCase):
+    """Test incremental S3 backups against moto's local S3"""
+
+    def setUp(self):
+        """Start a mocked S3 with fake credentials"""
+        for key in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN'):
+            os.environ[key] = 'testing'
+        self.mock = mock_s3()
+        self.mock.start()
+        self.backup = AWSJournalBackup(bucket_name='test-backups', region='us-east-1', full_every=2)
+        # The bucket is created on first use; tests that write to it directly need it up front
+        self.backup.probe()
+        self.s3 = boto3.client('s3', region_name='us-east-1')
+
+    def tearDown(self):
+        """Stop the mock"""
+        self.mock.stop()
+
+    def keys(self, prefix):
+        response = self.s3.list_objects_v2(Bucket='test-backups', Prefix='journal_backups/' + prefix)
+        return [obj['Key'] for obj in response.get('Contents', [])]
+
+    def test_deltas_hold_only_new_entries(self):
+        """Test that later backups upload just the entries past the checkpoint"""
+        entries = [{'id': 1, 'content': 'a'}, {'id': 2, 'content': 'b'}]
+        self.assertTrue(self.backup.backup_entries(entries))
+        entries.append({'id': 3, 'content': 'c'})
+        self.assertTrue(self.backup.backup_entries(entries))
+        self.assertTrue(self.backup.backup_entries(entries))
+
+        self.assertEqual(len(self.keys('snapshots/')), 1)
+        deltas = self.keys('deltas/')
+        self.assertEqual(len(deltas), 1)
+        self.assertEqual(self.backup._get_entries(deltas[0]), [{'id': 3, 'content': 'c'}])
+        self.assertEqual(self.backup.restore_from_backup(), entries)
+
+    def test_snapshot_replaces_long_or_invalid_chains(self):
+        """Test that a full snapshot follows too many deltas or a deletion, deleting old chains one snapshot later"""
+        entries = [{'id': 1}]
+        self.backup.backup_entries(entries)
+        for entry_id in (2, 3):
+            entries.append({'id': entry_id})
+            self.backup.backup_entries(entries)
+        first_chain = self.keys('')
+        first_chain.remove('journal_backups/manifest.json')
+        self.assertEqual(len(self.keys('deltas/')), 2)
+
+        entries.append({'id': 4})
+        self.backup.backup_entries(entries)
+        manifest = self.backup._read_manifest()
+        self.assertEqual(manifest['deltas'], [])
+        self.assertEqual(sorted(manifest['superseded']), first_chain)
+        self.assertEqual(len(self.keys('snapshots/')), 2)
+        self.assertEqual(self.backup.restore_from_backup(), entries)
+
+        entries.append({'id': 5})
+        self.backup.backup_entries(entries)
+        self.assertEqual(len(self.backup._read_manifest()['deltas']), 1)
+
+        del entries[0]
+        self.assertFalse(self.backup.backup_entries(entries))
+        self.assertTrue(self.backup.backup_entries(entries, allow_shrink=True))
+        self.assertEqual(self.backup._read_manifest()['deltas'], [])
+        self.assertFalse(set(first_chain) & set(self.keys('')))
+        self.assertEqual(self.backup.restore_from_backup(), entries)
+
+    def test_partial_journal_cannot_replace_the_backup(self):
+        """Test that an empty or half-restored journal is refused instead of overwriting the backup"""
+        entries = [{'id': i, 'content': str(i)} for i in range(10, 15)]
+        self.backup.backup_entries(entries)
+        fresh = AWSJournalBackup(bucket_name='test-backups', region='us-east-1')
+
+        self.assertFalse(fresh.backup_entries([{'id': 1, 'content': 'new'}]))
+        # More entries, but numbered from a fresh counter below the backup's
+        self.assertFalse(fresh.backup_entries([{'id': i} for i in range(1, 7)]))
+
+        self.assertEqual(fresh.status()['refused'], 2)
+        self.assertEqual(fresh.restore_from_backup(), entries)
+
+    def test_compact_folds_deltas_server_side(self):
+        """Test compacting the chain from what is already stored in S3"""
+        self.backup.backup_entries([{'id': 1}])
+        self.backup.backup_entries([{'id': 1}, {'id': 2}])
+
+        self.assertTrue(self.backup.compact())
+
+        self.assertEqual(self.backup._read_manifest()['deltas'], [])
+        self.assertEqual(self.backup.restore_from_backup(), [{'id': 1}, {'id': 2}])
+
+    def test_restores_legacy_latest_backup(self):
+        """Test that a pre-manifest latest.json backup can still be restored"""
+        self.assertIsNone(self.backup.restore_from_backup())
+        self.s3.put_object(Bucket='test-backups', Key='journal_backups/latest.json',
+                           Body=journal_codec.dumps([{'id': 1, 'content': 'old'}]))
+
+        progress = RestoreProgress()
+        self.assertEqual(self.backup.restore_from_backup(progress), [{'id': 1, 'content': 'old'}])
+        self.assertEqual(progress.status()['entries'], 1)
+        self.assertEqual(progress.status()['bytes_done'], progress.status()['bytes_total'])
+
+
+    def test_unchanged_journal_is_not_uploaded(self):
+        """Test that re-saving the same entries, e.g. right after a restore, skips the upload"""
+        entries = [{'id': 1, 'content': 'a'}, {'id': 2, 'content': 'b'}]
+        self.backup.backup_entries(entries)
+        restored = AWSJournalBackup(bucket_name='test-backups', region='us-east-1').restore_from_backup()
+
+        self.assertTrue(self.backup.backup_entries(restored))
+        self.assertTrue(self.backup.backup_entries(list(reversed(entries))))
+        self.assertEqual(self.backup.status(), {'uploaded': 1, 'skipped': 2, 'refused': 0,
+                                                'bytes_uploaded': self.backup.status()['bytes_uploaded']})
+        self.assertEqual(len(self.keys('')), 2)
+
+    def test_edited_entry_forces_snapshot(self):
+        """Test that an edit behind the checkpoint is caught by the digest rather than lost"""
+        self.backup.backup_entries([{'id': 1, 'content': 'a'}])
+        self.backup.backup_entries([{'id': 1, 'content': 'a'}, {'id': 2, 'content': 'b'}])
+        edited = [{'id': 1, 'content': 'edited'}, {'id': 2, 'content': 'b'}]
+
+        self.backup.backup_entries(edited)
+
+        self.assertEqual(self.backup._read_manifest()['deltas'], [])
+        self.assertEqual(self.backup.restore_from_backup(), edited)
+
+    def test_restore_downloads_in_ranged_parts(self):
+        """Test that a restore split into many small ranges reassembles every entry and reports progress"""
+        entries = [{'id': i, 'content': f'entry {i} ' * 20} for i in range(1, 201)]
+        self.backup.backup_entries(entries[:150])
+        self.backup.backup_entries(entries)
+        self.backup.restore_part_size = 256
+        progress = RestoreProgress()
+
+        self.assertEqual(self.backup.restore_from_backup(progress), entries)
+        status = progress.status()
+        self.assertEqual(status['objects'], 2)
+        self.assertGreater(status['bytes_total'], 256)
+        self.assertEqual(status['bytes_done'], status['bytes_total'])
+        self.assertEqual(status['entries'], 200)
+
+    def test_restores_array_snapshot(self):
+        """Test that a snapshot stored as one gzipped JSON array still restores"""
+        self.backup.backup_entries([{'id': 1}])
+        snapshot = self.keys('snapshots/')[0]
+        self.s3.put_object(Bucket='test-backups', Key=snapshot,
+                           Body=gzip.compress(journal_codec.dumps([{'id': 1, 'content': 'array'}]).encode('utf-8')))
+
+        self.assertEqual(self.backup.restore_from_backup(), [{'id': 1, 'content': 'array'}])
+
+class FakeBackup:
+    """Records backups instead of uploading them, failing the first few on request"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.uploads = []
+        self.uploaded = threading.Event()
+
+    def backup_entries(self, entries):
+        if self.failures:
+            self.failures -= 1
+            return False
+        self.uploads.append(list(entries))
+        self.uploaded.set()
+        return True
+
+
+class TestBackupWorker(unittest.TestCase):
+    """Test the background, coalescing backup worker"""
+
+    def setUp(self):
+        """Track a journal that grows as entries are written"""
+        self.entries = []
+
+    def test_burst_is_coalesced_into_one_upload(self):
+        """Test that requests within the debounce window share one upload of the latest journal"""
+        backup = FakeBackup()
+        worker = BackupWorker(backup, lambda: self.entries, debounce=0.2)
+
+        started = time.monotonic()
+        for i in range(5):
+            self.entries.append({'id': i})
+            worker.request()
+        self.assertLess(time.monotonic() - started, 0.1)
+
+        self.assertTrue(backup.uploaded.wait(5))
+        self.assertTrue(worker.flush(5))
+        self.assertEqual(backup.uploads, [[{'id': i} for i in range(5)]])
+        self.assertEqual(worker.status()['uploads'], 1)
+        self.assertFalse(worker.status()['pending'])
+
+    def test_failed_uploads_are_retried(self):
+        """Test bounded retries with backoff, and giving up once they run out"""
+        backup = FakeBackup(failures=2)
+        worker = BackupWorker(backup, lambda: self.entries, debounce=0, max_retries=2, backoff=0.01)
+        worker.request()
+        worker.flush(5)
+
+        self.assertEqual(len(backup.uploads), 1)
+        self.assertEqual(worker.status()['retries'], 2)
+
+        backup.failures = 5
+        worker.request()
+        worker.flush(5)
+        self.assertEqual(worker.status()['failures'], 1)
+        self.assertIsNotNone(worker.status()['last_error'])
+
+
+
+class TestReadinessProbe(unittest.TestCase):
+    """Test lazy AWS setup and the background readiness checks"""
+
+    def test_constructing_clients_touches_no_network(self):
+        """Test that the backup and store connect only on first use"""
+        backup = AWSJournalBackup(bucket_name='test-backups', region='us-east-1')
+        store = DynamoDBJournalStore(table_name='test-journal', region='us-east-1')
+        self.assertIsNone(backup._client)
+        self.assertEqual(store._resources, (None, None, None))
+
+    def test_failed_checks_are_retried_until_ready(self):
+        """Test that the probe reports failures and becomes ready once every check passes"""
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 2:
+                raise RuntimeError("bucket unreachable")
+            return True
+
+        probe = ReadinessProbe({'ok': lambda: True, 'flaky': flaky}, retry_interval=0.01)
+        self.assertFalse(probe.ready())
+        self.assertEqual(probe.status()['state'], 'pending')
+        probe.start()
+        probe._thread.join(5)
+
+        self.assertTrue(probe.ready())
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(probe.status(), {'state': 'ready', 'checks': {'ok': {'ok': True, 'error': None},
+                                                                       'flaky': {'ok': True, 'error': None}}})
+
+    def test_no_checks_is_ready(self):
+        """Test that a probe with nothing to check is ready straight away"""
+        self.assertTrue(ReadinessProbe({}).ready())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import os
+import shutil
+import tempfile
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from journal_archive import ArchiveSegment
+
+
+class TestArchiveSegment(unittest.TestCase):
+    """Test the memory-mapped columnar archive segment"""
+
+    def setUp(self):
+        """Write a segment in a temporary directory"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.entries = [
+            {'id': 1, 'username': 'alice', 'timestamp': '2024-01-01 09:00:00', 'mood': 'good',
+             'energy': 'High', 'focus': 'Daily Reflection', 'content': 'Café', 'tags': ['food']},
+            {'id': 4, 'content': 'legacy', 'mood': None},
+            {'id': 7, 'username': 'alice', 'timestamp': 'yesterday', 'mood': 'bad'},
+        ]
+        path = os.path.join(self.temp_dir, 'journal.json.1.seg')
+        with open(path, 'wb') as f:
+            f.write(ArchiveSegment.encode(self.entries))
+        self.segment = ArchiveSegment(path)
+
+    def tearDown(self):
+        """Clean up"""
+        self.segment.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_entries_round_trip(self):
+        """Test that entries decode exactly, including fields kept out of the columns"""
+        self.assertEqual(len(self.segment), 3)
+        self.assertEqual(self.segment.entries(), self.entries)
+        self.assertEqual(list(self.segment.ids), [1, 4, 7])
+
+    def test_lookups_and_pages(self):
+        """Test ID lookups and newest-first pages that skip deleted IDs"""
+        self.assertEqual(self.segment.find(4), 1)
+        self.assertIsNone(self.segment.find(5))
+        self.assertEqual([e['id'] for e in self.segment.latest(2)], [7, 4])
+        self.assertEqual([e['id'] for e in self.segment.latest(2, before_id=7, skip={4})], [1])
+
+    def test_summaries_come_from_columns(self):
+        """Test that summaries carry only the columnar fields"""
+        summaries = list(self.segment.summaries())
+
+        self.assertEqual(summaries[0], {'id': 1, 'username': 'alice', 'timestamp': '2024-01-01 09:00:00',
+                                        'mood': 'good', 'energy': 'High', 'focus': 'Daily Reflection'})
+        self.assertNotIn('timestamp', summaries[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import journal_codec
+from journal_codec import ENTRY_FIELDS, JournalEntry, JsonCodec, get_codec
+
+
+class TestJournalEntry(unittest.TestCase):
+    """Test the slot-based entry representation"""
+
+    def test_full_entry_round_trips_as_row(self):
+        """Test that an entry with every field encodes as a bare row"""
+        data = {field: f'value {i}' for i, field in enumerate(ENTRY_FIELDS)}
+        entry = JournalEntry.from_dict(data)
+
+        self.assertEqual(entry.encode(), [data[field] for field in ENTRY_FIELDS])
+        self.assertEqual(JournalEntry.decode(entry.encode()).to_dict(), data)
+        self.assertFalse(hasattr(entry, '__dict__'))
+
+    def test_sparse_entry_keeps_exact_keys(self):
+        """Test that missing fields stay missing and unknown keys are kept"""
+        data = {'id': 7, 'content': 'old entry', 'legacy_field': 1}
+        entry = JournalEntry.from_dict(data)
+
+        self.assertEqual(entry.to_dict(), data)
+        self.assertEqual(entry.encode(), data)
+        self.assertIsNone(entry.get('username'))
+        self.assertEqual(entry.get('legacy_field'), 1)
+
+
+class TestCodecs(unittest.TestCase):
+    """Test the pluggable JSON codecs"""
+
+    def tearDown(self):
+        """Restore the default codec"""
+        journal_codec.set_codec(None)
+
+    def test_codecs_agree(self):
+        """Test that every codec writes compact JSON the others can read"""
+        obj = {'generation': 1, 'entries': [[1, 'Café', None, ['a', 'b']]]}
+        for codec in journal_codec.CODECS.values():
+            encoded = codec.dumps(obj)
+            self.assertNotIn(' ', encoded)
+            for other in journal_codec.CODECS.values():
+                self.assertEqual(other.loads(encoded), obj)
+
+    def test_select_codec(self):
+        """Test choosing a codec by name, falling back to json"""
+        self.assertIs(get_codec('json'), JsonCodec)
+        self.assertIs(get_codec('missing'), JsonCodec)
+        self.assertIs(journal_codec.set_codec('json'), JsonCodec)
+        self.assertEqual(journal_codec.loads(journal_codec.dumps({'a': 1})), {'a': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
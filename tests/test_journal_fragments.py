@@ -0,0 +1,60 @@
+import unittest
+import os
+import shutil
+import tempfile
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from journal_fragments import FragmentCache
+
+
+class TestFragmentCache(unittest.TestCase):
+    """Test the rendered fragment cache"""
+
+    def setUp(self):
+        """Create a temporary directory for the persistent cache"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'search_index.db')
+
+    def tearDown(self):
+        """Clean up"""
+        shutil.rmtree(self.temp_dir)
+
+    def test_fragments_match_only_their_version(self):
+        """Test that a fragment is served for its own version and replaced by a newer one"""
+        cache = FragmentCache()
+        cache.put_many([(1, 'v1', '<div>one</div>')])
+
+        self.assertEqual(cache.get_many([(1, 'v1')]), {1: '<div>one</div>'})
+        self.assertEqual(cache.get_many([(1, 'v2'), (2, 'v1')]), {})
+
+        cache.put_many([(1, 'v2', '<div>uno</div>')])
+        self.assertEqual(cache.get_many([(1, 'v2')]), {1: '<div>uno</div>'})
+        self.assertEqual(cache.status()['fragments'], 1)
+
+    def test_eviction_keeps_memory_bounded(self):
+        """Test that the least recently used fragments go once the byte budget is spent"""
+        cache = FragmentCache(max_bytes=30)
+        cache.put_many([(1, 'v', 'a' * 10), (2, 'v', 'b' * 10), (3, 'v', 'c' * 10)])
+        cache.get_many([(1, 'v')])
+
+        cache.put_many([(4, 'v', 'd' * 10)])
+
+        self.assertEqual(set(cache.get_many([(i, 'v') for i in range(1, 5)])), {1, 3, 4})
+        status = cache.status()
+        self.assertEqual((status['evictions'], status['bytes']), (1, 30))
+
+    def test_persisted_fragments_survive_a_restart(self):
+        """Test that a new cache on the same file serves fragments rendered by an earlier one"""
+        FragmentCache(path=self.path).put_many([(1, 'v1', '<div>one</div>'), (2, 'v1', '<div>two</div>')])
+
+        cache = FragmentCache(path=self.path)
+
+        self.assertEqual(cache.get_many([(1, 'v1'), (2, 'v2')]), {1: '<div>one</div>'})
+        self.assertEqual(cache.status()['disk_hits'], 1)
+        cache.clear()
+        self.assertEqual(FragmentCache(path=self.path).get_many([(1, 'v1')]), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+import os
+import shutil
+import tempfile
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from journal_search import JournalSearchIndex, JournalTagIndex, tokenize
+
+
+class TestJournalSearchIndex(unittest.TestCase):
+    """Test the full-text journal search index"""
+
+    def setUp(self):
+        """Create an index in a temporary directory"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.index = JournalSearchIndex(os.path.join(self.temp_dir, 'search_index.db'))
+
+    def tearDown(self):
+        """Clean up"""
+        shutil.rmtree(self.temp_dir)
+
+    def test_tokenize(self):
+        """Test that text is split into lowercase words"""
+        self.assertEqual(tokenize("Walked 5km, felt GREAT!"), ['walked', '5km', 'felt', 'great'])
+        self.assertEqual(tokenize(None), [])
+
+    def test_prefix_search_across_fields(self):
+        """Test prefix matching over content, tags, gratitude and action items"""
+        self.index.add_entry({'id': 1, 'username': 'alice', 'content': 'Morning run by the river',
+                              'tags': ['fitness'], 'gratitude': ['Sunshine'], 'action_item': 'Stretch more'})
+
+        for query in ['riv', 'fit', 'sunsh', 'stretch', 'morn run']:
+            self.assertEqual([e['id'] for e in self.index.search('alice', query)], [1], query)
+        self.assertEqual(self.index.search('alice', 'swim'), [])
+
+    def test_results_are_ranked(self):
+        """Test that stronger matches rank first"""
+        self.index.add_entry({'id': 1, 'username': 'alice', 'content': 'A long day of meetings, one mention of budget'})
+        self.index.add_entry({'id': 2, 'username': 'alice', 'content': 'Budget budget budget', 'tags': ['budget']})
+
+        self.assertEqual([e['id'] for e in self.index.search('alice', 'budget')], [2, 1])
+
+    def test_search_is_per_user(self):
+        """Test that users never see each other's entries"""
+        self.index.add_entry({'id': 1, 'username': 'alice', 'content': 'secret plans'})
+        self.index.add_entry({'id': 2, 'username': 'bob', 'content': 'secret recipe'})
+
+        self.assertEqual([e['id'] for e in self.index.search('bob', 'secret')], [2])
+
+    def test_remove_and_rebuild(self):
+        """Test removing an entry and rebuilding from existing data"""
+        self.index.add_entry({'id': 1, 'username': 'alice', 'content': 'first'})
+        self.index.remove_entry(1)
+        self.assertEqual(self.index.search('alice', 'first'), [])
+
+        count = self.index.rebuild([{'id': i, 'username': 'alice', 'content': f'entry {i}'} for i in range(1, 1201)])
+
+        self.assertEqual(count, 1200)
+        self.assertEqual(len(self.index.search('alice', 'entry', limit=1000)), 1000)
+
+
+class TestJournalTagIndex(unittest.TestCase):
+    """Test the per-user tag index"""
+
+    def setUp(self):
+        """Create an index with a few tagged entries"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.index = JournalTagIndex(os.path.join(self.temp_dir, 'search_index.db'))
+        self.index.add_entry({'id': 1, 'username': 'alice', 'tags': ['Work', 'goals']})
+        self.index.add_entry({'id': 2, 'username': 'alice', 'tags': ['work']})
+        self.index.add_entry({'id': 3, 'username': 'alice', 'tags': ['health', 'goals']})
+        self.index.add_entry({'id': 4, 'username': 'bob', 'tags': ['work']})
+
+    def tearDown(self):
+        """Clean up"""
+        shutil.rmtree(self.temp_dir)
+
+    def test_facet_counts(self):
+        """Test that counts are kept per user and tags are case-insensitive"""
+        self.assertEqual(self.index.facets('alice'), [
+            {'tag': 'goals', 'count': 2}, {'tag': 'work', 'count': 2}, {'tag': 'health', 'count': 1}])
+        self.assertEqual(self.index.facets('bob'), [{'tag': 'work', 'count': 1}])
+
+    def test_and_or_filters(self):
+        """Test matching all or any of several tags"""
+        self.assertEqual(self.index.entry_ids('alice', ['work', 'goals'], 'and'), [1])
+        self.assertEqual(self.index.entry_ids('alice', ['work', 'goals'], 'or'), [3, 2, 1])
+        self.assertEqual(self.index.entry_ids('alice', ['work'], 'or', limit=1, before_id=2), [1])
+        self.assertEqual(self.index.entry_ids('alice', []), [])
+
+    def test_remove_entry_updates_counts(self):
+        """Test that removing an entry decrements and drops counts"""
+        self.index.remove_entry(3, 'alice')
+
+        self.assertEqual(self.index.facets('alice'), [{'tag': 'work', 'count': 2}, {'tag': 'goals', 'count': 1}])
+
+    def test_rebuild(self):
+        """Test rebuilding from existing entries"""
+        self.assertEqual(self.index.rebuild([{'id': 9, 'username': 'carol', 'tags': ['art']}]), 1)
+
+        self.assertEqual(self.index.facets('alice'), [])
+        self.assertEqual(self.index.entry_ids('carol', ['art']), [9])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+import os
+import shutil
+import tempfile
+import sys
+from datetime import date
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from journal_stats import JournalRollups, entry_buckets
+
+
+def make_entry(timestamp, mood='good', energy='Medium', focus='Daily Reflection', username='alice'):
+    """Build a minimal journal entry for rollups"""
+    return {'username': username, 'timestamp': timestamp, 'mood': mood, 'energy': energy, 'focus': focus}
+
+
+class TestJournalRollups(unittest.TestCase):
+    """Test incrementally maintained mood, energy and focus rollups"""
+
+    def setUp(self):
+        """Create rollups in a temporary directory"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.rollups = JournalRollups(os.path.join(self.temp_dir, 'search_index.db'))
+
+    def tearDown(self):
+        """Clean up"""
+        shutil.rmtree(self.temp_dir)
+
+    def test_entry_buckets(self):
+        """Test that timestamps map to ISO week and calendar buckets"""
+        self.assertEqual(entry_buckets({'timestamp': '2024-12-30 08:00:00'}),
+                         {'day': '2024-12-30', 'week': '2025-W01', 'month': '2024-12'})
+        self.assertIsNone(entry_buckets({'timestamp': None}))
+
+    def test_buckets_aggregate_per_period(self):
+        """Test averages and focus counts per day, week and month"""
+        self.rollups.add_entry(make_entry('2024-03-04 09:00:00', mood='excellent', energy='High'))
+        self.rollups.add_entry(make_entry('2024-03-05 09:00:00', mood='bad', energy='Low', focus='Weekly Goals'))
+        self.rollups.add_entry(make_entry('2024-04-01 09:00:00', mood='okay', energy=None))
+        self.rollups.add_entry(make_entry('2024-03-04 10:00:00', username='bob'))
+
+        months = self.rollups.buckets('alice', 'month')
+        self.assertEqual([b['bucket'] for b in months], ['2024-03', '2024-04'])
+        self.assertEqual(months[0]['avg_mood'], 3.5)
+        self.assertEqual(months[0]['focus'], {'Daily Reflection': 1, 'Weekly Goals': 1})
+        self.assertIsNone(months[1]['avg_energy'])
+        self.assertEqual([b['bucket'] for b in self.rollups.buckets('alice', 'day', limit=2)],
+                         ['2024-03-05', '2024-04-01'])
+        self.assertEqual(self.rollups.buckets('alice', 'week')[0]['entries'], 2)
+        with self.assertRaises(ValueError):
+            self.rollups.buckets('alice', 'year')
+
+    def test_remove_entry(self):
+        """Test that removing an entry takes it back out of its buckets"""
+        first = make_entry('2024-03-04 09:00:00', mood='excellent')
+        self.rollups.add_entry(first)
+        self.rollups.add_entry(make_entry('2024-03-04 10:00:00', mood='awful', focus='Weekly Goals'))
+
+        self.rollups.remove_entry(first)
+
+        day = self.rollups.buckets('alice', 'day')[0]
+        self.assertEqual((day['entries'], day['avg_mood'], day['focus']), (1, 1, {'Weekly Goals': 1}))
+
+    def test_streaks(self):
+        """Test current and longest runs of consecutive journaling days"""
+        for day in ['2024-03-01', '2024-03-02', '2024-03-03', '2024-03-10', '2024-03-11']:
+            self.rollups.add_entry(make_entry(f'{day} 09:00:00'))
+
+        self.assertEqual(self.rollups.streaks('alice', today=date(2024, 3, 12)), {'current': 2, 'longest': 3})
+        self.assertEqual(self.rollups.streaks('alice', today=date(2024, 3, 13)), {'current': 0, 'longest': 3})
+        self.assertEqual(self.rollups.streaks('carol'), {'current': 0, 'longest': 0})
+
+    def test_rebuild(self):
+        """Test backfilling rollups from existing entries"""
+        self.rollups.add_entry(make_entry('2024-01-01 09:00:00'))
+
+        count = self.rollups.rebuild([make_entry('2024-03-04 09:00:00'), {'username': 'alice'}])
+
+        self.assertEqual(count, 1)
+        self.assertEqual([b['bucket'] for b in self.rollups.buckets('alice', 'month')], ['2024-03'])
+
+
+if __name__ == '__main__':
+    unittest.main()
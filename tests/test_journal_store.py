@@ -0,0 +1,386 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import threading
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from journal_store import LocalJournalStore, PartitionedJournalStore, SQLiteJournalStore
+
+
+class TestLocalJournalStore(unittest.TestCase):
+    """Test the append-only local journal store"""
+
+    def setUp(self):
+        """Create a store in a temporary directory"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'journal_entries.json')
+        self.store = LocalJournalStore(self.path)
+
+    def tearDown(self):
+        """Clean up"""
+        shutil.rmtree(self.temp_dir)
+
+    def test_reads_legacy_journal_file(self):
+        """Test that a pretty-printed list of entries is still readable"""
+        with open(self.path, 'w') as f:
+            json.dump([{'id': 1, 'content': 'old'}, {'id': 2, 'content': 'older'}], f, indent=4)
+
+        self.assertEqual([e['id'] for e in self.store.get_all_entries()], [1, 2])
+        self.assertEqual(self.store.add_entry({'content': 'new'})['id'], 3)
+
+    def test_snapshot_stores_rows_and_reads_keyed_entries(self):
+        """Test the compact row snapshot alongside the older keyed-object snapshot"""
+        full = {'id': 1, 'username': 'alice', 'timestamp': '2024-01-01 09:00:00', 'date': 'January 01, 2024',
+                'time': '09:00 AM', 'focus': 'Daily Reflection', 'content': 'Caf\u00e9', 'mood': 'good',
+                'energy': 'High', 'gratitude': [], 'action_item': '', 'tags': ['food'], 'version': '2.0'}
+        sparse = {'id': 2, 'content': 'no username', 'legacy_field': True}
+        self.store.replace_all([full, sparse])
+
+        with open(self.path) as f:
+            data = json.load(f)
+        self.assertIsInstance(data['entries'][0], list)
+        self.assertEqual(data['entries'][1], sparse)
+        self.assertEqual(self.store.get_all_entries(), [full, sparse])
+
+        with open(self.path, 'w') as f:
+            json.dump({'generation': 3, 'next_id': 5, 'entries': [full]}, f, indent=4)
+        self.assertEqual(self.store.get_all_entries(), [full])
+        self.assertEqual(self.store.add_entry({'content': 'new'})['id'], 5)
+
+    def test_add_entry_appends_without_rewriting_snapshot(self):
+        """Test that adding entries only appends to the log"""
+        self.store.replace_all([{'id': 1, 'content': 'first'}])
+        snapshot_mtime = os.stat(self.path).st_mtime_ns
+
+        self.store.add_entry({'content': 'second'})
+        self.store.add_entry({'content': 'third'})
+
+        self.assertEqual(os.stat(self.path).st_mtime_ns, snapshot_mtime)
+        self.assertEqual([e['content'] for e in self.store.get_all_entries()], ['first', 'second', 'third'])
+        self.assertEqual([e['id'] for e in self.store.get_all_entries()], [1, 2, 3])
+
+    def test_compaction_folds_log_into_snapshot(self):
+        """Test that compaction keeps entries and resets the log"""
+        for i in range(3):
+            self.store.add_entry({'content': f'entry {i}'})
+        self.store.delete_entry(2)
+
+        self.store.compact()
+
+        with open(self.store.log_path) as f:
+            self.assertEqual(len(f.readlines()), 1)
+        self.assertEqual([e['id'] for e in self.store.get_all_entries()], [1, 3])
+        self.assertEqual(self.store.add_entry({'content': 'after'})['id'], 4)
+
+    def test_background_compaction(self):
+        """Test that a large log is compacted in the background"""
+        store = LocalJournalStore(self.path, compact_threshold=1)
+        store.add_entry({'content': 'entry'})
+        store._compaction_thread.join()
+
+        with open(self.path) as f:
+            self.assertEqual(len(json.load(f)['entries']), 1)
+
+    def test_archives_cold_entries(self):
+        """Test that compaction moves old entries to a segment that reads stay transparent over"""
+        store = LocalJournalStore(self.path, archive_after_days=30)
+        for i, timestamp in enumerate(['2020-01-01 09:00:00', '2020-01-02 09:00:00', '2999-01-01 09:00:00']):
+            store.add_entry({'username': 'alice', 'timestamp': timestamp, 'mood': 'good', 'content': f'entry {i}'})
+
+        store.compact()
+
+        self.assertTrue(os.path.exists(self.path + '.1.seg'))
+        with open(self.path) as f:
+            self.assertEqual(len(json.load(f)['entries']), 1)
+        self.assertEqual([e['id'] for e in store.get_latest_entries(2)], [3, 2])
+        self.assertEqual([e['id'] for e in store.get_latest_entries(5, before_id=3)], [2, 1])
+        self.assertEqual(store.get_entries_by_ids([1])[0]['content'], 'entry 0')
+        self.assertEqual([s['id'] for s in store.get_entry_summaries()], [1, 2, 3])
+
+        store.delete_entry(1)
+        self.assertEqual([e['id'] for e in store.get_all_entries()], [2, 3])
+        store.compact()
+        self.assertEqual(store.get_entries_by_ids([1, 2]), [store.get_all_entries()[0]])
+
+        store.replace_all([])
+        self.assertEqual([f for f in os.listdir(self.temp_dir) if f.endswith('.seg')], [])
+
+    def test_latest_entries_page(self):
+        """Test newest-first pages before a cursor"""
+        for i in range(5):
+            self.store.add_entry({'content': f'entry {i}'})
+
+        self.assertEqual([e['id'] for e in self.store.get_latest_entries(2)], [5, 4])
+        self.assertEqual([e['id'] for e in self.store.get_latest_entries(2, before_id=4)], [3, 2])
+        self.assertEqual([e['id'] for e in self.store.get_latest_entries(2, before_id=2)], [1])
+
+    def test_reads_are_cached_until_another_writer_changes_the_files(self):
+        """Test that repeat reads are cached and writes from other workers are seen"""
+        other_worker = LocalJournalStore(self.path)
+        self.store.add_entry({'content': 'first'})
+
+        self.assertEqual(len(self.store.get_all_entries()), 1)
+        self.assertEqual(len(self.store.get_all_entries()), 1)
+        self.assertEqual(self.store._cache.hits, 1)
+
+        other_worker.add_entry({'content': 'second'})
+        self.assertEqual(len(self.store.get_all_entries()), 2)
+        other_worker.compact()
+        self.assertEqual(len(self.store.get_all_entries()), 2)
+        self.assertEqual(self.store._cache.misses, 3)
+
+    def test_torn_append_is_recovered(self):
+        """Test that a partial record from a crash is ignored and trimmed"""
+        self.store.add_entry({'content': 'complete'})
+        with open(self.store.log_path, 'a') as f:
+            f.write('{"op":"add","next_id":3,"entry":{"id":2,"cont')
+
+        self.assertEqual(len(self.store.get_all_entries()), 1)
+        self.assertEqual(self.store.add_entry({'content': 'next'})['id'], 2)
+        self.assertEqual([e['content'] for e in self.store.get_all_entries()], ['complete', 'next'])
+
+    def test_stale_log_after_interrupted_compaction(self):
+        """Test that a log already folded into the snapshot is not replayed"""
+        self.store.add_entry({'content': 'one'})
+        with open(self.store.log_path) as f:
+            stale_log = f.read()
+        self.store.compact()
+        # Simulate a crash after the snapshot was replaced but before the log reset
+        with open(self.store.log_path, 'w') as f:
+            f.write(stale_log)
+
+        self.assertEqual(len(self.store.get_all_entries()), 1)
+        self.assertEqual(self.store.add_entry({'content': 'two'})['id'], 2)
+        self.assertEqual(len(self.store.get_all_entries()), 2)
+
+
+class TestPartitionedJournalStore(unittest.TestCase):
+    """Test the per-user partitioned journal store"""
+
+    def setUp(self):
+        """Create a store in a temporary directory"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'journal_entries.json')
+        self.store = PartitionedJournalStore(self.path)
+
+    def tearDown(self):
+        """Clean up"""
+        shutil.rmtree(self.temp_dir)
+
+    def test_merge_keeps_entries_written_before_a_restore(self):
+        """Test that merging a backup moves a clashing local entry instead of overwriting it"""
+        self.store.add_entry({'username': 'bob', 'content': 'new'})
+        self.store.reserve_ids(10)
+
+        moved = self.store.merge_entries([{'id': 1, 'username': 'alice', 'content': 'restored'}])
+
+        self.assertEqual(moved, 1)
+        self.assertEqual([(e['id'], e['content']) for e in self.store.get_all_entries()],
+                         [(1, 'restored'), (2, 'new')])
+        self.assertEqual(self.store.add_entry({'username': 'bob'})['id'], 10)
+
+    def test_partitions_kept_in_memory_are_bounded(self):
+        """Test that only the most recently used partitions stay open, and evicted ones reload"""
+        store = PartitionedJournalStore(self.path, max_partitions=2)
+        for username in ('alice', 'bob', 'carol'):
+            store.add_entry({'username': username, 'content': username})
+
+        self.assertEqual(list(store._partitions), ['user_bob', 'user_carol'])
+        self.assertEqual([e['content'] for e in store.get_user_entries('alice')], ['alice'])
+        self.assertEqual(list(store._partitions), ['user_carol', 'user_alice'])
+
+    def test_long_usernames_get_bounded_partition_names(self):
+        """Test that a username too long to quote into a file name still gets its own partition"""
+        long_name = 'ü' * 45
+        other = 'ü' * 44 + 'x'
+
+        self.store.add_entry({'username': long_name, 'content': 'long'})
+        self.store.add_entry({'username': other, 'content': 'other'})
+
+        self.assertEqual([e['content'] for e in self.store.get_user_entries(long_name)], ['long'])
+        self.assertEqual([e['content'] for e in self.store.get_user_entries(other)], ['other'])
+        self.assertLessEqual(len(self.store._partition_name(long_name)), self.store.MAX_PARTITION_NAME)
+
+    def test_usernames_containing_json_are_listed(self):
+        """Test that a username with '.json' in it is still found by whole-journal reads"""
+        self.store.add_entry({'username': 'bob.jsonx', 'content': 'bob'})
+        self.store.add_entry({'username': 'carol.json', 'content': 'carol'})
+        self.store.add_entry({'username': 'dave', 'content': 'dave'})
+        self.store.delete_entry(3, 'dave')
+
+        self.assertEqual([e['content'] for e in self.store.get_all_entries()], ['bob', 'carol'])
+
+    def test_migrates_single_file_journal(self):
+        """Test that an existing journal is split by user on first use"""
+        with open(self.path, 'w') as f:
+            json.dump([
+                {'id': 1, 'username': 'alice', 'content': 'a1'},
+                {'id': 2, 'username': 'bob', 'content': 'b1'},
+                {'id': 3, 'username': 'alice', 'content': 'a2'},
+            ], f, indent=4)
+
+        self.assertEqual([e['content'] for e in self.store.get_user_entries('alice')], ['a1', 'a2'])
+        self.assertEqual([e['content'] for e in self.store.get_user_entries('bob')], ['b1'])
+        self.assertEqual([e['id'] for e in self.store.get_all_entries()], [1, 2, 3])
+        self.assertEqual(self.store.add_entry({'username': 'bob', 'content': 'b2'})['id'], 4)
+
+    def test_user_reads_only_touch_their_partition(self):
+        """Test that another user's partition is never read"""
+        self.store.add_entry({'username': 'alice', 'content': 'mine'})
+        self.store.add_entry({'username': 'bob', 'content': 'theirs'})
+        # A corrupt neighbouring partition would break any read that touched it
+        with open(os.path.join(self.store.partition_dir, 'user_bob.json.log'), 'w') as f:
+            f.write('not json\n')
+
+        self.assertEqual([e['content'] for e in self.store.get_user_entries('alice')], ['mine'])
+
+    def test_ids_are_unique_across_partitions(self):
+        """Test that users share one ID sequence"""
+        ids = [self.store.add_entry({'username': name, 'content': 'x'})['id']
+               for name in ['alice', 'bob', 'alice', None]]
+
+        self.assertEqual(ids, [1, 2, 3, 4])
+        self.assertEqual(self.store.get_user_entries(None)[0]['id'], 4)
+
+    def test_concurrent_writers_get_distinct_ids(self):
+        """Test that parallel writers, as in separate workers, never share an ID"""
+        stores = [PartitionedJournalStore(self.path) for _ in range(4)]
+        ids = []
+
+        def write(store, name):
+            for _ in range(10):
+                ids.append(store.add_entry({'username': name, 'content': 'x'})['id'])
+
+        threads = [threading.Thread(target=write, args=(store, f'user{i % 2}')) for i, store in enumerate(stores)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(ids), list(range(1, 41)))
+
+    def test_get_user_entries_by_ids(self):
+        """Test looking up a user's entries by ID"""
+        for name in ['alice', 'bob', 'alice']:
+            self.store.add_entry({'username': name, 'content': name})
+
+        self.assertEqual([e['id'] for e in self.store.get_user_entries_by_ids('alice', [3, 2, 1])], [3, 1])
+
+    def test_delete_entry(self):
+        """Test deleting with and without the owner's username"""
+        self.store.add_entry({'username': 'alice', 'content': 'a'})
+        self.store.add_entry({'username': 'bob', 'content': 'b'})
+
+        self.assertTrue(self.store.delete_entry(1, username='alice'))
+        self.assertTrue(self.store.delete_entry(2))
+        self.assertFalse(self.store.delete_entry(3))
+        self.assertEqual(self.store.get_all_entries(), [])
+
+    def test_usernames_are_path_safe(self):
+        """Test that odd usernames cannot escape the partition directory"""
+        self.store.add_entry({'username': '../escape', 'content': 'x'})
+
+        self.assertIn('user_..%2Fescape.json.log', os.listdir(self.store.partition_dir))
+        self.assertEqual(len(self.store.get_user_entries('../escape')), 1)
+
+
+class TestSQLiteJournalStore(unittest.TestCase):
+    """Test the SQLite journal store"""
+
+    def setUp(self):
+        """Create a database in a temporary directory"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = SQLiteJournalStore(os.path.join(self.temp_dir, 'journal.db'))
+
+    def tearDown(self):
+        """Clean up"""
+        shutil.rmtree(self.temp_dir)
+
+    def test_uses_wal_mode(self):
+        """Test that the database runs in WAL mode"""
+        mode = self.store._connection().execute('PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual(mode, 'wal')
+
+    def test_add_and_query_entries(self):
+        """Test adding entries and reading them back per user and per tag"""
+        first = self.store.add_entry({'id': None, 'username': 'alice', 'timestamp': '2024-01-01 09:00:00',
+                                      'content': 'a1', 'tags': ['work', 'goals']})
+        self.store.add_entry({'username': 'bob', 'timestamp': '2024-01-01 10:00:00', 'content': 'b1', 'tags': ['work']})
+        self.store.add_entry({'username': 'alice', 'timestamp': '2024-01-02 09:00:00', 'content': 'a2', 'tags': []})
+
+        self.assertEqual(first['id'], 1)
+        self.assertEqual(list(first)[0], 'id')
+        self.assertEqual([e['content'] for e in self.store.get_all_entries()], ['a1', 'b1', 'a2'])
+        self.assertEqual([e['content'] for e in self.store.get_user_entries('alice')], ['a1', 'a2'])
+        self.assertEqual([e['content'] for e in self.store.get_user_entries_by_tag('alice', 'work')], ['a1'])
+
+    def test_latest_user_entries_page(self):
+        """Test newest-first pages before a cursor"""
+        for i in range(4):
+            self.store.add_entry({'username': 'alice' if i % 2 else 'bob', 'content': str(i)})
+
+        self.assertEqual([e['id'] for e in self.store.get_latest_user_entries('alice', 1)], [4])
+        self.assertEqual([e['id'] for e in self.store.get_latest_user_entries('alice', 5, before_id=4)], [2])
+
+    def test_get_user_entries_by_ids(self):
+        """Test looking up a user's entries by ID"""
+        for name in ['alice', 'bob', 'alice']:
+            self.store.add_entry({'username': name, 'content': name})
+
+        self.assertEqual([e['id'] for e in self.store.get_user_entries_by_ids('alice', [3, 2, 1])], [3, 1])
+
+    def test_user_queries_use_indexes(self):
+        """Test that per-user and per-tag queries are index lookups, not scans"""
+        conn = self.store._connection()
+        user_plan = ' '.join(row[-1] for row in conn.execute(
+            'EXPLAIN QUERY PLAN SELECT id, data FROM entries WHERE username IS ? ORDER BY timestamp, id', ('a',)))
+        tag_plan = ' '.join(row[-1] for row in conn.execute(
+            'EXPLAIN QUERY PLAN SELECT entry_id FROM entry_tags WHERE username IS ? AND tag = ?', ('a', 't')))
+
+        self.assertIn('idx_entries_username_timestamp', user_plan)
+        self.assertIn('idx_entry_tags_username_tag', tag_plan)
+
+    def test_delete_entry_removes_tags(self):
+        """Test that deleting an entry also drops its tag rows"""
+        entry = self.store.add_entry({'username': 'alice', 'content': 'a', 'tags': ['work']})
+
+        self.assertTrue(self.store.delete_entry(entry['id']))
+        self.assertFalse(self.store.delete_entry(entry['id']))
+        self.assertEqual(self.store.get_user_entries_by_tag('alice', 'work'), [])
+
+    def test_tags_filled_in_for_databases_without_the_join_table(self):
+        """Test that a database written without entry_tags gets its tag rows on open"""
+        self.store.add_entry({'username': 'alice', 'content': 'a', 'tags': ['work']})
+        self.store.add_entry({'username': 'alice', 'content': 'b'})
+        with self.store._connection() as conn:
+            conn.execute('DROP TABLE entry_tags')
+
+        store = SQLiteJournalStore(self.store.db_path)
+
+        self.assertEqual([e['content'] for e in store.get_user_entries_by_tag('alice', 'work')], ['a'])
+
+    def test_reserve_and_merge(self):
+        """Test that reserved IDs are skipped and merged entries keep theirs"""
+        self.store.reserve_ids(5)
+        self.assertEqual(self.store.add_entry({'username': 'bob', 'content': 'new'})['id'], 5)
+
+        self.assertEqual(self.store.merge_entries([{'id': 5, 'username': 'alice', 'content': 'restored'}]), 1)
+
+        self.assertEqual([(e['id'], e['content']) for e in self.store.get_all_entries()],
+                         [(5, 'restored'), (6, 'new')])
+        self.assertEqual(self.store.add_entry({'username': 'bob'})['id'], 7)
+
+    def test_replace_all(self):
+        """Test replacing the journal keeps the given IDs"""
+        self.store.add_entry({'username': 'alice', 'content': 'gone'})
+        self.store.replace_all([{'id': 7, 'username': 'bob', 'content': 'restored'}])
+
+        self.assertEqual([(e['id'], e['content']) for e in self.store.get_all_entries()], [(7, 'restored')])
+        self.assertEqual(self.store.add_entry({'username': 'bob', 'content': 'next'})['id'], 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+import os
+import shutil
+import tempfile
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+try:
+    from moto import mock_dynamodb
+    moto_available = True
+except ImportError:
+    moto_available = False
+
+from aws_integration import DynamoDBJournalStore
+from journal_store import PartitionedJournalStore
+from journal_transfer import export_journal, import_journal
+
+
+def make_entries(count):
+    return [{'id': i, 'username': f'user{i % 3}', 'timestamp': f'2024-01-01 09:00:{i % 60:02d}',
+             'content': f'entry {i}'} for i in range(1, count + 1)]
+
+
+class Interrupted(Exception):
+    pass
+
+
+class FailingStore:
+    """Wraps a store and fails partway through a transfer"""
+
+    def __init__(self, store, fail_after):
+        self.store = store
+        self.fail_after = fail_after
+
+    def scan_pages(self, *args, **kwargs):
+        for i, page in enumerate(self.store.scan_pages(*args, **kwargs)):
+            if i == self.fail_after:
+                raise Interrupted()
+            yield page
+
+    def put_entries(self, entries):
+        if self.fail_after == 0:
+            raise Interrupted()
+        self.fail_after -= 1
+        return self.store.put_entries(entries)
+
+
+@unittest.skipUnless(moto_available, "moto is not installed")
+class TestJournalTransfer(unittest.TestCase):
+    """Test JSONL export and import between the local journal and moto's DynamoDB"""
+
+    def setUp(self):
+        """Start a mocked DynamoDB and a local journal"""
+        for key in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN'):
+            os.environ[key] = 'testing'
+        self.mock = mock_dynamodb()
+        self.mock.start()
+        self.dynamodb = DynamoDBJournalStore(table_name='test-journal', region='us-east-1')
+        self.temp_dir = tempfile.mkdtemp()
+        self.local = PartitionedJournalStore(os.path.join(self.temp_dir, 'journal_entries.json'))
+        self.path = os.path.join(self.temp_dir, 'export.jsonl')
+        self.checkpoint = self.path + '.checkpoint'
+
+    def tearDown(self):
+        """Stop the mock and remove the files"""
+        self.mock.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def ids(self, entries):
+        return sorted(int(e['id']) for e in entries)
+
+    def test_local_journal_round_trips_through_dynamodb(self):
+        """Test moving a journal to DynamoDB and back, keeping IDs and the ID counter"""
+        entries = make_entries(60)
+        self.local.replace_all(entries)
+
+        self.assertEqual(export_journal(self.local, self.path)['entries'], 60)
+        self.assertEqual(import_journal(self.path, self.dynamodb, self.checkpoint, batch_size=25)['entries'], 60)
+        self.assertEqual(self.dynamodb.add_entry({'username': 'user0'})['id'], 61)
+
+        exported = os.path.join(self.temp_dir, 'back.jsonl')
+        # moto ignores Segment and returns the whole table to every segment, so scans here use one
+        self.assertEqual(export_journal(self.dynamodb, exported, segments=1, page_size=7)['entries'], 61)
+        restored = PartitionedJournalStore(os.path.join(self.temp_dir, 'restored.json'))
+        import_journal(exported, restored)
+        self.assertEqual(self.ids(restored.get_all_entries()), list(range(1, 62)))
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_import_keeps_local_entries_with_clashing_ids(self):
+        """Test that importing over existing local IDs moves the stored entries instead of dropping them"""
+        self.local.replace_all([{'id': 1, 'username': 'alice', 'timestamp': '2024-01-01 09:00:00',
+                                 'content': 'mine'}])
+        with open(self.path, 'w') as f:
+            f.write('{"id": 1, "username": "bob", "timestamp": "2024-01-02 09:00:00", "content": "theirs"}\n')
+        import_journal(self.path, self.local)
+
+        entries = self.local.get_all_entries()
+        self.assertEqual([(e['id'], e['username']) for e in entries], [(1, 'bob'), (2, 'alice')])
+        self.assertEqual(self.local.add_entry({'username': 'alice', 'content': 'next'})['id'], 3)
+
+    def test_interrupted_export_resumes_from_checkpoint(self):
+        """Test that a resumed export writes every entry exactly once"""
+        self.dynamodb.put_entries(make_entries(50))
+
+        with self.assertRaises(Interrupted):
+            export_journal(FailingStore(self.dynamodb, fail_after=3), self.path, self.checkpoint,
+                           segments=1, page_size=5, checkpoint_every=0)
+        self.assertTrue(os.path.exists(self.checkpoint))
+
+        export_journal(self.dynamodb, self.path, self.checkpoint, page_size=5)
+
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 50)
+        self.assertEqual(len(set(lines)), 50)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_interrupted_import_resumes_from_checkpoint(self):
+        """Test that a resumed import skips the batches already written"""
+        self.local.replace_all(make_entries(30))
+        export_journal(self.local, self.path)
+
+        with self.assertRaises(Interrupted):
+            import_journal(self.path, FailingStore(self.dynamodb, fail_after=2), self.checkpoint, batch_size=10)
+        summary = import_journal(self.path, self.dynamodb, self.checkpoint, batch_size=10)
+
+        self.assertEqual(summary['entries'], 10)
+        self.assertEqual(self.ids(self.dynamodb.get_all_entries()), list(range(1, 31)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+import os
+import shutil
+import tempfile
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from journal_versions import JournalVersions
+
+
+class TestJournalVersions(unittest.TestCase):
+    """Test per-user journal versions"""
+
+    def setUp(self):
+        """Create versions in a temporary database"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.versions = JournalVersions(os.path.join(self.temp_dir, 'search_index.db'))
+
+    def tearDown(self):
+        """Clean up"""
+        shutil.rmtree(self.temp_dir)
+
+    def test_bump_changes_only_that_user(self):
+        """Test that a user's write leaves other users' versions alone"""
+        self.assertEqual(self.versions.get('alice'), ('0.0', None))
+
+        self.versions.bump('alice')
+
+        version, modified = self.versions.get('alice')
+        self.assertEqual(version, '0.1')
+        self.assertIsNotNone(modified.tzinfo)
+        self.assertEqual(self.versions.get('bob')[0], '0.0')
+
+    def test_bump_all_changes_every_user(self):
+        """Test that replacing the whole journal gives every user a new version"""
+        self.versions.bump('alice')
+
+        self.versions.bump()
+
+        self.assertEqual(self.versions.get('alice')[0], '1.1')
+        self.assertEqual(self.versions.get('bob')[0], '1.0')
+        self.assertIsNotNone(self.versions.get('bob')[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
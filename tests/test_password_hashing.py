@@ -0,0 +1,49 @@
+import unittest
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from password_hashing import HashingBusy, PasswordHasher
+
+
+class TestPasswordHasher(unittest.TestCase):
+    """Test pooled password hashing with load shedding"""
+
+    def test_hash_and_verify_on_pool(self):
+        """Test hashing and verification in worker processes"""
+        hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=1)
+        try:
+            pwhash = hasher.hash('secret123')
+            self.assertTrue(pwhash.startswith('pbkdf2:sha256:1000$'))
+            self.assertTrue(hasher.verify(pwhash, 'secret123'))
+            self.assertFalse(hasher.verify(pwhash, 'wrong'))
+        finally:
+            hasher.shutdown()
+
+    def test_recovers_when_a_pool_process_dies(self):
+        """Test that a broken pool sheds the call in flight and is replaced for the next one"""
+        hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=1)
+        try:
+            with self.assertRaises(HashingBusy):
+                hasher._run(os._exit, 1)
+            self.assertTrue(hasher.verify(hasher.hash('secret123'), 'secret123'))
+        finally:
+            hasher.shutdown()
+
+    def test_sheds_load_when_saturated(self):
+        """Test that calls beyond the queue depth fail fast"""
+        hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=0, max_pending=0)
+        with self.assertRaises(HashingBusy):
+            hasher.hash('secret123')
+
+    def test_needs_rehash(self):
+        """Test that hashes made with other parameters are flagged for upgrade"""
+        old = PasswordHasher(method='pbkdf2:sha256:1000', workers=0).hash('secret123')
+        hasher = PasswordHasher(method='pbkdf2', workers=0)
+
+        self.assertTrue(hasher.needs_rehash(old))
+        self.assertFalse(hasher.needs_rehash(hasher.hash('secret123')))
+
+
+if __name__ == '__main__':
+    unittest.main()
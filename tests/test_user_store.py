@@ -0,0 +1,67 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import threading
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from user_store import SQLiteUserStore
+
+
+class TestSQLiteUserStore(unittest.TestCase):
+    """Test the keyed SQLite user store"""
+
+    def setUp(self):
+        """Create a store in a temporary directory"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'users.db')
+        self.legacy_path = os.path.join(self.temp_dir, 'users.json')
+
+    def tearDown(self):
+        """Clean up"""
+        shutil.rmtree(self.temp_dir)
+
+    def test_add_and_get(self):
+        """Test single-user registration and case-insensitive lookup"""
+        store = SQLiteUserStore(self.db_path)
+
+        self.assertTrue(store.add('alice', {'password_hash': 'h1', 'display_name': 'Alice'}))
+        self.assertFalse(store.add('Alice', {'password_hash': 'h2'}))
+
+        self.assertEqual(store.get('ALICE')['password_hash'], 'h1')
+        self.assertIsNone(store.get('bob'))
+
+    def test_migrates_legacy_users_once(self):
+        """Test that users.json is copied in on first open only"""
+        with open(self.legacy_path, 'w') as f:
+            json.dump({'Alice': {'password_hash': 'h1', 'display_name': 'Alice', 'created_at': '2024-01-01'}}, f)
+
+        store = SQLiteUserStore(self.db_path, legacy_path=self.legacy_path)
+        self.assertEqual(store.get('alice')['created_at'], '2024-01-01')
+
+        with open(self.legacy_path, 'w') as f:
+            json.dump({'carol': {'password_hash': 'h3'}}, f)
+        store = SQLiteUserStore(self.db_path, legacy_path=self.legacy_path)
+        self.assertIsNone(store.get('carol'))
+
+    def test_concurrent_registration_of_same_name(self):
+        """Test that only one of several racing registrations succeeds"""
+        SQLiteUserStore(self.db_path)
+        results = []
+
+        def register(i):
+            results.append(SQLiteUserStore(self.db_path).add('alice', {'password_hash': f'h{i}'}))
+
+        threads = [threading.Thread(target=register, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(True), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
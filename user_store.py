@@ -0,0 +1,90 @@
+import json
+import os
+import sqlite3
+import logging
+
+from journal_store import SQLiteConnections
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteUserStore:
+    """Registered journal users in a SQLite table keyed by lowercase username
+
+    Lookups and registrations touch a single row, so login and page views
+    cost the same however many users exist, and the primary key makes two
+    workers registering the same name at once fail cleanly instead of one
+    silently overwriting the other. Users from a legacy users.json file are
+    copied in once, the first time the store is opened.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password_hash TEXT NOT NULL,
+            display_name TEXT,
+            created_at TEXT
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS user_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, db_path, legacy_path=None):
+        self.db_path = db_path
+        self._connections = SQLiteConnections(db_path)
+        with self._connections.get() as conn:
+            conn.executescript(self.SCHEMA)
+        if legacy_path:
+            self._migrate(legacy_path)
+
+    def _migrate(self, legacy_path):
+        """Copy users from a legacy users.json file, once"""
+        if not os.path.exists(legacy_path):
+            return
+        conn = self._connections.get()
+        with conn:
+            # Take the write lock first so only one worker runs the migration
+            conn.execute('BEGIN IMMEDIATE')
+            if conn.execute("SELECT 1 FROM user_meta WHERE key = 'migrated'").fetchone():
+                return
+            try:
+                with open(legacy_path, 'r') as f:
+                    users = json.load(f)
+            except (json.JSONDecodeError, OSError) as e:
+                logger.error(f"Could not migrate users from {legacy_path}: {e}")
+                users = {}
+            conn.executemany(
+                'INSERT OR IGNORE INTO users (username, password_hash, display_name, created_at) VALUES (?, ?, ?, ?)',
+                [(username.lower(), user['password_hash'], user.get('display_name'), user.get('created_at'))
+                 for username, user in users.items()])
+            conn.execute("INSERT INTO user_meta (key, value) VALUES ('migrated', 1)")
+        logger.info(f"Migrated {len(users)} users from {legacy_path} to {self.db_path}")
+
+    @staticmethod
+    def _record(row):
+        return {"password_hash": row[0], "display_name": row[1], "created_at": row[2]}
+
+    def get(self, username):
+        """Look up one user by name, or None if they are not registered"""
+        row = self._connections.get().execute(
+            'SELECT password_hash, display_name, created_at FROM users WHERE username = ?',
+            (username.lower(),)).fetchone()
+        return self._record(row) if row else None
+
+    def add(self, username, user):
+        """Register a user, returning False if the name is already taken"""
+        try:
+            with self._connections.get() as conn:
+                conn.execute(
+                    'INSERT INTO users (username, password_hash, display_name, created_at) VALUES (?, ?, ?, ?)',
+                    (username.lower(), user['password_hash'], user.get('display_name'), user.get('created_at')))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def set_password_hash(self, username, password_hash):
+        """Replace a user's stored password hash"""
+        with self._connections.get() as conn:
+            conn.execute('UPDATE users SET password_hash = ? WHERE username = ?', (password_hash, username.lower()))